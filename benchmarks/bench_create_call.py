@@ -0,0 +1,59 @@
+"""Calls per second of compose_call versus the cached call templates used by create_call.
+
+    uv run python -m benchmarks.bench_create_call --rpc wss://hydration.ibp.network:443 -n 2000
+"""
+import time
+
+import click
+
+from chopchop.client import initialize_network_client, create_call
+
+OWNER = "7L53bUTBbfuj14UpdCNPwmgzzHSsrsTWBHX5pys32mVWM3C1"
+
+
+def build_with_compose_call(client, n):
+    api = client.api
+    calls = []
+    for position_id in range(n):
+        call = api.compose_call("Omnipool", "remove_liquidity", {"position_id": position_id, "amount": 10 ** 18 + position_id})
+        call = api.compose_call("Utility", "dispatch_as", {"as_origin": {"system": {"Signed": OWNER}}, "call": call})
+        calls.append(call)
+    return api.compose_call("Utility", "force_batch", {"calls": calls})
+
+
+def build_with_templates(client, n):
+    calls = []
+    for position_id in range(n):
+        call = create_call(client, "Omnipool", "remove_liquidity", {"position_id": position_id, "amount": 10 ** 18 + position_id})
+        call = create_call(client, "Utility", "dispatch_as", {"as_origin": {"system": {"Signed": OWNER}}, "call": call})
+        calls.append(call)
+    return create_call(client, "Utility", "force_batch", {"calls": calls})
+
+
+@click.command()
+@click.option('--rpc', 'custom_rpc', help='RPC URL to load metadata from (default: Hydra Mainnet)')
+@click.option('-n', 'count', default=1000, show_default=True, help='Number of dispatch_as(remove_liquidity) calls')
+def main(custom_rpc, count):
+    client = initialize_network_client(custom_rpc=custom_rpc)
+    client.api.init_runtime()
+    # Warm up both paths so metadata loading is not measured
+    build_with_compose_call(client, 1)
+    build_with_templates(client, 1)
+
+    results = {}
+    for name, build in [("compose_call", build_with_compose_call), ("call templates", build_with_templates)]:
+        start = time.perf_counter()
+        batch = build(client, count)
+        elapsed = time.perf_counter() - start
+        # Every position contributes two calls, plus the final force_batch
+        click.echo(f"{name:>15}: {(2 * count + 1) / elapsed:10.1f} calls/s ({elapsed:.3f}s)")
+        results[name] = bytes(batch.data.data)
+
+    if results["compose_call"] != results["call templates"]:
+        raise click.ClickException("Encoded batches differ")
+    click.echo("Encoded batches are identical")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
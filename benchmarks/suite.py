@@ -0,0 +1,126 @@
+"""Offline benchmarks of the remove-positions read and call building paths, served from a recorded run.
+
+Record a real run once, then benchmark against the recording with any latency, concurrency and
+number of positions, and compare the saved results across changes:
+
+    uv run python -m chopchop remove-positions 5 --record run.json.gz
+    uv run python -m benchmarks.suite run.json.gz 5 --positions 20000 --latency 0.02 -o before.json
+    uv run python -m benchmarks.suite run.json.gz 5 --positions 20000 --latency 0.02 --compare before.json
+"""
+import json
+import time
+
+import click
+
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.omnipool_lm import OmnipoolWLM
+from chopchop.pallets.uniques import Uniques
+from chopchop.pallets.utility import Utility
+from chopchop.pipeline import RemovePositionsPipeline
+from chopchop.planner import BatchPlanner
+from chopchop.replay import Recording, encode_entries, initialize_replay_client, scale_entries
+from chopchop.snapshot import POSITIONS, capture_entries
+
+
+def timed(repeat, fn):
+    """Run `fn` `repeat` times, returning the best and mean durations and the last result."""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return min(durations), sum(durations) / len(durations), result
+
+
+def run_suite(client, asset_ids, check_farms, repeat):
+    omnipool = Omnipool(client)
+    uniques = Uniques(client)
+    omnipool_wlm = OmnipoolWLM(client)
+    utility = Utility(client)
+    results = {}
+
+    def record(name, fn, count = len):
+        best, mean, result = timed(repeat, fn)
+        results[name] = {"best": best, "mean": mean, "items": count(result)}
+        return result
+
+    positions = record("retrieve_positions", omnipool.retrieve_positions)
+    selected = {position_id: position for position_id, position in positions.items() if position.asset_id in asset_ids}
+
+    owners = record("owner resolution", lambda: uniques.query_owners(Omnipool.NFT_COLLECTION_ID, list(selected)))
+
+    record("get_deposit_positions",
+           lambda: [omnipool_wlm.get_deposit_positions(asset_id) for asset_id in asset_ids],
+           count=lambda result: sum(len(deposits) for deposits in result))
+
+    calls = record("call composition", lambda: [
+        utility.create_dispatch_as_call(owners[position_id], omnipool.remove_liquidity_call(position_id, position.shares))
+        for position_id, position in selected.items() if position_id in owners
+    ])
+
+    record("final batch encoding", lambda: utility.create_force_batch(calls), count=lambda batch: batch.data.length)
+
+    def remove_positions():
+        pipeline = RemovePositionsPipeline(client, asset_ids, BatchPlanner(client))
+        return utility.create_force_batch(list(pipeline.schedule_calls(check_farms)))
+
+    record("remove_positions", remove_positions, count=lambda batch: batch.data.length)
+
+    def remove_positions_grouped():
+        pipeline = RemovePositionsPipeline(client, asset_ids, BatchPlanner(client), group_size=50)
+        return utility.create_force_batch(list(pipeline.schedule_calls(check_farms)))
+
+    record("grouped remove_positions", remove_positions_grouped, count=lambda batch: batch.data.length)
+    return results
+
+
+@click.command()
+@click.argument('recording_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('asset_ids', nargs=-1, type=click.IntRange(min=1))
+@click.option('--check-farms', default=True, help='Include farm exits in the remove_positions benchmark')
+@click.option('--positions', type=click.IntRange(min=1), help='Grow the recorded state to this many positions by cloning the recorded ones')
+@click.option('--latency', default=0.0, show_default=True, help='Simulated round trip time per RPC request, in seconds')
+@click.option('--concurrency', default=4, show_default=True, type=click.IntRange(min=1), help='Number of replay connections used for bulk reads')
+@click.option('--repeat', default=3, show_default=True, type=click.IntRange(min=1), help='Runs per benchmark; the best is reported')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), help='Save the results as JSON')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='Results file of an earlier run to compare with')
+def main(recording_path, asset_ids, check_farms, positions, latency, concurrency, repeat, output, compare):
+    recording = Recording.load(recording_path)
+    storage = recording.raw_storage()
+    client = initialize_replay_client(recording, storage, latency=latency, concurrency=concurrency)
+
+    with client.snapshot(recording.block_hash) as block_hash:
+        client.api.init_runtime(block_hash=block_hash)
+        entries = capture_entries(client, block_hash)
+        if positions is not None:
+            storage.update(encode_entries(client.api, scale_entries(entries, positions)))
+            entries = capture_entries(client, block_hash)
+        if not asset_ids:
+            asset_ids = sorted({position["asset_id"] for position in entries[POSITIONS].values()})
+        click.echo(f"{len(entries[POSITIONS])} positions, assets {list(asset_ids)}, "
+                   f"latency {latency * 1000:.0f} ms, concurrency {concurrency}")
+
+        results = run_suite(client, set(asset_ids), check_farms, repeat)
+    client.close()
+
+    previous = None
+    if compare:
+        with open(compare) as f:
+            previous = json.load(f)["results"]
+    for name, result in results.items():
+        line = f"{name:>22}: {result['best'] * 1000:10.1f} ms best {result['mean'] * 1000:10.1f} ms mean {result['items']:>10} items"
+        if previous is not None and name in previous:
+            line += f"  {(result['best'] / previous[name]['best'] - 1) * 100:+7.1f}%"
+        click.echo(line)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({
+                "recording": recording_path, "positions": len(entries[POSITIONS]), "asset_ids": list(asset_ids),
+                "latency": latency, "concurrency": concurrency, "repeat": repeat, "results": results,
+            }, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
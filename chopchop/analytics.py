@@ -0,0 +1,188 @@
+from array import array
+
+# FixedU128 and Permill, the fixed-point types of the runtime's Omnipool math
+ONE = 10 ** 18
+PERMILL = 1_000_000
+
+
+def fixed_from_rational(numerator: int, denominator: int) -> int:
+    """FixedU128::checked_from_rational, rounding down, as the inner integer."""
+    return numerator * ONE // denominator
+
+
+def fixed_mul_int(fixed: int, value: int) -> int:
+    """FixedU128::checked_mul_int, rounding down."""
+    return fixed * value // ONE
+
+
+def fee_complement(fee: int) -> int:
+    """1 - fee, for a Permill fee, as FixedU128."""
+    return ONE - fee * (ONE // PERMILL)
+
+
+def position_price(price) -> int:
+    """FixedU128 entry price of a position, stored as a (hub reserve, reserve) ratio or, by older runtimes, as a FixedU128."""
+    if isinstance(price, (list, tuple)):
+        return fixed_from_rational(price[0], price[1])
+    return int(price)
+
+
+def removal_terms(reserve, hub_reserve, shares, withdrawal_fee = 0) -> tuple:
+    """Terms of remove_liquidity that only depend on the asset's state, shared by all of its positions."""
+    return reserve, hub_reserve, shares, fixed_from_rational(hub_reserve, reserve), fee_complement(withdrawal_fee)
+
+
+def removal(terms, shares_removed, price) -> tuple:
+    """The runtime's remove_liquidity split of `shares_removed` shares of a position entered at `price`.
+
+    Part of the shares of a position that lost value goes to the protocol, and a position that
+    gained value is also paid out LRNA. Returns (amount paid out, shares burned, hub reserve
+    removed, LRNA paid out, shares moved to the protocol, withdrawal fee).
+    """
+    reserve, hub_reserve, asset_shares, current_price, complement = terms
+    price = position_price(price)
+    delta_b = 0
+    if current_price < price:
+        delta_b = fixed_mul_int(fixed_from_rational(price - current_price, current_price + price), shares_removed)
+    delta_shares = shares_removed - delta_b
+    delta_reserve = reserve * delta_shares // asset_shares
+    delta_hub_reserve = delta_reserve * hub_reserve // reserve
+
+    hub_transferred = 0
+    if current_price > price:
+        hub_transferred = fixed_mul_int(fixed_from_rational(current_price - price, current_price + price), delta_hub_reserve)
+
+    amount = fixed_mul_int(complement, delta_reserve)
+    hub_amount = fixed_mul_int(complement, hub_transferred)
+    return amount, delta_shares, delta_hub_reserve, hub_amount, delta_b, delta_reserve - amount
+
+
+class OmnipoolState:
+    """Column layout of every Omnipool asset state, for whole-pool analytics.
+
+    Each field is one column indexed by asset position, instead of one AssetState object per
+    asset. Balances are u128 on chain and are kept as exact Python integers, which fixed-width
+    NumPy dtypes cannot hold; ids and tradability flags are packed into typed arrays. The helpers
+    work a column at a time.
+
+    Prices are in LRNA per smallest unit of an asset, without adjusting for decimals.
+    """
+
+    def __init__(self, asset_ids, reserve, hub_reserve, shares, protocol_shares, cap, tradability):
+        self.asset_ids = array("I", asset_ids)
+        self.reserve = [int(value) for value in reserve]
+        self.hub_reserve = [int(value) for value in hub_reserve]
+        self.shares = [int(value) for value in shares]
+        self.protocol_shares = [int(value) for value in protocol_shares]
+        self.cap = [int(value) for value in cap]
+        self.tradability = array("B", tradability)
+        self._index = {asset_id: i for i, asset_id in enumerate(self.asset_ids)}
+
+    @staticmethod
+    def from_asset_states(states) -> "OmnipoolState":
+        return OmnipoolState([state.asset_id for state in states],
+                             [state.reserve for state in states],
+                             [state.hub_reserve for state in states],
+                             [state.shares for state in states],
+                             [state.protocol_shares for state in states],
+                             [state.cap for state in states],
+                             [_tradability_bits(state.tradability) for state in states])
+
+    def __len__(self):
+        return len(self.asset_ids)
+
+    def index(self, asset_id) -> int:
+        return self._index[asset_id]
+
+    def spot_prices(self) -> list:
+        """LRNA price of every asset."""
+        return [hub / reserve if reserve else 0.0 for hub, reserve in zip(self.hub_reserve, self.reserve)]
+
+    def spot_price(self, asset_in, asset_out) -> float:
+        """Units of `asset_out` one unit of `asset_in` is worth at spot."""
+        i, o = self._index[asset_in], self._index[asset_out]
+        return (self.hub_reserve[i] * self.reserve[o]) / (self.reserve[i] * self.hub_reserve[o])
+
+    def total_hub_reserve(self) -> int:
+        return sum(self.hub_reserve)
+
+    def hub_shares(self) -> list:
+        """Share of the pool's LRNA held by every asset."""
+        total = self.total_hub_reserve()
+        return [hub / total if total else 0.0 for hub in self.hub_reserve]
+
+    def tvl(self, denomination=None) -> int:
+        """Total value locked, in LRNA or in units of the `denomination` asset, rounded down.
+
+        Every asset is priced against LRNA, so its reserve is worth exactly its hub reserve.
+        """
+        total = self.total_hub_reserve()
+        if denomination is None:
+            return total
+        i = self._index[denomination]
+        return total * self.reserve[i] // self.hub_reserve[i]
+
+    def position_values(self, positions) -> list:
+        """LRNA value of removing each (asset_id, shares, entry price) position in full at the current price.
+
+        This is the runtime's remove_liquidity split (see `removal`) without the withdrawal
+        fee: the hub reserve removed plus any LRNA paid out.
+        """
+        terms = {}
+        values = []
+        for asset_id, shares, price in positions:
+            asset_terms = terms.get(asset_id)
+            if asset_terms is None:
+                i = self._index[asset_id]
+                asset_terms = terms[asset_id] = removal_terms(self.reserve[i], self.hub_reserve[i], self.shares[i])
+            _, _, delta_hub_reserve, hub_amount, _, _ = removal(asset_terms, shares, price)
+            values.append(delta_hub_reserve + hub_amount)
+        return values
+
+
+class PositionTable:
+    """Position ids, asset ids and shares of many Omnipool positions in packed columns.
+
+    Ids and shares are u128 on chain, so they are kept as 16-byte little-endian slots and never
+    truncated; a position takes 36 bytes (16 for its id, 4 for its asset id and 16 for its shares)
+    instead of a Position object and its dict entry.
+    """
+
+    __slots__ = ("position_ids", "asset_ids", "shares")
+
+    def __init__(self):
+        self.position_ids = bytearray()
+        self.asset_ids = array("I")
+        self.shares = bytearray()
+
+    def append(self, position_id: int, asset_id: int, shares: int):
+        self.append_raw(position_id.to_bytes(16, "little"), asset_id, shares.to_bytes(16, "little"))
+
+    def append_raw(self, position_id: bytes, asset_id: int, shares: bytes):
+        self.position_ids += position_id
+        self.asset_ids.append(asset_id)
+        self.shares += shares
+
+    def __len__(self):
+        return len(self.asset_ids)
+
+    def position_id(self, i) -> int:
+        return int.from_bytes(self.position_ids[16 * i:16 * i + 16], "little")
+
+    def shares_of(self, i) -> int:
+        return int.from_bytes(self.shares[16 * i:16 * i + 16], "little")
+
+    def __iter__(self):
+        """(position_id, asset_id, shares) of every position."""
+        for i, asset_id in enumerate(self.asset_ids):
+            yield self.position_id(i), asset_id, self.shares_of(i)
+
+    def total_shares(self, asset_id) -> int:
+        return sum(self.shares_of(i) for i, asset in enumerate(self.asset_ids) if asset == asset_id)
+
+
+def _tradability_bits(tradability) -> int:
+    # Tradability is a bitflags struct, decoded either as its raw bits or as {"bits": ...}
+    if isinstance(tradability, dict):
+        return int(tradability.get("bits", 0))
+    return int(tradability)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+from scalecodec.base import ScaleBytes
+from substrateinterface import SubstrateInterface
+
+DEFAULT_CACHE_DIR = Path(os.getenv("CHOPCHOP_CACHE_DIR", "~/.cache/chopchop")).expanduser()
+
+
+class MetadataCache:
+    """Persistent runtime metadata cache, plugged into SubstrateInterface as its `cache_region`.
+
+    SubstrateInterface already checks the node's runtime version on start-up and asks its cache
+    region for `METADATA_<spec_version>` before downloading metadata. This region answers from
+    disk, one file per chain, spec version and type registry, and evicts the entries of older
+    spec versions whenever a new one is stored.
+
+    Decoded metadata holds dynamically created type classes and cannot be pickled, so the raw
+    SCALE bytes are stored and decoded locally, which skips the download from the node.
+    """
+
+    def __init__(self, api: SubstrateInterface, chain: str, type_registry: dict | None = None,
+                 cache_dir: Path = DEFAULT_CACHE_DIR):
+        self._api = api
+        self.directory = Path(cache_dir) / (re.sub(r"[^a-z0-9]+", "-", chain.lower()).strip("-") or "unknown")
+        # Legacy type registries change how metadata is decoded, so they get separate entries
+        self._suffix = ""
+        if type_registry:
+            encoded = json.dumps(type_registry, sort_keys=True).encode()
+            self._suffix = "-" + hashlib.sha256(encoded).hexdigest()[:12]
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key.lower()}{self._suffix}.scale"
+
+    def get(self, key: str):
+        path = self._path(key)
+        if not key.startswith("METADATA_") or not path.exists():
+            return None
+        try:
+            metadata = self._api.runtime_config.create_scale_object(
+                "MetadataVersioned", data=ScaleBytes(bytearray(path.read_bytes()))
+            )
+            metadata.decode()
+        except Exception:
+            # A truncated or otherwise unreadable entry is just a cache miss
+            path.unlink(missing_ok=True)
+            return None
+        return metadata
+
+    def set(self, key: str, value):
+        if not key.startswith("METADATA_"):
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        # Per-process temporary file, as several clients of one chain may write the same entry
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_bytes(bytes(value.data.data))
+        os.replace(tmp_path, path)
+
+        for stale in self.directory.glob(f"metadata_*{self._suffix}.scale"):
+            if stale != path and stale.name.removesuffix(f"{self._suffix}.scale").removeprefix("metadata_").isdigit():
+                stale.unlink(missing_ok=True)
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+from scalecodec.base import ScaleBytes
+
+from chopchop.cache import DEFAULT_CACHE_DIR
+
+
+class EncodedCall:
+    """A call restored from its encoded bytes, enough to stream it into a batch."""
+
+    def __init__(self, data: str):
+        self.data = ScaleBytes(data)
+
+
+class Checkpoint:
+    """Stage results of one remove-positions run, appended to a local JSON lines file as they complete.
+
+    A run is identified by its network, pinned block and asset set, so everything in a checkpoint
+    is valid for any rerun of it. Every record is one line written and flushed at once: a run
+    killed halfway loses at most the record it was writing, which is ignored on load.
+    """
+
+    def __init__(self, path: Path, block_hash: str):
+        self.path = Path(path)
+        self.block_hash = block_hash
+        self._records = {}
+        self._done = set()
+        self._lock = threading.Lock()
+        self._file = None
+
+    @staticmethod
+    def directory(genesis_hash: str, asset_ids, check_farms: bool, cache_dir: Path = DEFAULT_CACHE_DIR) -> Path:
+        assets = "-".join(str(asset_id) for asset_id in sorted(asset_ids))
+        return Path(cache_dir) / "checkpoints" / genesis_hash[2:18] / (assets if check_farms else f"{assets}-nofarms")
+
+    @staticmethod
+    def latest(directory: Path) -> str | None:
+        """Pinned block of the most recent checkpoint in `directory`, if any."""
+        paths = sorted(Path(directory).glob("0x*.jsonl"), key=lambda path: path.stat().st_mtime)
+        return paths[-1].stem if paths else None
+
+    @staticmethod
+    def open(directory: Path, block_hash: str, resume: bool = False) -> "Checkpoint":
+        """The checkpoint of a run pinned to `block_hash`, loaded when resuming and started afresh otherwise."""
+        checkpoint = Checkpoint(Path(directory) / f"{block_hash}.jsonl", block_hash)
+        if resume and checkpoint.path.exists():
+            checkpoint._load()
+        checkpoint.path.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint._file = open(checkpoint.path, "a" if resume else "w", encoding="utf-8")
+        return checkpoint
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    stage, key, value = json.loads(line)
+                except ValueError:
+                    # Cut short when the run was killed
+                    continue
+                if key is None:
+                    self._done.add(stage)
+                else:
+                    self._records[(stage, key)] = value
+
+    def _append(self, stage, key, value):
+        with self._lock:
+            self._file.write(json.dumps([stage, key, value], separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, stage: str, key: str):
+        return self._records.get((stage, key))
+
+    def put(self, stage: str, key: str, value):
+        self._records[(stage, key)] = value
+        self._append(stage, key, value)
+
+    def done(self, stage: str) -> bool:
+        return stage in self._done
+
+    def finish(self, stage: str):
+        self._done.add(stage)
+        self._append(stage, None, None)
+
+    def pages(self, stage: str, pages, encode, decode):
+        """Pages of a stage, replayed from the checkpoint once they were all read in an earlier run."""
+        if self.done(stage):
+            index = 0
+            while (stage, str(index)) in self._records:
+                yield decode(self._records[(stage, str(index))])
+                index += 1
+            return
+        for index, page in enumerate(pages):
+            self.put(stage, str(index), encode(page))
+            yield page
+        self.finish(stage)
+
+    def cached(self, stage: str, prepare, lookup, key, encode, decode):
+        """`prepare` and `lookup` of a page (see `with_lookups`), answered from the checkpoint for pages looked up in an earlier run."""
+        def checkpointed_prepare(page):
+            return [] if self.get(stage, key(page)) is not None else prepare(page)
+
+        def checkpointed(page, reads):
+            page_key = key(page)
+            value = self.get(stage, page_key)
+            if value is not None:
+                return decode(value)
+            result = lookup(page, reads)
+            self.put(stage, page_key, encode(result))
+            return result
+        return checkpointed_prepare, checkpointed
+
+    def close(self, remove: bool = False):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if remove:
+            os.remove(self.path)
@@ -1,11 +1,26 @@
+import json
+import os
+import time
+
 import click
 
-from chopchop.client import initialize_network_client
+from chopchop.cache import DEFAULT_CACHE_DIR
+from chopchop.checkpoint import Checkpoint, EncodedCall
+from chopchop.client import create_call, initialize_network_client, root_origin
+from chopchop.dryrun import DryRunner
+from chopchop.fanout import diff_plans, fan_out
+from chopchop.history import ChangeLog, RangeScanner
+from chopchop.index import PositionIndex
+from chopchop.output import CallWriter, preimage_limit, rebase_preimages, schedule_delay, split_for_preimages, write_batch, write_note_preimage
 from chopchop.pallets.omnipool import Omnipool
-from chopchop.pallets.omnipool_lm import OmnipoolWLM, OmnipoolLM
-from chopchop.pallets.scheduler import Scheduler
-from chopchop.pallets.uniques import Uniques
 from chopchop.pallets.utility import Utility
+from chopchop.pipeline import RemovePositionsPipeline
+from chopchop.planner import BatchPlanner
+from chopchop.profile import Profiler, stage
+from chopchop.replay import Recorder
+from chopchop.seed import SeedCompiler, SeedSpec
+from chopchop.snapshot import DEPOSITS, NFTS, POSITIONS, StateSnapshot, initialize_snapshot_client
+from chopchop.submit import Submitter
 from substrateinterface.exceptions import SubstrateRequestException
 
 
@@ -18,25 +33,55 @@ def cli():
 KILT_ID = 27
 CFG_ID = 21
 
-@cli.command()
-@click.argument('asset_ids', nargs=-1, required=True, type=click.IntRange(min=1))
-@click.option('--check-farms', default=True, help='Flag to indicate if farms are present')
-@click.option('--lark1', 'network', flag_value='lark1', help='Connect to Lark1 network')
-@click.option('--lark2', 'network', flag_value='lark2', help='Connect to Lark2 network')
-@click.option('--mainnet', 'network', flag_value='mainnet', help='Connect to Hydra Mainnet (default)')
-@click.option('--nice', 'network', flag_value='nice', help='Connect to Nice network')
-@click.option('--local', 'network', flag_value='local', help='Connect to local network')
-@click.option('--chopsticks', 'network', flag_value='chopsticks', help='Connect to Chopsticks network')
-@click.option('--rpc', 'custom_rpc', help='Connect to custom RPC URL')
-def remove_positions(asset_ids, check_farms, network, custom_rpc):
-    """Remove positions command with mandatory asset IDs and optional has_farms flag."""
-    click.echo(f"🚀 Captain's log: Engaging warp drive to remove positions for asset IDs: {list(asset_ids)}")
-    click.echo(f"🔧 Engineering report: Dilithium crystals configured to check farms: {check_farms}")
-    click.echo("📡 Communications: Hailing frequencies open, preparing photon torpedo removal calls...")
-    
+
+class BlockParam(click.ParamType):
+    """A block number, or a 0x-prefixed 32-byte block hash."""
+    name = "block"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        value = str(value)
+        if value.startswith("0x"):
+            if len(value) == 66 and all(c in "0123456789abcdefABCDEF" for c in value[2:]):
+                return value
+            self.fail(f"{value!r} is not a 32-byte block hash", param, ctx)
+        if value.isdigit():
+            return int(value)
+        self.fail(f"{value!r} is neither a block number nor a 0x block hash", param, ctx)
+
+
+BLOCK = BlockParam()
+
+
+def network_options(f):
+    """Options selecting the network to connect to, passed as `network` and `custom_rpc`."""
+    options = [
+        click.option('--lark1', 'network', flag_value='lark1', help='Connect to Lark1 network'),
+        click.option('--lark2', 'network', flag_value='lark2', help='Connect to Lark2 network'),
+        click.option('--mainnet', 'network', flag_value='mainnet', help='Connect to Hydra Mainnet (default)'),
+        click.option('--nice', 'network', flag_value='nice', help='Connect to Nice network'),
+        click.option('--local', 'network', flag_value='local', help='Connect to local network'),
+        click.option('--chopsticks', 'network', flag_value='chopsticks', help='Connect to Chopsticks network'),
+        click.option('--rpc', 'custom_rpc', multiple=True, help='Connect to custom RPC URL; repeat to fail over between several endpoints'),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def connect(network, custom_rpc, **kwargs):
+    """Connect to the selected network, reporting failures and returning None instead of raising."""
     try:
-        client = initialize_network_client(network=network, custom_rpc=custom_rpc)
-        click.echo(f"✅ Helm: Successfully docked with starbase {client.api.chain}")
+        client = initialize_network_client(network=network, custom_rpc=custom_rpc, **kwargs)
+        if len(client.endpoints.endpoints) > 1:
+            for endpoint in client.endpoints.endpoints:
+                if endpoint.healthy:
+                    click.echo(f"📶 Comms: {endpoint.url} at #{endpoint.head}, {endpoint.latency * 1000:.0f} ms")
+                else:
+                    click.echo(f"📵 Comms: {endpoint.url} unavailable: {endpoint.error}")
+        click.echo(f"✅ Helm: Successfully docked with starbase {client.api.chain} via {client.api.url}")
+        return client
     except (SubstrateRequestException, RuntimeError, Exception) as e:
         click.echo("🚨 RED ALERT! 🚨")
         click.echo("💥 Engineering to Bridge: Warp core breach detected!")
@@ -46,93 +91,553 @@ def remove_positions(asset_ids, check_farms, network, custom_rpc):
         click.echo("🖖 Mr. Spock: Logic dictates we cannot proceed without a stable quantum entanglement channel.")
         click.echo("💫 Status: Mission aborted. The final frontier will have to wait another day.")
         click.echo(f"🔧 Technical details for Chief O'Brien: {str(e)}")
+        return None
+
+
+@cli.command()
+@click.argument('asset_ids', nargs=-1, required=True, type=click.IntRange(min=1))
+@click.option('--check-farms', default=True, help='Flag to indicate if farms are present')
+@network_options
+@click.option('--at-block', 'at_block', type=BLOCK, help='Block number or hash to read all state at (default: chain head when the run starts)')
+@click.option('--concurrency', default=1, show_default=True, type=click.IntRange(min=1), help='Number of RPC connections used for bulk reads')
+@click.option('--block-share', default=0.5, show_default=True, type=click.FloatRange(min=0, max=1, min_open=True), help='Share of the block weight and length limits each scheduled batch may use')
+@click.option('--metadata-cache/--no-metadata-cache', default=True, help='Reuse runtime metadata cached on disk (under $CHOPCHOP_CACHE_DIR, default ~/.cache/chopchop)')
+@click.option('--snapshot', 'snapshot_path', type=click.Path(exists=True, dir_okay=False), help='Plan offline from a state snapshot file instead of connecting to a node')
+@click.option('--profile', is_flag=True, help='Print RPC, storage, encode and decode timings per stage when done')
+@click.option('--profile-output', type=click.Path(dir_okay=False, writable=True), help='Write the recorded profile to a file (implies --profile)')
+@click.option('--profile-format', type=click.Choice(['json', 'chrome']), default='json', show_default=True, help='Format of --profile-output: raw JSON spans or a Chrome trace')
+@click.option('--dry-run/--no-dry-run', default=True, help='Dry-run every batch at the pinned block before printing, dropping calls that would fail (not available with --snapshot)')
+@click.option('--output', 'output_path', type=click.Path(dir_okay=False, writable=True), help='Write the encoded call to a file instead of the terminal')
+@click.option('--output-format', type=click.Choice(['hex', 'raw']), default='hex', show_default=True, help='Encoding of --output: 0x-prefixed hex or raw bytes')
+@click.option('--preimage-dir', type=click.Path(file_okay=False, writable=True), help='Write the plan as Preimage.note_preimage calls into a directory and print the governance calls referencing them')
+@click.option('--record', 'record_path', type=click.Path(dir_okay=False, writable=True), help='Record every RPC response of the run to a file for offline replay and benchmarks')
+@click.option('--resume', is_flag=True, help='Continue the last interrupted run for these assets from its checkpoint, at its pinned block')
+@click.option('--group-by-owner', 'group_size', type=click.IntRange(min=1), help='Send the calls of each owner as one dispatch_as of up to this many calls, and compare with one dispatch_as per call')
+@click.option('--group-batch', type=click.Choice(['force_batch', 'batch_all']), default='force_batch', show_default=True, help='Batch wrapping the calls of an owner group: force_batch skips failing calls, batch_all reverts the whole group')
+def remove_positions(asset_ids, check_farms, network, custom_rpc, at_block, concurrency, block_share, metadata_cache, snapshot_path,
+                     profile, profile_output, profile_format, dry_run, output_path, output_format, preimage_dir, record_path, resume,
+                     group_size, group_batch):
+    """Remove positions command with mandatory asset IDs and optional has_farms flag."""
+    click.echo(f"🚀 Captain's log: Engaging warp drive to remove positions for asset IDs: {list(asset_ids)}")
+    click.echo(f"🔧 Engineering report: Dilithium crystals configured to check farms: {check_farms}")
+    click.echo("📡 Communications: Hailing frequencies open, preparing photon torpedo removal calls...")
+
+    if preimage_dir and output_path:
+        raise click.UsageError("--output cannot be combined with --preimage-dir; the preimages are written into the directory")
+
+    profiler = Profiler() if profile or profile_output else None
+    weights = None
+    with stage(profiler, "connect"):
+        if snapshot_path:
+            if at_block is not None:
+                raise click.UsageError("--at-block cannot be combined with --snapshot; the snapshot is pinned to its own block")
+            if record_path:
+                raise click.UsageError("--record cannot be combined with --snapshot; there is no node traffic to record")
+            if resume:
+                raise click.UsageError("--resume cannot be combined with --snapshot; snapshot runs make no RPC requests to save")
+            if group_size:
+                raise click.UsageError("--group-by-owner cannot be combined with --snapshot; the snapshot only holds the "
+                                       "weights of single dispatch_as calls, not of owner groups")
+            snapshot = StateSnapshot.load(snapshot_path)
+            client = initialize_snapshot_client(snapshot, profiler=profiler)
+            weights = snapshot.weights
+            click.echo(f"💾 Helm: Running on holodeck recording of {snapshot.chain} at block #{snapshot.block_number}")
+        else:
+            # A recording must contain the metadata, so it is always fetched from the node when recording
+            client = connect(network, custom_rpc, concurrency=concurrency,
+                             cache_dir=DEFAULT_CACHE_DIR if metadata_cache and not record_path else None, profiler=profiler)
+            if client is None:
+                return
+            if resume and record_path:
+                raise click.UsageError("--resume cannot be combined with --record; a recording needs every request of the run")
+
+    recorder = None
+    if record_path:
+        recorder = Recorder()
+        recorder.attach(client)
+
+    checkpoint = None
+    try:
+        with stage(profiler, "pin block"):
+            checkpoint_dir = None
+            if not snapshot_path and not record_path:
+                checkpoint_dir = Checkpoint.directory(client.api.get_block_hash(0), asset_ids, check_farms)
+                if resume and at_block is None:
+                    at_block = Checkpoint.latest(checkpoint_dir)
+                    if at_block is None:
+                        click.echo("⚠️  Helm: No checkpoint to resume for these assets, starting a fresh run")
+            block_hash = client.resolve_block_hash(at_block)
+            if checkpoint_dir is not None:
+                checkpoint = Checkpoint.open(checkpoint_dir, block_hash, resume=resume)
+                if len(checkpoint):
+                    click.echo(f"⏯️  Helm: Resuming from {len(checkpoint)} saved results in {checkpoint.path}")
+        if recorder is not None:
+            recorder.recording.block_hash = block_hash
+        with client.snapshot(block_hash):
+            click.echo(f"📌 Navigation: Stardate locked at block {block_hash}")
+            schedule_calls = build_remove_positions_calls(client, asset_ids, check_farms, block_share, weights,
+                                                          dry_run=dry_run and not snapshot_path, checkpoint=checkpoint,
+                                                          group_size=group_size, group_batch=group_batch)
+            with stage(profiler, "output"):
+                if preimage_dir:
+                    write_preimages(client, schedule_calls, preimage_dir)
+                else:
+                    write_final_batch(client, schedule_calls, output_path, output_format)
+    except SubstrateRequestException as e:
+        click.echo(f"🚨 RED ALERT! Sensor sweep failed: {str(e)}")
+        if checkpoint is not None:
+            checkpoint.close()
+            click.echo("💾 Progress saved; rerun with --resume to continue where this run stopped")
+        client.close()
+        return
+    except BaseException:
+        if checkpoint is not None:
+            checkpoint.close()
+            click.echo("💾 Progress saved; rerun with --resume to continue where this run stopped")
+        raise
+
+    if checkpoint is not None:
+        # The run is complete; a new run should read fresh state
+        checkpoint.close(remove=True)
+
+    click.echo("✨ Captain, all systems are nominal. Permission to engage and transmit to the network, sir!")
+    client.close()
+
+    if recorder is not None:
+        recorder.recording.save(record_path)
+        click.echo(f"📼 Communications: {len(recorder.recording.responses)} subspace transmissions recorded in {record_path}")
+
+    if profiler is not None:
+        click.echo("⏱️  Chief Engineer's diagnostic report:")
+        click.echo(profiler.report())
+        if profile_output:
+            if profile_format == "chrome":
+                profiler.write_chrome_trace(profile_output)
+            else:
+                profiler.write_json(profile_output)
+            click.echo(f"💾 Diagnostic log stored in {profile_output}")
+
+
+@cli.command('fan-out')
+@click.argument('asset_ids', nargs=-1, required=True, type=click.IntRange(min=1))
+@click.option('--target', 'targets', multiple=True, required=True, help='Network name (lark1, lark2, nice, mainnet, ...) or RPC URL to plan on; repeat for every network')
+@click.option('--output-dir', default='.', show_default=True, type=click.Path(file_okay=False, writable=True), help='Directory the encoded call of every network and diff.json are written to')
+@click.option('--output-format', type=click.Choice(['hex', 'raw']), default='hex', show_default=True, help='Encoding of the written calls: 0x-prefixed hex or raw bytes')
+@click.option('--check-farms', default=True, help='Flag to indicate if farms are present')
+@click.option('--concurrency', default=4, show_default=True, type=click.IntRange(min=1), help='Number of RPC connections used for bulk reads on each network')
+@click.option('--block-share', default=0.5, show_default=True, type=click.FloatRange(min=0, max=1, min_open=True), help='Share of the block weight and length limits each scheduled batch may use')
+@click.option('--metadata-cache/--no-metadata-cache', default=True, help='Reuse runtime metadata cached on disk')
+@click.option('--dry-run/--no-dry-run', default=True, help='Dry-run every batch before writing it, dropping calls that would fail')
+def fan_out_command(asset_ids, targets, output_dir, output_format, check_farms, concurrency, block_share, metadata_cache, dry_run):
+    """Plan remove-positions on several networks at once and report where the plans differ."""
+    click.echo(f"🚀 Captain's log: Dispatching the fleet to {len(targets)} sectors for asset IDs: {list(asset_ids)}")
+
+    def report(plan):
+        if plan.error is not None:
+            click.echo(f"🚨 {plan.name}: RED ALERT! Mission failed after {plan.duration:.1f}s: {plan.error}")
+            return
+        click.echo(f"✅ {plan.name}: {len(plan.positions)} positions, {plan.deposit_count} deposits at block #{plan.block_number} "
+                   f"via {plan.url} in {plan.duration:.1f}s; {plan.length} bytes, hash {plan.hash}, stored in {plan.output_path}")
+        if plan.dropped:
+            click.echo(f"⚠️  {plan.name}: {plan.dropped} calls would fail and were left out of the batches")
+
+    start = time.perf_counter()
+    try:
+        plans = fan_out(targets, asset_ids, on_plan=report, check_farms=check_farms, block_share=block_share,
+                        concurrency=concurrency, dry_run=dry_run, output_dir=output_dir, output_format=output_format,
+                        cache_dir=DEFAULT_CACHE_DIR if metadata_cache else None)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f"⏱️  All sectors reported in {time.perf_counter() - start:.1f}s")
+
+    differences = diff_plans(plans)
+    diff_path = os.path.join(output_dir, "diff.json")
+    with open(diff_path, "w") as f:
+        json.dump({
+            "asset_ids": list(asset_ids),
+            "networks": {plan.name: {"url": plan.url, "block_hash": plan.block_hash, "block_number": plan.block_number,
+                                     "positions": len(plan.positions), "output": plan.output_path, "hash": plan.hash,
+                                     "error": plan.error} for plan in plans},
+            "differences": {str(position_id): entries for position_id, entries in differences.items()},
+        }, f, indent=1)
+
+    names = [plan.name for plan in plans if plan.error is None]
+    if len(names) < 2:
+        click.echo("⚠️  Data: Fewer than two sectors reported back; there is nothing to compare")
+    elif not differences:
+        click.echo(f"🟰 Data: Plans of {', '.join(names)} remove the same positions from the same owners")
+    else:
+        missing = {name: 0 for name in names}
+        other_owner = 0
+        for entries in differences.values():
+            present = [entry for entry in entries.values() if entry is not None]
+            for name, entry in entries.items():
+                if entry is None:
+                    missing[name] += 1
+            if len({entry["owner"] for entry in present}) > 1:
+                other_owner += 1
+        click.echo(f"🔀 Data: {len(differences)} positions differ between {', '.join(names)}")
+        for name, count in missing.items():
+            if count:
+                click.echo(f"   {name}: {count} positions not planned there")
+        click.echo(f"   {other_owner} positions have different owners")
+    click.echo(f"💾 Difference report stored in {diff_path}")
+
+
+@cli.command()
+@click.argument('output', type=click.Path(dir_okay=False, writable=True))
+@network_options
+@click.option('--at-block', 'at_block', type=BLOCK, help='Block number or hash to capture (default: chain head)')
+def snapshot(output, network, custom_rpc, at_block):
+    """Capture the state remove-positions needs into a local snapshot file."""
+    client = connect(network, custom_rpc)
+    if client is None:
+        return
+
+    click.echo("📸 Science Officer: Recording the OMNIPOOL nebula for the holodeck...")
+    try:
+        state = StateSnapshot.capture(client, at_block)
+    except SubstrateRequestException as e:
+        click.echo(f"🚨 RED ALERT! Sensor sweep failed: {str(e)}")
+        client.close()
+        return
+    state.save(output)
+    client.close()
+
+    for name, entries in state.entries.items():
+        click.echo(f"📊 Data: {len(entries)} {name} entries recorded")
+    click.echo(f"💾 Recording of block #{state.block_number} ({state.block_hash}) stored in {output}")
+
+
+@cli.command()
+@click.argument('asset_ids', nargs=-1, required=True, type=click.IntRange(min=1))
+@network_options
+@click.option('--new-heads', is_flag=True, help='Follow best blocks instead of finalized blocks')
+def watch(asset_ids, network, custom_rpc, new_heads):
+    """Keep a live index of the positions in the given pools, updated block by block."""
+    client = connect(network, custom_rpc)
+    if client is None:
+        return
+
+    index = PositionIndex(client)
+    click.echo("🔭 Science Officer: Charting every position in the OMNIPOOL nebula...")
+    try:
+        index.load()
+    except SubstrateRequestException as e:
+        click.echo(f"🚨 RED ALERT! Sensor sweep failed: {str(e)}")
+        client.close()
+        return
+
+    def report(index, changed):
+        counts = ", ".join(
+            f"asset {asset_id}: {len(positions)} positions / {len({owner for _, _, owner in positions})} owners"
+            for asset_id, positions in ((asset_id, index.positions(asset_id)) for asset_id in asset_ids)
+        )
+        click.echo(f"📡 Block #{index.block_number} ({changed} keys refreshed) - {counts}")
+
+    report(index, 0)
+    try:
+        index.follow(finalized_only=not new_heads, on_block=report)
+    except KeyboardInterrupt:
+        click.echo("🖖 Helm: Leaving orbit.")
+    finally:
+        client.close()
+
+
+@cli.command()
+@click.argument('asset_ids', nargs=-1, required=True, type=click.IntRange(min=1))
+@network_options
+@click.option('--from-block', type=click.IntRange(min=0), help='First block of the range (default: --blocks before --to-block)')
+@click.option('--to-block', type=click.IntRange(min=0), help='Last block of the range (default: chain head)')
+@click.option('--blocks', default=50000, show_default=True, type=click.IntRange(min=1), help='Length of the range when --from-block is not given')
+@click.option('--chunk-size', default=1000, show_default=True, type=click.IntRange(min=1), help='Blocks per state_queryStorage request')
+@click.option('--concurrency', default=8, show_default=True, type=click.IntRange(min=1), help='Number of RPC connections the chunks are fetched over')
+@click.option('--log', 'log_path', type=click.Path(exists=True, dir_okay=False), help='Read a change log saved by an earlier scan instead of scanning')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), help='Save the change log to a file')
+@click.option('--state-at', type=click.IntRange(min=0), help='Also list the positions of the assets and their owners at this block of the range')
+def history(asset_ids, network, custom_rpc, from_block, to_block, blocks, chunk_size, concurrency, log_path, output, state_at):
+    """Scan how the positions of the given pools and their owners changed over a range of blocks."""
+    client = connect(network, custom_rpc, concurrency=concurrency)
+    if client is None:
+        return
+
+    try:
+        if log_path:
+            log = ChangeLog.load(log_path)
+            click.echo(f"📜 Archives: Change log of blocks #{log.start[0]}-#{log.end[0]} loaded from {log_path}")
+        else:
+            if to_block is None:
+                to_block = client.api.get_block_number(client.api.get_chain_head())
+            if from_block is None:
+                from_block = max(to_block - blocks + 1, 0)
+            click.echo(f"🕰️  Science Officer: Scanning the OMNIPOOL nebula's past, blocks #{from_block}-#{to_block}...")
+            log = RangeScanner(client, chunk_size=chunk_size).scan(from_block, to_block)
+            click.echo(f"📊 Data: {len(log.keys)} keys followed, {len(log.changes)} changes recorded")
+
+        client.api.init_runtime(block_hash=log.end[1])
+        assets = set(asset_ids)
+        # Positions and deposits that already existed at the start block have no creation change in the log
+        initial = log.entries_at(client.api, log.start[0])
+        asset_of_position = {key[0]: position["asset_id"] for key, position in initial[POSITIONS].items()}
+        asset_of_deposit = {key[0]: deposit["amm_pool_id"] for key, deposit in initial[DEPOSITS].items()}
+        created, removed, modified, transfers = 0, 0, 0, 0
+        for number, name, key, previous, value in log.decoded_changes(client.api):
+            if name == POSITIONS:
+                asset_id = (value or previous)["asset_id"]
+                asset_of_position[key[0]] = asset_id
+                if asset_id not in assets:
+                    continue
+                if previous is None:
+                    created += 1
+                elif value is None:
+                    removed += 1
+                else:
+                    modified += 1
+            elif name == DEPOSITS:
+                asset_of_deposit[key[0]] = (value or previous)["amm_pool_id"]
+            elif name == NFTS and previous is not None and value is not None and previous["owner"] != value["owner"]:
+                collection, item = key
+                lookup = asset_of_position if collection == Omnipool.NFT_COLLECTION_ID else asset_of_deposit
+                if lookup.get(item) in assets:
+                    transfers += 1
+                    click.echo(f"🔁 Block #{number}: {'position' if collection == Omnipool.NFT_COLLECTION_ID else 'deposit'} "
+                               f"{item} moved from {previous['owner']} to {value['owner']}")
+        click.echo(f"📈 Data: {created} positions opened, {removed} closed, {modified} changed and {transfers} transferred "
+                   f"in assets {list(asset_ids)}")
+
+        if state_at is not None:
+            index = PositionIndex(client)
+            index.load_entries(log.entries_at(client.api, state_at), None, state_at)
+            for asset_id in asset_ids:
+                positions = index.positions(asset_id)
+                click.echo(f"📌 Block #{state_at}, asset {asset_id}: {len(positions)} positions")
+                for position_id, position, owner in positions:
+                    click.echo(f"   {position_id}: {position.shares} shares, owner {owner}")
+    except (SubstrateRequestException, ValueError) as e:
+        click.echo(f"🚨 RED ALERT! Sensor sweep failed: {str(e)}")
+        client.close()
+        return
+    client.close()
+
+    if output:
+        log.save(output)
+        click.echo(f"💾 Change log stored in {output}")
+
+
+@cli.command()
+@click.argument('spec_path', type=click.Path(exists=True, dir_okay=False))
+@network_options
+@click.option('--alice', is_flag=True, help='Sign with //Alice, the sudo key of dev chains, instead of the DEVNET_ROOT mnemonic')
+@click.option('--concurrency', default=4, show_default=True, type=click.IntRange(min=1), help='Number of RPC connections extrinsics are submitted over')
+@click.option('--block-share', default=0.5, show_default=True, type=click.FloatRange(min=0, max=1, min_open=True), help='Share of the block weight and length limits each sudo batch may use')
+@click.option('--timeout', default=600, show_default=True, type=click.FloatRange(min=0), help='Seconds to wait for every batch to be included')
+@click.option('--plan-only', is_flag=True, help='Compile the spec and report the batches without submitting them')
+def seed(spec_path, network, custom_rpc, alice, concurrency, block_share, timeout, plan_only):
+    """Build Omnipool pools, balances and LP positions from a JSON spec in as few sudo batches as fit."""
+    try:
+        spec = SeedSpec.load(spec_path)
+    except (TypeError, KeyError, ValueError) as e:
+        raise click.UsageError(f"Invalid seed spec {spec_path}: {str(e)}")
+    try:
+        sudo = root_origin(use_alice=alice)
+    except Exception as e:
+        raise click.UsageError(f"No sudo key: set DEVNET_ROOT or pass --alice ({str(e)})")
+
+    client = connect(network, custom_rpc, concurrency=concurrency)
+    if client is None:
         return
+
     omnipool = Omnipool(client)
-    uniques = Uniques(client)
-    utility = Utility(client)
-    omnipool_wlm = OmnipoolWLM(client)
-    omnipool_lm = OmnipoolLM(client)
-    scheduler = Scheduler(client)
+    try:
+        start = time.perf_counter()
+        planner = BatchPlanner(client, block_share=block_share)
+        compiler = SeedCompiler(client, planner, sudo.ss58_address)
+        click.echo("🌱 Engineering: Compiling the terraforming program...")
+        batches = list(compiler.batches(spec))
+        counts = compiler.counts
+        click.echo(f"📦 Logistics: {counts['balances']} balances, {counts['init']} pool initialisations, "
+                   f"{counts['assets']} assets and {counts['positions']} positions packed into {len(batches)} sudo batches "
+                   f"({sum(len(batch.data) for batch in batches)} bytes) in {time.perf_counter() - start:.1f}s")
+        if plan_only:
+            client.close()
+            return
 
-    dispatch_as_calls = []
-    future_omni_pos_owners = {}
+        next_position_id = omnipool.query_entry("Omnipool", "NextPositionId", [])
+        first_position = int(next_position_id.value) if next_position_id is not None else None
 
-    split_size = 20
+        start = time.perf_counter()
+        client.submitter = Submitter(client)
+        # One signer: the nonces keep the batches, and so the phases of the spec, in order
+        submissions = client.submitter.submit_many(batches, sudo)
+        click.echo(f"🚀 Helm: {len(submissions)} sudo batches transmitted in {time.perf_counter() - start:.1f}s, awaiting inclusion...")
+        deadline = time.monotonic() + timeout
+        for i, submission in enumerate(submissions, start=1):
+            submission.wait(max(deadline - time.monotonic(), 0))
+            if submission.status == "submitted":
+                click.echo(f"⏳ Batch {i}: still pending after {timeout:.0f}s")
+            elif not submission.is_success:
+                click.echo(f"❌ Batch {i}: {submission.error}")
+        included = sum(submission.is_success for submission in submissions)
+        click.echo(f"✅ Helm: {included}/{len(submissions)} batches included in {time.perf_counter() - start:.1f}s")
 
-    if check_farms:
-        # Process positions for provided asset IDs
-        for asset_id in asset_ids:
-            deposit_positions = omnipool_wlm.get_deposit_positions(asset_id)
-            click.echo(f"🔍 Sensors: Long-range scanners detect {len(deposit_positions)} Klingon deposit positions on asset {asset_id}")
-
-            for (deposit_id, farms) in deposit_positions:
-                owner = uniques.query_owner(2584, deposit_id)
-                farm_ids = []
-                for farm in farms:
-                    farm_ids.append(farm["yield_farm_id"].value)
-                call = omnipool_lm.create_exit_farm_call(deposit_id, farm_ids)
-                dispatch_call = utility.create_dispatch_as_call(owner, call)
-                dispatch_as_calls.append(dispatch_call)
-
-                omni_pos = omnipool_lm.get_omnipool_position_id(deposit_id)
-                future_omni_pos_owners[omni_pos] = owner
-
-        sublists = []
-        for i in range(0, len(dispatch_as_calls), split_size):
-            sublists.append(dispatch_as_calls[i:i + split_size])
-
-        # Create schedule calls for each sublist with increasing block delays
-        schedule_calls = []
-        for i, sublist in enumerate(sublists):
-            force_batch_call = utility.create_force_batch(sublist)
-            block_delay = i + 1  # 1,2,3
-            schedule_call = scheduler.create_schedule_after_call(block_delay, force_batch_call)
-            schedule_calls.append(schedule_call)
+        # Sudo reports failures of the calls it dispatches in events only, so check the outcome in state
+        states = {state.asset_id for state in omnipool.asset_states()}
+        missing = [asset.asset_id for asset in spec.assets if asset.asset_id not in states]
+        if missing:
+            click.echo(f"⚠️  Tactical: Assets {missing} are not in the Omnipool")
+        if first_position is not None:
+            # add_token mints a position for the initial liquidity of every asset it adds
+            created = int(omnipool.query_entry("Omnipool", "NextPositionId", []).value) - first_position
+            created -= len(spec.assets) - len(missing)
+            click.echo(f"📊 Data: {created} of {counts['positions']} positions created")
+    except (SubstrateRequestException, ValueError) as e:
+        click.echo(f"🚨 RED ALERT! Terraforming failed: {str(e)}")
+    client.close()
 
-    click.echo("🔄 Science Officer: Analyzing quantum flux in OMNIPOOL nebula for all assets...")
-    positions = omnipool.retrieve_positions()
-    l = []
-    for key, value in positions.items():
-        if value.asset_id in asset_ids:
-            l.append((key, value.shares))
 
-    click.echo(f"📊 Data: Computing... {len(l)} hostile positions identified matching your tactical parameters")
+def write_final_batch(client, schedule_calls, output_path=None, output_format="hex"):
+    """Stream force_batch(schedule_calls) to a file or the terminal without building it in memory."""
+    if output_path:
+        with open(output_path, "wb") as f:
+            if output_format == "hex":
+                f.write(b"0x")
+            writer = CallWriter(f, hex_output=output_format == "hex")
+            write_batch(client, schedule_calls, writer)
+        click.echo(f"\n🎉 Mission accomplished! The Borg have been defeated. Encoded subspace transmission stored in {output_path}")
+    else:
+        click.echo("\n🎉 Mission accomplished! The Borg have been defeated. Here's your encoded subspace transmission:")
+        click.echo("" + "="*50)
+        stdout = click.get_binary_stream("stdout")
+        stdout.write(b"0x")
+        writer = CallWriter(stdout, hex_output=True)
+        write_batch(client, schedule_calls, writer)
+        stdout.write(b"\n")
+        stdout.flush()
+        click.echo("" + "="*50)
+    click.echo(f"📏 Transmission length {writer.length} bytes, hash {writer.hash}")
 
-    entries = []
 
-    remove_liquidity_calls = []
+def write_preimages(client, schedule_calls, preimage_dir):
+    """Write the plan as note_preimage calls, split to fit in blocks, and print a referendum per preimage."""
+    os.makedirs(preimage_dir, exist_ok=True)
+    # Delays count from each preimage's own enactment, so every preimage restarts the schedule
+    groups = rebase_preimages(client, split_for_preimages(client, schedule_calls, preimage_limit(client)))
+    click.echo(f"\n🎉 Mission accomplished! The plan was split into {len(groups)} preimages:")
+    for i, group in enumerate(groups, start=1):
+        path = os.path.join(preimage_dir, f"note_preimage-{i}.hex")
+        with open(path, "wb") as f:
+            f.write(b"0x")
+            preimage_hash, length = write_note_preimage(client, group, CallWriter(f, hex_output=True))
+        click.echo(f"📜 Preimage {i}: {len(group)} scheduled batches, {length} bytes, hash {preimage_hash}, note_preimage call in {path}")
+        click.echo(f"   Batches run {schedule_delay(client, group[0])} to {schedule_delay(client, group[-1])} blocks after it is enacted")
+        try:
+            submit_call = create_call(client, "Referenda", "submit", {
+                "proposal_origin": {"system": "Root"},
+                "proposal": {"Lookup": {"hash": preimage_hash, "len": length}},
+                "enactment_moment": {"After": 1},
+            })
+            click.echo(f"🗳️  Referendum {i}: {submit_call.data}")
+        except ValueError as e:
+            click.echo(f"⚠️  No referendum call could be built for preimage {i}: {str(e)}")
+    if len(groups) > 1:
+        click.echo("⚠️  The preimages must be enacted in order, each after the last batch of the previous one has run: "
+                   "farm exits are scheduled before liquidity removals.")
 
-    click.echo("⚡ Tactical: Charging phaser arrays for liquidity removal sequence...")
 
-    for (position_id, shares) in l:
-        if position_id in future_omni_pos_owners:
-            owner = future_omni_pos_owners[position_id]
+def describe_dispatch(call) -> str:
+    """Module.function of the call a dispatch_as wraps, with the position or deposit it acts on."""
+    inner = call.value["call_args"]["call"]
+    inner = getattr(inner, "value", inner)
+    args = inner["call_args"]
+    name = f"{inner['call_module']}.{inner['call_function']}"
+    if "position_id" in args:
+        return f"{name} of position {args['position_id']}"
+    if "deposit_id" in args:
+        return f"{name} of deposit {args['deposit_id']}"
+    return name
+
+
+def report_dry_runs(pipeline, planner):
+    click.echo(f"🧪 Holodeck: {len(pipeline.dry_runs)} batches simulated at the pinned block")
+    for i, (count, result) in enumerate(pipeline.dry_runs, start=1):
+        if result.actual_weight is None:
+            used = "declared weight"
         else:
-            owner = uniques.query_owner(1337, position_id)
-        entry = {"owner": owner, "shares": shares, "id": position_id}
-        entries.append(entry)
-        call = omnipool.remove_liquidity_call(position_id, shares)
-        dispatch_call = utility.create_dispatch_as_call(owner, call)
-        remove_liquidity_calls.append(dispatch_call)
-
-    subremovals = []
-    # block delay should be after all previous delays
-    for i in range(0, len(remove_liquidity_calls), split_size):
-        subremovals.append(remove_liquidity_calls[i:i + split_size])
-
-    start_delay = len(sublists) + 1
-    for i, subremoval in enumerate(subremovals):
-        force_batch_call = utility.create_force_batch(subremoval)
-        block_delay = start_delay + (i + 1)
-        schedule_call = scheduler.create_schedule_after_call(block_delay, force_batch_call)
-        schedule_calls.append(schedule_call)
-
-    click.echo("\n🎉 Mission accomplished! The Borg have been defeated. Here's your encoded subspace transmission:")
-    click.echo("" + "="*50)
-    # Batch all schedule calls in one force_batch call
-    final_batch_call = utility.create_force_batch(schedule_calls)
-    click.echo(final_batch_call.encode())
-    click.echo("" + "="*50)
-    click.echo("✨ Captain, all systems are nominal. Permission to engage and transmit to the network, sir!")
-    client.api.close()
+            ref_time, proof_size = result.actual_weight
+            used = f"ref_time {ref_time} ({ref_time / planner.limit.ref_time:.0%} of limit), proof_size {proof_size}"
+        status = "✅" if result.ok and not result.failed else "❌"
+        click.echo(f"   {status} Simulation {i}: {count} calls, {used}")
+    for call, error in pipeline.dropped:
+        click.echo(f"🗑️  Dropped failing call {describe_dispatch(call)}: {error}")
+    if pipeline.dropped:
+        click.echo(f"⚠️  Tactical: {len(pipeline.dropped)} calls would fail and were left out of the batches")
+
+
+def report_layouts(pipeline):
+    click.echo("📐 Logistics: Cargo layout comparison")
+    for name, stats in pipeline.layouts.items():
+        click.echo(f"   {name:>9}: {stats.calls} dispatch_as calls, {stats.cost.length} bytes, "
+                   f"ref_time {stats.cost.ref_time}, proof_size {stats.cost.proof_size}, {stats.batches} scheduled batches")
+    per_call, per_owner = pipeline.layouts["per call"], pipeline.layouts["per owner"]
+    if per_call.cost.length:
+        click.echo(f"   Grouping by owner saves {1 - per_owner.cost.length / per_call.cost.length:.1%} of the length "
+                   f"and {per_call.batches - per_owner.batches} scheduled batches")
+
+
+def build_remove_positions_calls(client, asset_ids, check_farms, block_share=0.5, weights=None, dry_run=False,
+                                 checkpoint=None, group_size=None, group_batch="force_batch"):
+    """The schedule_after(force_batch(...)) calls removing every position of the given assets.
 
+    With a checkpoint, stage results are saved as they complete, and a finished schedule is
+    restored from it without reading anything.
+    """
+    # Batches depend on how they are packed and dry-run, so each setting gets its own schedule
+    schedule_stage = f"schedule {block_share} {'dry-run' if dry_run else 'no-dry-run'}"
+    if group_size:
+        schedule_stage += f" {group_batch} {group_size}"
+    if checkpoint is not None and checkpoint.done(schedule_stage):
+        schedule_calls = list(checkpoint.pages(schedule_stage, [], None, EncodedCall))
+        click.echo(f"📦 Logistics: {len(schedule_calls)} cargo bays restored from the checkpoint")
+        return schedule_calls
+
+    with client.stage("block limits"):
+        planner = BatchPlanner(client, block_share=block_share, weights=weights)
+
+    dry_runner = None
+    if dry_run:
+        try:
+            dry_runner = DryRunner(client)
+        except SubstrateRequestException as e:
+            click.echo(f"⚠️  Tactical: Holodeck simulation unavailable, batches will not be dry-run: {str(e)}")
+    pipeline = RemovePositionsPipeline(client, asset_ids, planner, dry_runner=dry_runner, checkpoint=checkpoint,
+                                       group_size=group_size, group_batch=group_batch)
+
+    click.echo("🔄 Science Officer: Analyzing quantum flux in OMNIPOOL nebula for all assets...")
+    click.echo("⚡ Tactical: Charging phaser arrays for liquidity removal sequence...")
+
+    schedule_calls = []
+    with client.stage("read and schedule"):
+        calls = pipeline.schedule_calls(check_farms)
+        if checkpoint is not None:
+            calls = checkpoint.pages(schedule_stage, calls, lambda call: call.data.to_hex(), EncodedCall)
+        for schedule_call in calls:
+            schedule_calls.append(schedule_call)
+            click.echo(f"📦 Logistics: Cargo bay {len(schedule_calls)} sealed and scheduled")
+
+    if check_farms:
+        for asset_id in asset_ids:
+            click.echo(f"🔍 Sensors: Long-range scanners detect {pipeline.deposit_counts[asset_id]} Klingon deposit positions on asset {asset_id}")
+    click.echo(f"📊 Data: Computing... {pipeline.position_count} hostile positions identified matching your tactical parameters")
+    if dry_runner is not None:
+        report_dry_runs(pipeline, planner)
+    if pipeline.layouts is not None:
+        report_layouts(pipeline)
+
+    return schedule_calls
+
+
+def build_remove_positions_call(client, asset_ids, check_farms, block_share=0.5, weights=None, dry_run=False):
+    schedule_calls = build_remove_positions_calls(client, asset_ids, check_farms, block_share, weights, dry_run)
+    # Batch all schedule calls in one force_batch call
+    with client.stage("final batch"):
+        return Utility(client).create_force_batch(schedule_calls)
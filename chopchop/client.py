@@ -1,12 +1,103 @@
 import os
-from dataclasses import dataclass
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
 
 from substrateinterface import SubstrateInterface, Keypair
 from substrateinterface.exceptions import SubstrateRequestException
 
+from chopchop.cache import DEFAULT_CACHE_DIR, MetadataCache
+from chopchop.calls import CallTemplate
+from chopchop.endpoints import EndpointPool
+from chopchop.fetch import FetchEngine
+from chopchop.profile import Profiler, profiled, stage
+from chopchop.storage import MemoryStorage, RpcStorage
+from chopchop.submit import Submitter
+
 @dataclass
 class Client:
     api: SubstrateInterface
+    # Block every Pallet query reads at unless given an explicit `at`; None reads at the chain head
+    block_hash: Optional[str] = None
+    # Worker pool for independent reads; None keeps every request on `api`
+    engine: Optional[FetchEngine] = None
+    # Call encoders keyed by (runtime version, module, function)
+    call_templates: dict = field(default_factory=dict)
+    # Backend Pallet queries read from; defaults to the node behind `api`
+    storage: Optional[RpcStorage | MemoryStorage] = None
+    # Records RPC, storage, encode and decode spans when set
+    profiler: Optional[Profiler] = None
+    # Pipelines submit_extrinsic with local nonces when set; None submits one extrinsic at a time
+    submitter: Optional[Submitter] = None
+    # Endpoints `api` and the engine's connections fail over between; None for a single fixed connection
+    endpoints: Optional[EndpointPool] = None
+
+    def __post_init__(self):
+        if self.storage is None:
+            self.storage = RpcStorage(self)
+        if self.profiler is not None:
+            self.profiler.instrument(self.api)
+            if self.engine is not None:
+                self.engine.on_connect = self.profiler.instrument
+
+    def profile(self, category, name):
+        return profiled(self.profiler, category, name)
+
+    def stage(self, name):
+        """Attribute everything recorded inside the context to a named stage of the run."""
+        return stage(self.profiler, name)
+
+    def resolve_block_hash(self, at: str | int | None = None) -> str:
+        """Resolve a block number or hash to a block hash, defaulting to the current chain head."""
+        if at is None:
+            return self.api.get_chain_head()
+        if isinstance(at, int) or not str(at).startswith("0x"):
+            block_hash = self.api.get_block_hash(int(at))
+            if block_hash is None:
+                raise SubstrateRequestException(f"Block {at} not found")
+            return block_hash
+        return at
+
+    @contextmanager
+    def snapshot(self, at: str | int | None = None):
+        """Pin all Pallet queries to one block for the duration of the context."""
+        previous = self.block_hash
+        self.block_hash = self.resolve_block_hash(at)
+        if self.endpoints is not None:
+            self.endpoints.pinned_block = self.block_hash
+        try:
+            yield self.block_hash
+        finally:
+            self.block_hash = previous
+            if self.endpoints is not None:
+                self.endpoints.pinned_block = previous
+
+    def call_template(self, module: str, func: str) -> CallTemplate:
+        key = (self.api.runtime_version, module, func)
+        template = self.call_templates.get(key)
+        if template is None:
+            template = CallTemplate(self.api, module, func)
+            # The runtime may have been initialised while building the template
+            self.call_templates[(template.runtime_version, module, func)] = template
+        return template
+
+    def rpc_requests(self, method, list_of_params) -> list:
+        """Issue independent RPC requests, concurrently when a fetch engine is configured.
+
+        With an engine the requests never touch `api`, so this is safe to call from another thread
+        while `api` is in use.
+        """
+        if self.engine is not None:
+            return self.engine.rpc_requests(method, list_of_params)
+        return [self.api.rpc_request(method, params) for params in list_of_params]
+
+    def close(self):
+        if self.submitter is not None:
+            self.submitter.close()
+        if self.engine is not None:
+            self.engine.close()
+        self.api.close()
 
 custom_type_registry = {
     "runtime_id": 1,
@@ -53,41 +144,59 @@ karura_type_registry = {
 LOCAL_RPC = "ws://127.0.0.1:9988"
 CHOPSTICKS = "http://127.0.0.1:8000"
 HYDRA_MAINNET= "wss://hydration.ibp.network:443"
+HYDRA_MAINNET_DOTTERS = "wss://hydration.dotters.network:443"
+HYDRA_MAINNET_GALACTIC = "wss://rpc.hydradx.cloud:443"
 LARK1 = "https://1.lark.hydration.cloud"
 LARK2 = "https://2.lark.hydration.cloud"
 NICE = 'wss://rpc.nice.hydration.cloud:443'
 
 RPC = HYDRA_MAINNET
 
+# Endpoints of every network; the pool picks among them by latency and head height
 NETWORK_MAP = {
-    "mainnet": HYDRA_MAINNET,
-    "lark1": LARK1,
-    "lark2": LARK2,
-    "nice": NICE,
-    "local": LOCAL_RPC,
-    "chopsticks": CHOPSTICKS,
+    "mainnet": [HYDRA_MAINNET, HYDRA_MAINNET_DOTTERS, HYDRA_MAINNET_GALACTIC],
+    "lark1": [LARK1],
+    "lark2": [LARK2],
+    "nice": [NICE],
+    "local": [LOCAL_RPC],
+    "chopsticks": [CHOPSTICKS],
 }
 
-def resolve_network_rpc(network: str | None = None, custom_rpc: str | None = None) -> str:
-    """Resolve network parameter to RPC URL."""
+def resolve_network_rpcs(network: str | None = None, custom_rpc: str | list | tuple | None = None) -> list:
+    """Resolve network parameter to the network's RPC URLs; custom URLs take precedence."""
     if custom_rpc:
-        return custom_rpc
+        return [custom_rpc] if isinstance(custom_rpc, str) else list(custom_rpc)
     if network and network in NETWORK_MAP:
-        return NETWORK_MAP[network]
-    return RPC
+        return list(NETWORK_MAP[network])
+    return list(NETWORK_MAP["mainnet"])
 
-def initialize_network_client(r: str | None = None, network: str | None = None, custom_rpc: str | None = None) -> Client:
-    rpc = r or resolve_network_rpc(network, custom_rpc)
+def resolve_network_rpc(network: str | None = None, custom_rpc: str | list | tuple | None = None) -> str:
+    """Resolve network parameter to RPC URL."""
+    return resolve_network_rpcs(network, custom_rpc)[0]
+
+def initialize_network_client(r: str | None = None, network: str | None = None, custom_rpc: str | list | tuple | None = None,
+                              concurrency: int = 1, type_registry: dict | None = None,
+                              cache_dir: Path | None = DEFAULT_CACHE_DIR, profiler: Profiler | None = None,
+                              timeout: float = 10.0) -> Client:
+    # Fallback endpoints are only probed once the first one fails
+    pool = EndpointPool([r] if r else resolve_network_rpcs(network, custom_rpc), timeout=timeout)
     try:
-        api = SubstrateInterface(
-            url=rpc,
-        )
-    except ConnectionRefusedError as e:
-        raise SubstrateRequestException(f"⚠️ Failed to connect to {rpc}") from e
+        api = pool.connect(type_registry=type_registry)
+        if cache_dir is not None:
+            # Metadata is only loaded on the first query, so the region can be attached after connecting
+            api.cache_region = MetadataCache(api, api.chain, type_registry=type_registry, cache_dir=cache_dir)
+    except SubstrateRequestException:
+        raise
     except Exception as e:
         raise RuntimeError(str(e)) from e
 
-    return Client(api=api)
+    engine = FetchEngine(api.url, concurrency=concurrency, connect=pool.connect_worker) if concurrency > 1 else None
+
+    return Client(api=api, engine=engine, profiler=profiler, endpoints=pool)
+
+
+# Seconds submit_extrinsic waits for an extrinsic handed to the client's submitter to be included
+INCLUSION_TIMEOUT = 600.0
 
 
 def root_origin(use_alice=False):
@@ -100,12 +209,21 @@ def root_origin(use_alice=False):
 
 
 def create_call(client, module, func, params):
-    return client.api.compose_call(
-        call_module=module, call_function=func, call_params=params
-    )
+    with client.profile("encode", f"{module}.{func}"):
+        return client.call_template(module, func).encode(params)
+
 
+def submit_extrinsic(client, sender, call, wait_for_inc=True, timeout=INCLUSION_TIMEOUT):
+    if client.submitter is not None:
+        submission = client.submitter.submit(call, sender)
+        if not wait_for_inc:
+            return submission
+        submission.wait(timeout)
+        if submission.status == "submitted":
+            raise SubstrateRequestException(f"Extrinsic {submission.extrinsic_hash} not included after {timeout:.0f}s")
+        print(f"Ex: {submission.error}")
+        return submission.is_success
 
-def submit_extrinsic(client, sender, call, wait_for_inc=True):
     extrinsic = client.api.create_signed_extrinsic(
         call=call, keypair=sender, era={"period": 64}
     )
@@ -0,0 +1,166 @@
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from typing import Optional
+
+from scalecodec.base import ScaleBytes
+from substrateinterface.exceptions import SubstrateRequestException
+
+from chopchop.client import Client
+
+
+def runtime_api_id(name: str) -> str:
+    """Id of a runtime API in state_getRuntimeVersion's `apis`: the 8-byte blake2b hash of its name."""
+    return "0x" + blake2b(name.encode(), digest_size=8).hexdigest()
+
+
+DRY_RUN_API_ID = runtime_api_id("DryRunApi")
+# XCM version the dry-run API reports forwarded messages in; only used by version 2 of the API
+RESULT_XCMS_VERSION = 4
+
+
+@dataclass
+class DryRunResult:
+    # Whether the call itself dispatched; force_batch items can still fail individually
+    ok: bool
+    # (ref_time, proof_size) used, or None when the runtime reports the declared weight
+    actual_weight: Optional[tuple] = None
+    # Index of every failed force_batch item -> error
+    failed: dict = field(default_factory=dict)
+    error: Optional[object] = None
+
+
+def _compact(data: bytes, offset: int) -> tuple:
+    mode = data[offset] & 3
+    if mode == 0:
+        return data[offset] >> 2, offset + 1
+    if mode == 1:
+        return int.from_bytes(data[offset:offset + 2], "little") >> 2, offset + 2
+    if mode == 2:
+        return int.from_bytes(data[offset:offset + 4], "little") >> 2, offset + 4
+    length = (data[offset] >> 2) + 4
+    return int.from_bytes(data[offset + 1:offset + 1 + length], "little"), offset + 1 + length
+
+
+def _post_dispatch_info(data: bytes, offset: int) -> tuple:
+    """Decode PostDispatchInfo { actual_weight: Option<Weight>, pays_fee } at `offset`."""
+    weight = None
+    if data[offset] == 1:
+        ref_time, offset = _compact(data, offset + 1)
+        proof_size, offset = _compact(data, offset)
+        weight = (ref_time, proof_size)
+    else:
+        offset += 1
+    return weight, offset + 1
+
+
+def _event_parts(event) -> tuple:
+    """(pallet, event, attributes) of a decoded RuntimeEvent value."""
+    pallet, inner = next(iter(event.items()))
+    if isinstance(inner, str):
+        return pallet, inner, None
+    name, attributes = next(iter(inner.items()))
+    return pallet, name, attributes
+
+
+def item_failures(events) -> dict:
+    """Failed items of a force_batch of dispatch_as calls, by index, from the events it emitted.
+
+    dispatch_as succeeds even when the call it dispatches fails, so the item's DispatchedAs
+    result is checked as well as ItemFailed.
+    """
+    failures = {}
+    index = 0
+    dispatched_as = None
+    for event in events:
+        pallet, name, attributes = _event_parts(event)
+        if pallet != "Utility":
+            continue
+        if name == "DispatchedAs":
+            dispatched_as = attributes
+        elif name in ("ItemCompleted", "ItemFailed"):
+            if name == "ItemFailed":
+                failures[index] = attributes["error"] if isinstance(attributes, dict) else attributes
+            elif dispatched_as is not None:
+                result = dispatched_as["result"] if isinstance(dispatched_as, dict) else dispatched_as
+                if isinstance(result, dict) and "Err" in result:
+                    failures[index] = result["Err"]
+            index += 1
+            dispatched_as = None
+    return failures
+
+
+class DryRunner:
+    """Dry-runs calls as Root at the client's pinned block with the runtime's DryRunApi.
+
+    Requests run concurrently on the client's fetch engine; encoding and decoding stay on the
+    calling thread.
+    """
+
+    def __init__(self, client: Client):
+        self._client = client
+        api = client.api
+        api.init_runtime(block_hash=client.block_hash)
+        if not api.metadata.portable_registry:
+            raise SubstrateRequestException("Dry runs need V14 or later metadata")
+
+        apis = dict(api.rpc_request("state_getRuntimeVersion", [client.block_hash])["result"]["apis"])
+        self.version = apis.get(DRY_RUN_API_ID)
+        if self.version is None:
+            raise SubstrateRequestException("The runtime does not provide the DryRunApi")
+
+        origin = client.call_template("Utility", "dispatch_as").arg_decoder("as_origin")(metadata=api.metadata)
+        self._origin = bytes(origin.encode({"system": "Root"}).data)
+        self._event_type = self._runtime_event_type()
+
+    def _runtime_event_type(self) -> str:
+        # System.Events holds Vec<EventRecord<RuntimeEvent, Hash>>; find RuntimeEvent in the registry
+        api = self._client.api
+        types = {entry["id"]: entry["type"]["def"] for entry in api.metadata.portable_registry.value}
+        events_type = api.metadata.get_metadata_pallet("System").get_storage_function("Events").get_value_type_string()
+        record_type = types[int(events_type.split("::")[1])]["sequence"]["type"]
+        event_field = next(field for field in types[record_type]["composite"]["fields"] if field["name"] == "event")
+        return f"scale_info::{event_field['type']}"
+
+    def _params(self, call) -> list:
+        data = self._origin + bytes(call.data.data)
+        if self.version >= 2:
+            data += RESULT_XCMS_VERSION.to_bytes(4, "little")
+        return ["DryRunApi_dry_run_call", "0x" + data.hex(), self._client.block_hash]
+
+    def dry_run_many(self, calls) -> list:
+        calls = list(calls)
+        with self._client.profile("encode", "DryRunApi.dry_run_call"):
+            params = [self._params(call) for call in calls]
+        responses = self._client.rpc_requests("state_call", params)
+        with self._client.profile("decode", "DryRunApi.dry_run_call"):
+            return [self._decode(bytes.fromhex(response["result"][2:])) for response in responses]
+
+    def dry_run(self, call) -> DryRunResult:
+        return self.dry_run_many([call])[0]
+
+    def _decode(self, data: bytes) -> DryRunResult:
+        # Result<CallDryRunEffects, XcmDryRunApiError>
+        if data[0] != 0:
+            return DryRunResult(ok=False, error={"DryRunApi": data[1:].hex()})
+        # execution_result: Result<PostDispatchInfo, DispatchErrorWithPostInfo>
+        failed_dispatch = data[1] == 1
+        weight, offset = _post_dispatch_info(data, 2)
+        if failed_dispatch:
+            error = self._client.api.runtime_config.create_scale_object(
+                "sp_runtime::DispatchError", data=ScaleBytes(data[offset:]), metadata=self._client.api.metadata
+            )
+            try:
+                error = error.decode(check_remaining=False)
+            except Exception:
+                error = data[offset:].hex()
+            return DryRunResult(ok=False, actual_weight=weight, error=error)
+
+        # emitted_events: Vec<RuntimeEvent>; local and forwarded XCMs follow and are not needed
+        count, offset = _compact(data, offset)
+        stream = ScaleBytes(data)
+        stream.offset = offset
+        events = []
+        for _ in range(count):
+            event = self._client.api.runtime_config.create_scale_object(self._event_type, data=stream, metadata=self._client.api.metadata)
+            events.append(event.decode(check_remaining=False))
+        return DryRunResult(ok=True, actual_weight=weight, failed=item_failures(events))
@@ -0,0 +1,246 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Optional
+
+from substrateinterface import SubstrateInterface
+from substrateinterface.exceptions import SubstrateRequestException
+
+
+@dataclass
+class Endpoint:
+    url: str
+    # Round trip time of a chain_getHeader request, in seconds; None until probed
+    latency: Optional[float] = None
+    # Best block number the endpoint reported when probed
+    head: Optional[int] = None
+    healthy: bool = True
+    failures: int = 0
+    # Monotonic time after which an endpoint that failed may be used again
+    retry_at: float = 0.0
+    error: Optional[str] = None
+
+
+def _is_transport_error(e: Exception) -> bool:
+    """Whether a failed request may succeed on another endpoint.
+
+    JSON-RPC errors are answers of the node and fail the same everywhere; connection errors,
+    timeouts and HTTP status errors (e.g. a rate-limited public node) do not.
+    """
+    if isinstance(e, SubstrateRequestException):
+        return bool(e.args) and isinstance(e.args[0], str) and e.args[0].startswith("RPC request failed with HTTP status")
+    return True
+
+
+def _is_retryable(method: str) -> bool:
+    """Whether a request may be sent again on another endpoint after it failed for transport reasons.
+
+    An author_ request may have reached the node before the connection failed: submitted again
+    elsewhere, the extrinsic would be rejected as already imported.
+    """
+    return not method.startswith("author_")
+
+
+class EndpointPool:
+    """RPC endpoints of one network, ranked by probed latency and head height.
+
+    Endpoints are used in the order given until one fails; only then are the others probed.
+    Connections handed out by the pool fail over: a request that fails for transport reasons is
+    retried on the next best endpoint, on the same SubstrateInterface, and the failed endpoint is
+    left out for `cooldown` seconds. Endpoints without the state of `pinned_block`, e.g. pruned
+    nodes, are not failed over to. Once probed, worker connections are spread round-robin over
+    every healthy endpoint within `spread` times the best latency.
+    """
+
+    def __init__(self, urls, timeout: float = 10.0, max_lag: int = 5, cooldown: float = 30.0, spread: float = 2.0):
+        if not urls:
+            raise ValueError("No RPC endpoints given")
+        self.endpoints = [Endpoint(url) for url in dict.fromkeys(urls)]
+        self._by_url = {endpoint.url: endpoint for endpoint in self.endpoints}
+        self.timeout = timeout
+        self.max_lag = max_lag
+        self.cooldown = cooldown
+        self.spread = spread
+        # Block the run reads at, which an endpoint must hold state for to be failed over to
+        self.pinned_block = None
+        self.probed = False
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _probe(self, endpoint: Endpoint):
+        api = None
+        try:
+            api = SubstrateInterface(url=endpoint.url, auto_discover=False, ws_options={"timeout": self.timeout})
+            self._set_timeout(api)
+            start = time.perf_counter()
+            header = api.rpc_request("chain_getHeader", [])["result"]
+            endpoint.latency = time.perf_counter() - start
+            endpoint.head = int(header["number"], 16)
+            endpoint.healthy = True
+            endpoint.error = None
+        except Exception as e:
+            endpoint.healthy = False
+            endpoint.error = str(e)
+        finally:
+            if api is not None:
+                api.close()
+
+    def probe(self) -> list:
+        """Probe every endpoint concurrently; endpoints more than `max_lag` blocks behind are unhealthy."""
+        with ThreadPoolExecutor(max_workers=len(self.endpoints)) as executor:
+            list(executor.map(self._probe, self.endpoints))
+        heads = [endpoint.head for endpoint in self.endpoints if endpoint.healthy]
+        if heads:
+            for endpoint in self.endpoints:
+                if endpoint.healthy and endpoint.head < max(heads) - self.max_lag:
+                    endpoint.healthy = False
+                    endpoint.error = f"{max(heads) - endpoint.head} blocks behind"
+        self.probed = True
+        return self.ranked()
+
+    def ranked(self) -> list:
+        """Usable endpoints, fastest first. Failed endpoints come back once their cooldown is over."""
+        now = time.monotonic()
+        with self._lock:
+            usable = [endpoint for endpoint in self.endpoints if endpoint.healthy or (endpoint.failures and now >= endpoint.retry_at)]
+        return sorted(usable, key=lambda endpoint: (endpoint.failures, float("inf") if endpoint.latency is None else endpoint.latency))
+
+    def best(self) -> Endpoint:
+        ranked = self.ranked()
+        if not ranked:
+            raise SubstrateRequestException("No healthy RPC endpoint: " + "; ".join(
+                f"{endpoint.url}: {endpoint.error}" for endpoint in self.endpoints
+            ))
+        return ranked[0]
+
+    def mark_failed(self, url: str, error: Exception):
+        endpoint = self._by_url.get(url)
+        if endpoint is None:
+            return
+        with self._lock:
+            endpoint.healthy = False
+            endpoint.failures += 1
+            endpoint.retry_at = time.monotonic() + self.cooldown
+            endpoint.error = str(error)
+
+    def _mark_ok(self, url: str):
+        endpoint = self._by_url.get(url)
+        if endpoint is not None and not endpoint.healthy:
+            with self._lock:
+                endpoint.healthy = True
+                endpoint.failures = 0
+
+    def _set_timeout(self, api: SubstrateInterface):
+        # Websocket connections get their timeout from ws_options; HTTP requests have none by default
+        api.session.request = partial(api.session.request, timeout=self.timeout)
+
+    def _check_pinned_block(self, rpc_request, url: str):
+        if self.pinned_block is None:
+            return
+        try:
+            # Reading the runtime version needs the block's state, which pruned nodes discard
+            rpc_request("state_getRuntimeVersion", [self.pinned_block])
+        except Exception as e:
+            raise SubstrateRequestException(f"{url} has no state for the pinned block {self.pinned_block}: {e}")
+
+    def _switch(self, api: SubstrateInterface, url: str):
+        try:
+            api.close()
+        except Exception:
+            pass
+        api.url = url
+        api.websocket = None
+        api.connect_websocket()
+
+    def instrument(self, api: SubstrateInterface) -> SubstrateInterface:
+        """Make `api` fail over to the next best endpoint when a request fails for transport reasons."""
+        rpc_request = api.rpc_request
+        self._set_timeout(api)
+
+        def failover_rpc_request(method, params, result_handler = None):
+            if result_handler is not None:
+                return subscribe(method, params, result_handler)
+            tried = set()
+            while True:
+                url = api.url
+                try:
+                    response = rpc_request(method, params, result_handler=result_handler)
+                    self._mark_ok(url)
+                    return response
+                except Exception as e:
+                    if not _is_retryable(method) or not _is_transport_error(e):
+                        raise
+                    tried.add(url)
+                    self.mark_failed(url, e)
+                    if not self.probed:
+                        self.probe()
+                    for endpoint in self.ranked():
+                        if endpoint.url in tried:
+                            continue
+                        try:
+                            self._switch(api, endpoint.url)
+                            self._check_pinned_block(rpc_request, endpoint.url)
+                            break
+                        except Exception as switch_error:
+                            tried.add(endpoint.url)
+                            self.mark_failed(endpoint.url, switch_error)
+                    else:
+                        raise
+
+        def subscribe(method, params, result_handler):
+            # A subscription cannot be resumed halfway on another node, and waits on the socket as long
+            # as the node takes to notify, e.g. until an extrinsic is included: no timeout meanwhile
+            websocket = api.websocket
+            if websocket is None:
+                return rpc_request(method, params, result_handler=result_handler)
+            websocket.settimeout(None)
+            try:
+                return rpc_request(method, params, result_handler=result_handler)
+            finally:
+                websocket.settimeout(self.timeout)
+
+        api.rpc_request = failover_rpc_request
+        return api
+
+    def connect(self, **kwargs) -> SubstrateInterface:
+        """Connect to the best endpoint that accepts the connection, with failover."""
+        errors = []
+        # When every probe failed, try them all once more rather than giving up straight away
+        for endpoint in self.ranked() or self.endpoints:
+            try:
+                api = SubstrateInterface(url=endpoint.url, ws_options={"timeout": self.timeout}, **kwargs)
+            except Exception as e:
+                self.mark_failed(endpoint.url, e)
+                errors.append(f"{endpoint.url}: {e}")
+                continue
+            return self.instrument(api)
+        raise SubstrateRequestException("⚠️ Failed to connect to any RPC endpoint: " + "; ".join(errors))
+
+    def next_url(self) -> str:
+        """Round-robin over the usable endpoints within `spread` times the best latency; the best one until probed."""
+        ranked = self.ranked()
+        if not ranked or not self.probed:
+            return self.best().url
+        best_latency = ranked[0].latency
+        if best_latency is not None:
+            ranked = [endpoint for endpoint in ranked
+                      if endpoint.latency is not None and endpoint.latency <= best_latency * self.spread]
+        with self._lock:
+            url = ranked[self._next % len(ranked)].url
+            self._next += 1
+        return url
+
+    def connect_worker(self) -> SubstrateInterface:
+        """Worker connection for a FetchEngine, spreading workers over the fast endpoints."""
+        url = self.next_url()
+        try:
+            # Workers only issue raw RPC requests, so skip the chain preset discovery round trip
+            api = SubstrateInterface(url=url, auto_discover=False, ws_options={"timeout": self.timeout})
+            self._check_pinned_block(api.rpc_request, url)
+        except Exception as e:
+            # The engine retries with a fresh connection, which goes to another endpoint
+            self.mark_failed(url, e)
+            raise
+        return self.instrument(api)
@@ -0,0 +1,134 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+from substrateinterface.exceptions import SubstrateRequestException
+
+from chopchop.cache import DEFAULT_CACHE_DIR
+from chopchop.client import NETWORK_MAP, initialize_network_client
+from chopchop.dryrun import DryRunner
+from chopchop.output import CallWriter, write_batch
+from chopchop.pipeline import RemovePositionsPipeline
+from chopchop.planner import BatchPlanner
+
+
+@dataclass
+class NetworkPlan:
+    """Outcome of planning remove-positions on one network."""
+    name: str
+    url: Optional[str] = None
+    block_hash: Optional[str] = None
+    block_number: Optional[int] = None
+    # Position id -> (asset id, owner, shares) of every position removed
+    positions: dict = field(default_factory=dict)
+    deposit_count: int = 0
+    dropped: int = 0
+    output_path: Optional[str] = None
+    length: int = 0
+    hash: Optional[str] = None
+    duration: float = 0.0
+    error: Optional[str] = None
+
+
+def resolve_target(target: str) -> tuple:
+    """(name, urls) of a network name from NETWORK_MAP or an RPC URL."""
+    if target in NETWORK_MAP:
+        return target, list(NETWORK_MAP[target])
+    parsed = urlparse(target)
+    if not parsed.scheme or not parsed.hostname:
+        raise ValueError(f"{target} is neither a known network ({', '.join(NETWORK_MAP)}) nor an RPC URL")
+    return parsed.hostname, [target]
+
+
+def plan_network(name, urls, asset_ids, check_farms = True, block_share = 0.5, concurrency = 4,
+                 dry_run = True, output_dir = ".", output_format = "hex", cache_dir = DEFAULT_CACHE_DIR) -> NetworkPlan:
+    """Plan remove-positions on one network with a client of its own and write the encoded call.
+
+    Runs in a worker process, so only the plan summary travels back to the caller.
+    """
+    start = time.perf_counter()
+    plan = NetworkPlan(name)
+    client = None
+    try:
+        client = initialize_network_client(custom_rpc=urls, concurrency=concurrency, cache_dir=cache_dir)
+        plan.url = client.api.url
+        with client.snapshot() as block_hash:
+            plan.block_hash = block_hash
+            plan.block_number = client.api.get_block_number(block_hash)
+            planner = BatchPlanner(client, block_share=block_share)
+            dry_runner = None
+            if dry_run:
+                try:
+                    dry_runner = DryRunner(client)
+                except SubstrateRequestException:
+                    pass
+            pipeline = RemovePositionsPipeline(client, asset_ids, planner, dry_runner=dry_runner, keep_plan=True)
+            schedule_calls = list(pipeline.schedule_calls(check_farms))
+
+            plan.output_path = os.path.join(output_dir, f"{name}.{output_format}")
+            with open(plan.output_path, "wb") as f:
+                if output_format == "hex":
+                    f.write(b"0x")
+                writer = CallWriter(f, hex_output=output_format == "hex")
+                write_batch(client, schedule_calls, writer)
+        plan.positions = pipeline.planned
+        plan.deposit_count = sum(pipeline.deposit_counts.values())
+        plan.dropped = len(pipeline.dropped)
+        plan.length = writer.length
+        plan.hash = writer.hash
+    except Exception as e:
+        plan.error = str(e)
+    finally:
+        if client is not None:
+            client.close()
+    plan.duration = time.perf_counter() - start
+    return plan
+
+
+def fan_out(targets, asset_ids, on_plan = None, **kwargs) -> list:
+    """Plan every target concurrently, one process each, and return the plans in target order.
+
+    `on_plan(plan)` is called as soon as each network is done.
+    """
+    resolved = []
+    for target in targets:
+        name, urls = resolve_target(target)
+        # Plans are written and reported by name, so two targets on one host need distinct ones
+        taken = {name for name, _ in resolved}
+        unique, i = name, 2
+        while unique in taken:
+            unique, i = f"{name}-{i}", i + 1
+        resolved.append((unique, urls))
+    Path(kwargs.get("output_dir", ".")).mkdir(parents=True, exist_ok=True)
+    plans = {}
+    with ProcessPoolExecutor(max_workers=len(resolved)) as executor:
+        futures = {executor.submit(plan_network, name, urls, asset_ids, **kwargs): name for name, urls in resolved}
+        for future in as_completed(futures):
+            plan = future.result()
+            plans[futures[future]] = plan
+            if on_plan is not None:
+                on_plan(plan)
+    return [plans[name] for name, _ in resolved]
+
+
+def diff_plans(plans) -> dict:
+    """Positions that are not planned the same way on every network.
+
+    Maps position id -> {network: {"asset_id", "owner", "shares"} or None when missing there}, for
+    every position missing on some network or with a different asset, owner or shares.
+    """
+    plans = [plan for plan in plans if plan.error is None]
+    differences = {}
+    for position_id in sorted({position_id for plan in plans for position_id in plan.positions}):
+        entries = [plan.positions.get(position_id) for plan in plans]
+        if all(entry == entries[0] for entry in entries):
+            continue
+        differences[position_id] = {
+            plan.name: None if entry is None else {"asset_id": entry[0], "owner": entry[1], "shares": entry[2]}
+            for plan, entry in zip(plans, entries)
+        }
+    return differences
@@ -0,0 +1,80 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from substrateinterface import SubstrateInterface
+
+
+class FetchEngine:
+    """Spreads independent RPC reads across a bounded pool of connections.
+
+    Every worker thread owns its own SubstrateInterface, so requests run concurrently instead of
+    queueing on one websocket. Failed requests are retried with exponential backoff on a fresh
+    connection, and results are always returned in input order.
+    """
+
+    def __init__(self, url: str, concurrency: int = 4, retries: int = 3, backoff: float = 0.5, connect = None):
+        self.url = url
+        # Opens a worker connection; defaults to a SubstrateInterface on `url`
+        self.connect = connect
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        # Called with every new worker connection, e.g. to instrument it
+        self.on_connect = None
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chopchop-fetch")
+
+    def _api(self) -> SubstrateInterface:
+        api = getattr(self._local, "api", None)
+        if api is None:
+            if self.connect is not None:
+                api = self.connect()
+            else:
+                # Workers only issue raw RPC requests, so skip the chain preset discovery round trip
+                api = SubstrateInterface(url=self.url, auto_discover=False)
+            if self.on_connect is not None:
+                self.on_connect(api)
+            self._local.api = api
+            with self._lock:
+                self._connections.append(api)
+        return api
+
+    def _reset(self):
+        api = getattr(self._local, "api", None)
+        if api is not None:
+            self._local.api = None
+            with self._lock:
+                self._connections.remove(api)
+            try:
+                api.close()
+            except Exception:
+                pass
+
+    def _call(self, fn, item):
+        attempt = 0
+        while True:
+            try:
+                return fn(self._api(), item)
+            except Exception:
+                if attempt >= self.retries:
+                    raise
+                self._reset()
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+    def map(self, fn, items) -> list:
+        """Run `fn(api, item)` for every item on the worker pool and return the results in order."""
+        return list(self._executor.map(lambda item: self._call(fn, item), items))
+
+    def rpc_requests(self, method, list_of_params) -> list:
+        return self.map(lambda api, params: api.rpc_request(method, params), list_of_params)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for api in connections:
+            api.close()
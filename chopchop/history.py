@@ -0,0 +1,225 @@
+import gzip
+import json
+from itertools import islice
+
+from scalecodec.base import ScaleBytes
+from substrateinterface.storage import StorageKey
+
+from chopchop.client import Client
+from chopchop.pallets import Pallet
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.omnipool_lm import OmnipoolLM
+from chopchop.snapshot import DEPOSITS, NFTS, OMNI_POSITION_IDS, POSITIONS, capture_entries
+
+# Storage values holding the next id handed out, so that keys created during a range are known up front
+NEXT_POSITION_ID = ("Omnipool", "NextPositionId")
+DEPOSIT_SEQUENCER = ("OmnipoolWarehouseLM", "DepositSequencer")
+
+
+class ChangeLog:
+    """Changes of the snapshot maps over a block range, as raw storage values.
+
+    Keys are stored once, as "Module.Function" and params; the state at the start block and every
+    later change refer to them by index. Replaying the changes up to a block rebuilds the state at
+    that block, decoded in the same form `capture_entries` reads.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, start: tuple, end: tuple, keys: list, initial: dict, changes: list):
+        # (block number, block hash) of both ends of the range
+        self.start = start
+        self.end = end
+        # [name, params] of every key
+        self.keys = keys
+        # Key index -> hex value at the start block, for keys that held a value
+        self.initial = initial
+        # (block number, key index, hex value or None when removed), in block order
+        self.changes = changes
+
+    def raw_at(self, block_number: int) -> dict:
+        """Key index -> hex value at `block_number`."""
+        if not self.start[0] <= block_number <= self.end[0]:
+            raise ValueError(f"Block {block_number} is outside the scanned range {self.start[0]}-{self.end[0]}")
+        values = dict(self.initial)
+        for number, index, value in self.changes:
+            if number > block_number:
+                break
+            if value is None:
+                values.pop(index, None)
+            else:
+                values[index] = value
+        return values
+
+    def entries_at(self, api, block_number: int) -> dict:
+        """Decoded "Module.Function" -> {key: value} at `block_number`, like `capture_entries`.
+
+        Values are decoded with the runtime loaded on `api`.
+        """
+        decode = _decoder(api)
+        entries = {name: {} for name in (POSITIONS, DEPOSITS, OMNI_POSITION_IDS, NFTS)}
+        for index, value in self.raw_at(block_number).items():
+            name, params = self.keys[index]
+            entries[name][tuple(params)] = decode(name, value)
+        return entries
+
+    def decoded_changes(self, api):
+        """Yield (block number, name, key, previous value, value) of every change, decoded."""
+        decode = _decoder(api)
+        values = {index: decode(self.keys[index][0], value) for index, value in self.initial.items()}
+        for number, index, value in self.changes:
+            name, params = self.keys[index]
+            decoded = None if value is None else decode(name, value)
+            yield number, name, tuple(params), values.get(index), decoded
+            values[index] = decoded
+
+    def save(self, path):
+        data = {
+            "version": self.FORMAT_VERSION,
+            "start": list(self.start),
+            "end": list(self.end),
+            "keys": self.keys,
+            "initial": [[index, value] for index, value in self.initial.items()],
+            "changes": self.changes,
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @staticmethod
+    def load(path) -> "ChangeLog":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != ChangeLog.FORMAT_VERSION:
+            raise ValueError(f"Unsupported change log format version {data.get('version')}")
+        return ChangeLog(tuple(data["start"]), tuple(data["end"]), data["keys"], dict(data["initial"]),
+                         [tuple(change) for change in data["changes"]])
+
+
+def _decoder(api):
+    types = {}
+
+    def decode(name, value):
+        value_type = types.get(name)
+        if value_type is None:
+            module, func = name.split(".")
+            storage_function = api.metadata.get_metadata_pallet(module).get_storage_function(func)
+            value_type = types[name] = storage_function.get_value_type_string()
+        obj = api.runtime_config.create_scale_object(value_type, data=ScaleBytes(value), metadata=api.metadata)
+        return obj.decode()
+
+    return decode
+
+
+class RangeScanner(Pallet):
+    """Builds a ChangeLog of positions, deposits and their NFTs over a block range with state_queryStorage.
+
+    The range must not span a runtime upgrade, since every value is decoded with one runtime.
+
+    The keys to follow are those present at the start block plus the ones of every position and
+    deposit id handed out during the range. The range is split into chunks of `chunk_size` blocks
+    and the keys into batches of `key_batch`; every (chunk, batch) request runs concurrently on the
+    client's fetch engine. The node must still hold state for the whole range, e.g. an archive node.
+    """
+
+    def __init__(self, client: Client, chunk_size: int = 1000, key_batch: int = 250) -> None:
+        super().__init__(client)
+        self.chunk_size = chunk_size
+        self.key_batch = key_batch
+
+    def _next_id(self, storage, at) -> int | None:
+        module, func = storage
+        pallet = self._client.api.metadata.get_metadata_pallet(module)
+        if pallet is None or pallet.get_storage_function(func) is None:
+            return None
+        return int(self.query_entry(module, func, [], at=at).value)
+
+    def _keys(self, start_hash, end_hash) -> list:
+        """[name, params] of every key to follow, sorted."""
+        self._client.api.init_runtime(block_hash=start_hash)
+        entries = capture_entries(self._client, start_hash)
+        keys = {(name, key) for name, item in entries.items() for key in item}
+
+        first_position, last_position = self._next_id(NEXT_POSITION_ID, start_hash), self._next_id(NEXT_POSITION_ID, end_hash)
+        first_deposit, last_deposit = self._next_id(DEPOSIT_SEQUENCER, start_hash), self._next_id(DEPOSIT_SEQUENCER, end_hash)
+        if None in (first_position, last_position, first_deposit, last_deposit):
+            # Without id counters, fall back to the keys present at either end of the range
+            for name, item in capture_entries(self._client, end_hash).items():
+                keys.update((name, key) for key in item)
+        else:
+            for position_id in range(first_position, last_position):
+                keys.add((POSITIONS, (position_id,)))
+                keys.add((NFTS, (Omnipool.NFT_COLLECTION_ID, position_id)))
+            # The deposit sequencer holds the last id handed out
+            for deposit_id in range(first_deposit + 1, last_deposit + 1):
+                keys.add((DEPOSITS, (deposit_id,)))
+                keys.add((OMNI_POSITION_IDS, (deposit_id,)))
+                keys.add((NFTS, (OmnipoolLM.NFT_COLLECTION_ID, deposit_id)))
+        return [[name, list(key)] for name, key in sorted(keys)]
+
+    def _check_runtime(self, start_hash, end_hash):
+        """Refuse ranges across a runtime upgrade: a change log is decoded with a single runtime."""
+        api = self._client.api
+        start_version = api.get_block_runtime_version(start_hash)["specVersion"]
+        end_version = api.get_block_runtime_version(end_hash)["specVersion"]
+        if start_version != end_version:
+            raise ValueError(f"The runtime was upgraded within the range, from spec version {start_version} to "
+                             f"{end_version}: scan the blocks before and after the upgrade separately")
+
+    def _storage_keys(self, keys) -> list:
+        api = self._client.api
+        return [
+            StorageKey.create_from_storage_function(*name.split("."), params, runtime_config=api.runtime_config,
+                                                    metadata=api.metadata).to_hex()
+            for name, params in keys
+        ]
+
+    def _batches(self, items) -> list:
+        items = iter(items)
+        return list(iter(lambda: list(islice(items, self.key_batch)), []))
+
+    def scan(self, start: int, end: int) -> ChangeLog:
+        """Change log of blocks `start` to `end`, both included."""
+        if end < start:
+            raise ValueError("The range ends before it starts")
+        client = self._client
+        start_hash, end_hash = client.resolve_block_hash(start), client.resolve_block_hash(end)
+        self._check_runtime(start_hash, end_hash)
+
+        with client.stage("keys"):
+            keys = self._keys(start_hash, end_hash)
+            storage_keys = self._storage_keys(keys)
+            index_of = {storage_key: i for i, storage_key in enumerate(storage_keys)}
+            batches = self._batches(storage_keys)
+
+        with client.stage("initial state"):
+            initial = {}
+            for response in client.rpc_requests("state_queryStorageAt", [[batch, start_hash] for batch in batches]):
+                for change_set in response["result"]:
+                    initial.update((index_of[key], value) for key, value in change_set["changes"] if value is not None)
+
+        with client.stage("change sets"):
+            boundaries = [(first, min(first + self.chunk_size - 1, end)) for first in range(start + 1, end + 1, self.chunk_size)]
+            numbers = sorted({number for boundary in boundaries for number in boundary})
+            hashes = dict(zip(numbers, (response["result"] for response in
+                                        client.rpc_requests("chain_getBlockHash", [[number] for number in numbers]))))
+            requests = [(first, [batch, hashes[first], hashes[last]]) for first, last in boundaries for batch in batches]
+            responses = client.rpc_requests("state_queryStorage", [params for _, params in requests])
+
+            # Change sets only name their block by hash
+            changed_hashes = sorted({change_set["block"] for response in responses for change_set in response["result"]})
+            block_numbers = dict(zip(changed_hashes, (int(response["result"]["number"], 16) for response in
+                                                      client.rpc_requests("chain_getHeader", [[block_hash] for block_hash in changed_hashes]))))
+
+        # Every chunk reports the values at its first block as changes, so keep only real ones
+        raw_changes = sorted(
+            ((block_numbers[change_set["block"]], index_of[key], value)
+             for response in responses for change_set in response["result"] for key, value in change_set["changes"]),
+            key=lambda change: change[:2],
+        )
+        current = dict(initial)
+        changes = []
+        for number, index, value in raw_changes:
+            if current.get(index) != value:
+                changes.append((number, index, value))
+                current[index] = value
+        return ChangeLog((start, start_hash), (end, end_hash), keys, initial, changes)
@@ -0,0 +1,169 @@
+import queue
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from substrateinterface import SubstrateInterface
+
+from chopchop.client import Client
+from chopchop.pallets import Pallet
+from chopchop.pallets.omnipool import Omnipool, Position
+from chopchop.pallets.omnipool_lm import OmnipoolLM, OmnipoolWLM
+from chopchop.snapshot import DEPOSITS, NFTS, OMNI_POSITION_IDS, POSITIONS, capture_entries
+from chopchop.storage import MemoryStorage
+
+
+class PositionIndex(Pallet):
+    """In-memory index of Omnipool positions, farm deposits and their NFT owners.
+
+    The maps are loaded once. After that every new block only re-reads the keys its events touch:
+    positions named by Omnipool events, deposits named by liquidity mining events, and position
+    or deposit NFTs named by Uniques events. Lookups are then answered from memory, and the
+    captured state can also serve as a `MemoryStorage` backend for planning.
+
+    Events stand in for storage change subscriptions, which need every key up front and cannot
+    follow new positions by prefix. A change made without an event, such as a Root
+    System.set_storage, is therefore not seen. Runtime upgrades, whose migrations rewrite storage
+    silently, make the index load every map again at the first block of the new runtime.
+    """
+
+    def __init__(self, client: Client) -> None:
+        super().__init__(client)
+        self.block_hash = None
+        self.block_number = None
+        # Spec version of the runtime at `block_hash`; None for entries indexed without a node
+        self.spec_version = None
+        self.entries = {}
+        self._positions_by_asset = defaultdict(set)
+        # Omnipool position locked in a farm -> deposit holding it
+        self._deposit_of_position = {}
+
+    def load(self, at = None):
+        with self._client.snapshot(at) as block_hash:
+            entries = capture_entries(self._client, block_hash)
+        self.load_entries(entries, block_hash)
+
+    def load_entries(self, entries: dict, block_hash, block_number = None):
+        """Index entries captured elsewhere, e.g. rebuilt from a ChangeLog."""
+        self.entries = entries
+        if block_number is None:
+            self._set_block(block_hash)
+        else:
+            self.block_hash, self.block_number, self.spec_version = block_hash, block_number, None
+
+        self._positions_by_asset.clear()
+        for (position_id,), position in self.entries[POSITIONS].items():
+            self._positions_by_asset[position["asset_id"]].add(position_id)
+        self._deposit_of_position = {
+            position_id: deposit_id for (deposit_id,), position_id in self.entries[OMNI_POSITION_IDS].items()
+        }
+
+    def _set_block(self, block_hash, spec_version = None):
+        self.block_hash = block_hash
+        self.block_number = self._client.api.get_block_number(block_hash)
+        if spec_version is None:
+            spec_version = self._client.api.get_block_runtime_version(block_hash)["specVersion"]
+        self.spec_version = spec_version
+
+    @property
+    def storage(self) -> MemoryStorage:
+        return MemoryStorage(self.block_hash, self.entries)
+
+    def owner(self, position_id):
+        """Owner of a position, looking through the farm deposit when the position is locked in one."""
+        deposit_id = self._deposit_of_position.get(position_id)
+        if deposit_id is not None:
+            deposit = self.entries[NFTS].get((OmnipoolLM.NFT_COLLECTION_ID, deposit_id))
+            if deposit is not None:
+                return deposit["owner"]
+        nft = self.entries[NFTS].get((Omnipool.NFT_COLLECTION_ID, position_id))
+        return nft["owner"] if nft is not None else None
+
+    def positions(self, asset_id) -> list:
+        """(position_id, Position, owner) of every position in the asset's pool."""
+        return [
+            (position_id, Position.from_entry(self.entries[POSITIONS][(position_id,)]), self.owner(position_id))
+            for position_id in sorted(self._positions_by_asset.get(asset_id, ()))
+        ]
+
+    def _changed_keys(self, events) -> set:
+        keys = set()
+        for event in events:
+            module, attributes = event["module_id"], event["attributes"]
+            if not isinstance(attributes, dict):
+                continue
+            if module == Omnipool.MODULE_NAME and "position_id" in attributes:
+                keys.add((POSITIONS, (attributes["position_id"],)))
+            elif module in (OmnipoolLM.MODULE_NAME, OmnipoolWLM.MODULE_NAME) and "deposit_id" in attributes:
+                keys.add((DEPOSITS, (attributes["deposit_id"],)))
+                keys.add((OMNI_POSITION_IDS, (attributes["deposit_id"],)))
+            elif module == "Uniques" and attributes.get("collection") in (Omnipool.NFT_COLLECTION_ID, OmnipoolLM.NFT_COLLECTION_ID):
+                keys.add((NFTS, (attributes["collection"], attributes["item"])))
+        return keys
+
+    def apply_block(self, block_hash) -> int:
+        """Bring the index to `block_hash` by re-reading the keys touched by its events. Returns the number of keys read.
+
+        At the first block of a new runtime every map is loaded again instead.
+        """
+        spec_version = self._client.api.get_block_runtime_version(block_hash)["specVersion"]
+        if self.spec_version is not None and spec_version != self.spec_version:
+            self.load(block_hash)
+            return sum(len(item) for item in self.entries.values())
+
+        events = self.query_entry("System", "Events", [], at=block_hash).value
+        keys = sorted(self._changed_keys(events))
+        values = self.query_entries_multi_items(
+            [(*name.split("."), list(key)) for name, key in keys], at=block_hash
+        )
+        for (name, key), value in zip(keys, values):
+            self._update(name, key, value.value)
+        self._set_block(block_hash, spec_version)
+        return len(keys)
+
+    def _update(self, name, key, value):
+        previous = self.entries[name].pop(key, None)
+        if value is not None:
+            self.entries[name][key] = value
+
+        if name == POSITIONS:
+            if previous is not None:
+                self._positions_by_asset[previous["asset_id"]].discard(key[0])
+            if value is not None:
+                self._positions_by_asset[value["asset_id"]].add(key[0])
+        elif name == OMNI_POSITION_IDS:
+            if previous is not None:
+                self._deposit_of_position.pop(previous, None)
+            if value is not None:
+                self._deposit_of_position[value] = key[0]
+
+    def follow(self, finalized_only = True, on_block = None, stop: Optional[threading.Event] = None):
+        """Keep the index current, applying every block as it is announced until `stop` is set.
+
+        Heads are received on a subscription of their own connection, and every block between the
+        last applied one and the announced head is applied in order, so none are skipped.
+        """
+        heads = queue.Queue()
+        method = "chain_subscribeFinalizedHeads" if finalized_only else "chain_subscribeNewHeads"
+        subscriber = SubstrateInterface(url=self._client.api.url, auto_discover=False)
+
+        def handler(message, update_nr, subscription_id):
+            heads.put(int(message["params"]["result"]["number"], 16))
+            if stop is not None and stop.is_set():
+                return True
+
+        thread = threading.Thread(target=subscriber.rpc_request, args=(method, []),
+                                  kwargs={"result_handler": handler}, daemon=True)
+        thread.start()
+        try:
+            while stop is None or not stop.is_set():
+                try:
+                    head = heads.get(timeout=1)
+                except queue.Empty:
+                    continue
+                for number in range(self.block_number + 1, head + 1):
+                    changed = self.apply_block(self._client.api.get_block_hash(number))
+                    if on_block is not None:
+                        on_block(self, changed)
+        finally:
+            subscriber.close()
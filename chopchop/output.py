@@ -0,0 +1,124 @@
+from hashlib import blake2b
+
+from chopchop.calls import encode_compact
+from chopchop.checkpoint import EncodedCall
+
+# Largest preimage the Preimage pallet accepts
+PREIMAGE_MAX_SIZE = 4 * 1024 * 1024
+# Bytes left for the note_preimage call index, length prefix and the signed extrinsic around it
+NOTE_PREIMAGE_OVERHEAD = 1024
+
+
+class CallWriter:
+    """Writes encoded call bytes to a binary sink, as raw bytes or hex, hashing and counting them on the way."""
+
+    def __init__(self, sink = None, hex_output: bool = False):
+        self._sink = sink
+        self._hex_output = hex_output
+        self._hash = blake2b(digest_size=32)
+        self.length = 0
+
+    def write(self, data: bytes):
+        self._hash.update(data)
+        self.length += len(data)
+        if self._sink is not None:
+            self._sink.write(data.hex().encode() if self._hex_output else data)
+
+    @property
+    def hash(self) -> str:
+        return "0x" + self._hash.hexdigest()
+
+
+class _Tee:
+    def __init__(self, *writers):
+        self._writers = writers
+
+    def write(self, data: bytes):
+        for writer in self._writers:
+            writer.write(data)
+
+
+def batch_length(client, calls, func = "force_batch") -> int:
+    call_index = bytes.fromhex(client.call_template("Utility", func).call_index)
+    return len(call_index) + len(encode_compact(len(calls))) + sum(len(call.data) for call in calls)
+
+
+def write_batch(client, calls, writer, func = "force_batch"):
+    """Stream Utility.force_batch(calls) to `writer` without building the batch call itself."""
+    writer.write(bytes.fromhex(client.call_template("Utility", func).call_index))
+    writer.write(encode_compact(len(calls)))
+    for call in calls:
+        writer.write(bytes(call.data.data))
+
+
+def write_note_preimage(client, calls, writer) -> tuple:
+    """Stream Preimage.note_preimage(force_batch(calls)) to `writer`.
+
+    Returns the hash and length of the noted preimage, computed while it is written.
+    """
+    length = batch_length(client, calls)
+    writer.write(bytes.fromhex(client.call_template("Preimage", "note_preimage").call_index))
+    writer.write(encode_compact(length))
+    preimage = CallWriter()
+    write_batch(client, calls, _Tee(preimage, writer))
+    return preimage.hash, preimage.length
+
+
+def preimage_limit(client) -> int:
+    """Largest preimage that can be noted in one extrinsic of a normal block."""
+    max_length = client.api.get_constant("System", "BlockLength").value["max"]["normal"]
+    return min(PREIMAGE_MAX_SIZE, max_length) - NOTE_PREIMAGE_OVERHEAD
+
+
+def split_for_preimages(client, calls, limit) -> list:
+    """Split calls, in order, into groups whose force_batch fits in `limit` bytes."""
+    overhead = batch_length(client, [])
+    groups = []
+    group = []
+    length = overhead
+    for call in calls:
+        call_length = len(call.data)
+        if group and length + call_length + len(encode_compact(len(group) + 1)) - 1 > limit:
+            groups.append(group)
+            group = []
+            length = overhead
+        group.append(call)
+        length += call_length
+    if group:
+        groups.append(group)
+    return groups
+
+
+def schedule_delay(client, call) -> int:
+    """The `after` of an encoded Scheduler.schedule_after call, the u32 right after its call index."""
+    offset = _schedule_after_offset(client, call)
+    return int.from_bytes(bytes(call.data.data[offset:offset + 4]), "little")
+
+
+def rebase_preimages(client, groups) -> list:
+    """Shift the schedule_after delays of every group after the first so it starts where the first one does.
+
+    Delays count from the enactment of the preimage a call is in, so a group split off a plan must
+    not keep the delays it had in the whole plan.
+    """
+    if not groups:
+        return groups
+    start = schedule_delay(client, groups[0][0])
+    rebased = [groups[0]]
+    for group in groups[1:]:
+        shift = schedule_delay(client, group[0]) - start
+        rebased.append([_with_delay(client, call, schedule_delay(client, call) - shift) for call in group])
+    return rebased
+
+
+def _schedule_after_offset(client, call) -> int:
+    call_index = bytes.fromhex(client.call_template("Scheduler", "schedule_after").call_index)
+    if bytes(call.data.data[:len(call_index)]) != call_index:
+        raise ValueError("Only Scheduler.schedule_after calls can be split into preimages")
+    return len(call_index)
+
+
+def _with_delay(client, call, after: int) -> EncodedCall:
+    offset = _schedule_after_offset(client, call)
+    data = bytes(call.data.data)
+    return EncodedCall("0x" + (data[:offset] + after.to_bytes(4, "little") + data[offset + 4:]).hex())
@@ -1,3 +1,5 @@
+from itertools import islice
+
 from chopchop.client import Client
 
 
@@ -6,9 +8,61 @@ class Pallet:
     def __init__(self, client: Client):
         self._client = client
 
-    def query_entries(self, module, func, at = None):
-        entries = self._client.api.query_map(module, func, block_hash=at)
-        return entries
+    def _block_hash(self, at = None):
+        return self._client.block_hash if at is None else at
+
+    def query_entries(self, module, func, at = None, params = None) -> list:
+        with self._client.profile("storage", f"{module}.{func}"):
+            # query_map pages lazily, so read every page inside the span
+            return list(self._client.storage.query_map(module, func, params, at=self._block_hash(at)))
+
+    def query_entry_pages(self, module, func, page_size = 100, at = None, params = None):
+        """Yield the entries of a storage map one page at a time, as the pages arrive from the node."""
+        result = self._client.storage.query_map(module, func, params, at=self._block_hash(at), page_size=page_size)
+        # QueryMapResult.__iter__ starts over, so iterate it once through a generator that islice resumes
+        entries = (entry for entry in result)
+        while True:
+            with self._client.profile("storage", f"{module}.{func}"):
+                page = list(islice(entries, page_size))
+            if not page:
+                return
+            yield page
+
+    def query_raw_entry_pages(self, module, func, page_size = 100, at = None, params = None):
+        """Yield pages of undecoded (hex key, hex value) entries; only available when `storage.raw` is set."""
+        pages = iter(self._client.storage.query_map_raw_pages(module, func, params, at=self._block_hash(at), page_size=page_size))
+        while True:
+            with self._client.profile("storage", f"{module}.{func}"):
+                page = next(pages, None)
+            if page is None:
+                return
+            yield page
 
     def query_entry(self, module, func, params, at = None):
-        return self._client.api.query(module, func, params, block_hash=at)
+        with self._client.profile("storage", f"{module}.{func}"):
+            return self._client.storage.query(module, func, params, at=self._block_hash(at))
+
+    def query_entries_multi(self, module, func, list_of_params, at = None) -> list:
+        """Read many keys of one storage item, returning the decoded values in the order of `list_of_params`.
+
+        Over RPC, keys are fetched with chunked state_queryStorageAt calls. Missing entries decode the
+        same way `query_entry` does: to the storage default, or to None for optional storage.
+        """
+        with self._client.profile("storage", f"{module}.{func}"):
+            return self._client.storage.query_multi(module, func, list_of_params, at=self._block_hash(at))
+
+    def prepare_entries_multi(self, module, func, list_of_params, at = None):
+        """Build the keys of a `query_entries_multi` read without issuing it.
+
+        The read is issued with `fetch()`, which may run on another thread when a fetch engine is
+        configured, and decoded with `values()` on the calling thread.
+        """
+        return self._client.storage.prepare_multi_items(
+            [(module, func, params) for params in list_of_params], at=self._block_hash(at)
+        )
+
+    def query_entries_multi_items(self, requests, at = None) -> list:
+        """Read (module, function, params) keys that may belong to different storage items, in one batch."""
+        name = ",".join(sorted({f"{module}.{func}" for module, func, _ in requests}))
+        with self._client.profile("storage", name):
+            return self._client.storage.query_multi_items(requests, at=self._block_hash(at))
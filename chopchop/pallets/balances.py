@@ -24,7 +24,7 @@ class Balances(Pallet):
     def set_balance(self, who, dest, amount, wait_for_result=True):
         raise NotImplementedError
 
-    def create_set_balance(self, dest, currency_id, amount, wait_for_result=True):
+    def create_set_balance(self, dest, currency_id, amount, wait_for_result=True, sudo=True):
         call = create_call(self._client, 
                 "Balances" if currency_id == 0 else "Tokens",
                 self.EXTRINSICS["set_balance"], 
@@ -34,14 +34,21 @@ class Balances(Pallet):
                     "new_free": amount,
                     "new_reserved": 0
                     })
-        
+        if not sudo:
+            return call
+
         return create_call(client=self._client,
             module="Sudo",
             func="sudo",
             params={
-                "call": call.value,
+                "call": call,
             },
         )
 
-    def query_account_balance(self, account) -> int:
-        return self.query_entry("System", "Account", params=[account]).value["data"]["free"]
+    def query_account_balance(self, account, at = None) -> int:
+        return self.query_entry("System", "Account", params=[account], at=at).value["data"]["free"]
+
+    def query_account_balances(self, accounts, at = None) -> dict:
+        accounts = list(accounts)
+        entries = self.query_entries_multi("System", "Account", [[account] for account in accounts], at=at)
+        return {account: entry.value["data"]["free"] for account, entry in zip(accounts, entries)}
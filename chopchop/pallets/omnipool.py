@@ -1,10 +1,14 @@
 from collections import defaultdict
 from dataclasses import dataclass
 
+from substrateinterface.storage import StorageKey
+
+from chopchop.analytics import OmnipoolState, PositionTable
 from chopchop.client import Client, create_call, submit_extrinsic
 from chopchop.pallets import Pallet
 from chopchop.pallets.balances import Balances
 from chopchop.pallets.tokens import Tokens
+from chopchop.pallets.uniques import Uniques
 
 from typing import List, Dict, Optional
 
@@ -26,7 +30,7 @@ class InitParams:
     hdx_price: int
     stable_price: int
 
-@dataclass
+@dataclass(slots=True)
 class AssetState:
     reserve: int
     hub_reserve: int
@@ -53,7 +57,7 @@ def convert_usd_price_to_initial_price_for_omnipool(price: float) -> int:
     return int(price_in_lrna * one)
 
 
-@dataclass
+@dataclass(slots=True)
 class Position:
     asset_id: int
     amount: int
@@ -66,6 +70,23 @@ class Position:
                         entry["shares"],
                         entry["price"])
 
+    @staticmethod
+    def from_raw(data: bytes) -> "Position":
+        return Position(int.from_bytes(data[0:4], "little"), int.from_bytes(data[4:20], "little"),
+                        int.from_bytes(data[20:36], "little"),
+                        (int.from_bytes(data[36:52], "little"), int.from_bytes(data[52:68], "little")))
+
+
+def _u128(value: int) -> bytes:
+    return value.to_bytes(16, "little")
+
+
+# Omnipool.Positions as the raw decoders read it: keys end in the Blake2_128Concat hash of the u128
+# position id, values are Position { asset_id: u32, amount: u128, shares: u128, price: (u128, u128) }
+RAW_POSITION_PROBE = ({"asset_id": 1, "amount": 2, "shares": 3, "price": (4, 5)},
+                      (1).to_bytes(4, "little") + _u128(2) + _u128(3) + _u128(4) + _u128(5))
+RAW_POSITION_KEY_LENGTH = 2 + 2 * (32 + 16 + 16)
+
 
 class Omnipool(Pallet):
     ACCOUNT = "7L53bUTBbfuj14UpdCNPwmgzzHSsrsTWBHX5pys32mVWM3C1"
@@ -74,6 +95,8 @@ class Omnipool(Pallet):
 
     ASSET_STATE_STORAGE = "Assets"
 
+    NFT_COLLECTION_ID = 1337
+
     EXTRINSICS = {
         "add_token": "add_token",
         "init_call": "initialize_pool",
@@ -87,6 +110,8 @@ class Omnipool(Pallet):
         super().__init__(client)
         self._balances = Balances(self._client)
         self._tokens = Tokens(self._client)
+        # Whether Positions has the raw layout, per runtime version
+        self._raw_position_layouts = {}
 
     def create_add_token_call(self, who, asset_id, initial_price, cap ):
         call = create_call(self._client, self.MODULE_NAME, self.EXTRINSICS["add_token"], params={
@@ -100,40 +125,44 @@ class Omnipool(Pallet):
                            module="Sudo",
                            func="sudo",
                            params={
-                               "call": call.value,
+                               "call": call,
                            },
                            )
 
 
-    def add_token_call(self, who, asset: Asset):
+    def add_token_call(self, who, asset: Asset, sudo=True):
         call = create_call(self._client, self.MODULE_NAME, self.EXTRINSICS["add_token"], params={
             "asset": asset.asset_id,
             "initial_price": convert_usd_price_to_initial_price_for_omnipool(float(asset.initial_price)),
             "weight_cap": 1_000_000,
             "position_owner": who,
         })
+        if not sudo:
+            return call
 
         return create_call(client=self._client,
                            module="Sudo",
                            func="sudo",
                            params={
-                               "call": call.value,
+                               "call": call,
                            },
                            )
 
-    def init_call(self, who, params:InitParams ):
+    def init_call(self, who, params:InitParams, sudo=True):
         call = create_call(self._client, self.MODULE_NAME, self.EXTRINSICS["init_call"], params={
             "stable_asset_price": params.stable_price,
             "native_asset_price": params.hdx_price,
             "stable_weight_cap": params.stable_weight,
             "native_weight_cap": params.hdx_weight,
         })
+        if not sudo:
+            return call
 
         return create_call(client=self._client,
                            module="Sudo",
                            func="sudo",
                            params={
-                               "call": call.value,
+                               "call": call,
                            },
                            )
 
@@ -193,46 +222,121 @@ class Omnipool(Pallet):
         })
         return submit_extrinsic(self._client, who, call, wait_for_result)
 
-    def asset_states(self, at = None) -> List[AssetState]:
-        entries = self.query_entries(self.MODULE_NAME, self.ASSET_STATE_STORAGE, at=at)
+    def _asset_entries_with_reserves(self, at = None):
+        entries = [(asset_id.value, entry.value.copy()) for asset_id, entry in self.query_entries(self.MODULE_NAME, self.ASSET_STATE_STORAGE, at=at)]
+
+        # Native reserves live in System.Account, all others in Tokens.Accounts; read both in one batch
+        balances = self.query_entries_multi_items([
+            ("System", "Account", [self.ACCOUNT]) if asset_id == 0 else ("Tokens", "Accounts", [self.ACCOUNT, asset_id])
+            for asset_id, _ in entries
+        ], at=at)
 
-        states = []
+        for (asset_id, entry), balance in zip(entries, balances):
+            entry["reserve"] = balance.value["data"]["free"] if asset_id == 0 else balance.value["free"]
+        return entries
+
+    def asset_states(self, at = None) -> List[AssetState]:
+        return [AssetState.from_entry(asset_id, entry) for asset_id, entry in self._asset_entries_with_reserves(at=at)]
 
-        for asset_id, entry in entries:
-            if asset_id == 0:
-                reserve = self._balances.query_account_balance(self.ACCOUNT)
-            else:
-                reserve = self._tokens.query_account_balance(self.ACCOUNT, asset_id)
-            entry = entry.value.copy()
-            entry["reserve"] = reserve
-            states.append(AssetState.from_entry(asset_id, entry))
-        return states
+    def load_state(self, at = None) -> OmnipoolState:
+        """Load every asset state and reserve in bulk into a column layout for pool analytics."""
+        return OmnipoolState.from_asset_states(self.asset_states(at=at))
 
-    def asset_state(self, asset_id) -> AssetState:
-        entry = self.query_entry(self.MODULE_NAME, self.ASSET_STATE_STORAGE, params=[asset_id])
+    def asset_state(self, asset_id, at = None) -> AssetState:
+        entry = self.query_entry(self.MODULE_NAME, self.ASSET_STATE_STORAGE, params=[asset_id], at=at)
         if asset_id == 0:
-            reserve = self._balances.query_account_balance(self.ACCOUNT)
+            reserve = self._balances.query_account_balance(self.ACCOUNT, at=at)
         else:
-            reserve = self._tokens.query_account_balance(self.ACCOUNT, asset_id)
+            reserve = self._tokens.query_account_balance(self.ACCOUNT, asset_id, at=at)
         entry = entry.value.copy()
         entry["reserve"] = reserve
         return AssetState.from_entry(asset_id, entry)
 
-    def assets_hub_reserve(self) -> int:
-        states = self.asset_states()
-
-        return sum(state.hub_reserve for state in states)
-
-    def account_hub_reserve(self) -> int:
-        return self._tokens.query_account_balance(self.ACCOUNT, 1)
-
-    def retrieve_positions(self) -> Dict[int, AssetState]:
-        entries = self.query_entries(self.MODULE_NAME, "Positions")
-
-        return {position_id.value: Position.from_entry(entry.value) for position_id, entry in entries}
+    def assets_hub_reserve(self, at = None) -> int:
+        # Hub reserves are part of the asset state itself, reserves are not needed
+        entries = self.query_entries(self.MODULE_NAME, self.ASSET_STATE_STORAGE, at=at)
 
-    def positions_with_owner(self, owners) :
-        positions = self.retrieve_positions()
+        return sum(entry.value["hub_reserve"] for _, entry in entries)
+
+    def account_hub_reserve(self, at = None) -> int:
+        return self._tokens.query_account_balance(self.ACCOUNT, 1, at=at)
+
+    def retrieve_positions(self, at = None, *, asset_ids=None) -> Dict[int, Position]:
+        """Positions by id, keeping only positions of the given assets."""
+        return {
+            position_id: position
+            for page in self.iter_positions(asset_ids, page_size=1000, at=at)
+            for position_id, position in page
+        }
+
+    def _raw_positions(self, at = None) -> bool:
+        """Whether Positions can be read undecoded and parsed with the fixed layout for the runtime at `at`."""
+        if not self._client.storage.raw:
+            return False
+        api = self._client.api
+        api.init_runtime(block_hash=self._block_hash(at))
+        layout = self._raw_position_layouts.get(api.runtime_version)
+        if layout is None:
+            probe, expected = RAW_POSITION_PROBE
+            try:
+                storage_function = api.metadata.get_metadata_pallet(self.MODULE_NAME).get_storage_function("Positions")
+                value = api.runtime_config.create_scale_object(storage_function.get_value_type_string(), metadata=api.metadata)
+                key = StorageKey.create_from_storage_function(self.MODULE_NAME, "Positions", [7],
+                                                              runtime_config=api.runtime_config, metadata=api.metadata)
+                layout = bytes(value.encode(probe).data) == expected and key.to_hex().endswith(_u128(7).hex()) \
+                    and len(key.to_hex()) == RAW_POSITION_KEY_LENGTH
+            except Exception:
+                layout = False
+            self._raw_position_layouts[api.runtime_version] = layout
+        return layout
+
+    def iter_positions(self, asset_ids=None, page_size=100, at = None):
+        """Yield pages of (position_id, Position), keeping only positions of the given assets.
+
+        Where the runtime's layout allows, entries are parsed straight from the raw storage bytes and
+        other assets' positions are skipped after reading their asset id.
+        """
+        if not self._raw_positions(at):
+            for entries in self.query_entry_pages(self.MODULE_NAME, "Positions", page_size=page_size, at=at):
+                page = []
+                for position_id, entry in entries:
+                    position = Position.from_entry(entry.value)
+                    if asset_ids is None or position.asset_id in asset_ids:
+                        page.append((position_id.value, position))
+                yield page
+            return
+
+        for entries in self.query_raw_entry_pages(self.MODULE_NAME, "Positions", page_size=page_size, at=at):
+            page = []
+            with self._client.profile("decode", "Omnipool.Positions"):
+                for key, value in entries:
+                    data = bytes.fromhex(value[2:])
+                    if asset_ids is None or int.from_bytes(data[0:4], "little") in asset_ids:
+                        page.append((int.from_bytes(bytes.fromhex(key[-32:]), "little"), Position.from_raw(data)))
+            yield page
+
+    def position_table(self, asset_ids=None, page_size=1000, at = None) -> PositionTable:
+        """Position ids, asset ids and shares of the given assets' positions, in packed columns."""
+        table = PositionTable()
+        if not self._raw_positions(at):
+            for page in self.iter_positions(asset_ids, page_size=page_size, at=at):
+                for position_id, position in page:
+                    table.append(position_id, position.asset_id, position.shares)
+            return table
+
+        for entries in self.query_raw_entry_pages(self.MODULE_NAME, "Positions", page_size=page_size, at=at):
+            with self._client.profile("decode", "Omnipool.Positions"):
+                for key, value in entries:
+                    data = bytes.fromhex(value[2:])
+                    asset_id = int.from_bytes(data[0:4], "little")
+                    if asset_ids is None or asset_id in asset_ids:
+                        table.append_raw(bytes.fromhex(key[-32:]), asset_id, data[20:36])
+        return table
+
+    def positions_with_owner(self, owners=None, at = None) :
+        positions = self.retrieve_positions(at=at)
+        if owners is None:
+            owners = Uniques(self._client).query_owners(self.NFT_COLLECTION_ID, at=at)
 
         output = defaultdict(list)
         for (position_id, position)  in positions.items():
@@ -1,3 +1,5 @@
+from collections import defaultdict
+
 from chopchop.client import Client, create_call
 from chopchop.pallets import Pallet
 
@@ -12,8 +14,8 @@ class OmnipoolWLM(Pallet):
     def __init__(self, client: Client) -> None:
         super().__init__(client)
 
-    def get_deposit_positions(self, asset_id):
-        entries = self.query_entries(self.MODULE_NAME, "Deposit")
+    def get_deposit_positions(self, asset_id, at = None):
+        entries = self.query_entries(self.MODULE_NAME, "Deposit", at=at)
         positions = []
         for entry in entries:
             deposit_id= int(entry[0].value)
@@ -24,11 +26,38 @@ class OmnipoolWLM(Pallet):
 
         return positions
 
+    def get_deposit_positions_by_pool(self, asset_ids=None, at = None):
+        entries = self.query_entries(self.MODULE_NAME, "Deposit", at=at)
+        positions = defaultdict(list)
+        for entry in entries:
+            amm_pool_id = int(entry[1]["amm_pool_id"].value)
+            if asset_ids is not None and amm_pool_id not in asset_ids:
+                continue
+            deposit_id = int(entry[0].value)
+            farm_ids = [farm["yield_farm_id"].value for farm in entry[1]["yield_farm_entries"]]
+            positions[amm_pool_id].append((deposit_id, farm_ids))
+
+        return positions
+
+    def iter_deposit_positions(self, asset_ids=None, page_size=100, at = None):
+        """Yield pages of (amm_pool_id, deposit_id, farm_ids), keeping only deposits in the given pools."""
+        for entries in self.query_entry_pages(self.MODULE_NAME, "Deposit", page_size=page_size, at=at):
+            page = []
+            for entry in entries:
+                amm_pool_id = int(entry[1]["amm_pool_id"].value)
+                if asset_ids is not None and amm_pool_id not in asset_ids:
+                    continue
+                farm_ids = [farm["yield_farm_id"].value for farm in entry[1]["yield_farm_entries"]]
+                page.append((amm_pool_id, int(entry[0].value), farm_ids))
+            yield page
+
 
 class OmnipoolLM(Pallet):
 
     MODULE_NAME = "OmnipoolLiquidityMining"
 
+    NFT_COLLECTION_ID = 2584
+
     EXTRINSICS = {
     }
 
@@ -38,9 +67,25 @@ class OmnipoolLM(Pallet):
     def create_exit_farm_call(self, deposit_id, farm_ids):
         return create_call(self._client, self.MODULE_NAME, "exit_farms", params={
             "deposit_id": deposit_id,
-            "yield_farm_ids": [farm_ids],
+            "yield_farm_ids": list(farm_ids),
         })
 
-    def get_omnipool_position_id(self, deposit_id) -> int:
-        entry = self._client.api.query(self.MODULE_NAME, "OmniPositionId", [deposit_id])
+    def get_omnipool_position_id(self, deposit_id, at = None) -> int:
+        entry = self.query_entry(self.MODULE_NAME, "OmniPositionId", [deposit_id], at=at)
         return entry.value
+
+    def get_omnipool_position_ids(self, deposit_ids, at = None) -> dict:
+        with self._client.profile("storage", f"{self.MODULE_NAME}.OmniPositionId"):
+            return self.omnipool_position_ids_of(self.prepare_omnipool_position_ids(deposit_ids, at=at).fetch())
+
+    def prepare_omnipool_position_ids(self, deposit_ids, at = None):
+        """OmniPositionId read of the given deposits, for `omnipool_position_ids_of` once it is fetched."""
+        return self.prepare_entries_multi(self.MODULE_NAME, "OmniPositionId", [[deposit_id] for deposit_id in deposit_ids], at=at)
+
+    @staticmethod
+    def omnipool_position_ids_of(read) -> dict:
+        return {
+            params[0]: entry.value
+            for (_, _, params), entry in zip(read.requests, read.values())
+            if entry.value is not None
+        }
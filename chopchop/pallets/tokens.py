@@ -29,4 +29,9 @@ class Tokens(Pallet):
         raise NotImplementedError
 
     def query_account_balance(self, account, asset_id, at = None) -> int:
-        return self.query_entry(self.MODULE_NAME, "Accounts", params=[account, asset_id], at=at)["free"]
\ No newline at end of file
+        return self.query_entry(self.MODULE_NAME, "Accounts", params=[account, asset_id], at=at)["free"]
+
+    def query_account_balances(self, account, asset_ids, at = None) -> dict:
+        asset_ids = list(asset_ids)
+        entries = self.query_entries_multi(self.MODULE_NAME, "Accounts", [[account, asset_id] for asset_id in asset_ids], at=at)
+        return {asset_id: entry.value["free"] for asset_id, entry in zip(asset_ids, entries)}
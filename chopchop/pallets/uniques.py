@@ -12,9 +12,9 @@ class Uniques(Pallet):
     def __init__(self, client: Client) -> None:
         super().__init__(client)
 
-    def query_instances(self, collection_id) -> int:
+    def query_instances(self, collection_id, at = None) -> dict:
         #return self.query_entry(self.MODULE_NAME, "Asset", [collection_id, 2])
-        entries = self._client.api.query_map(self.MODULE_NAME, "Asset", [collection_id])
+        entries = self.query_entries(self.MODULE_NAME, "Asset", at=at, params=[collection_id])
         positions = {}
         for entry in entries:
             instance_id = int(entry[0].value)
@@ -23,7 +23,32 @@ class Uniques(Pallet):
 
         return positions
 
-    def query_owner(self, collection_id, instance_id) -> int:
+    def query_owner(self, collection_id, instance_id, at = None) -> int:
         #return self.query_entry(self.MODULE_NAME, "Asset", [collection_id, 2])
-        entry = self._client.api.query(self.MODULE_NAME, "Asset", [collection_id, instance_id])
+        entry = self.query_entry(self.MODULE_NAME, "Asset", [collection_id, instance_id], at=at)
         return entry["owner"].value
+
+    def query_owners(self, collection_id, instance_ids=None, at = None) -> dict:
+        """Resolve owners in bulk, either for a whole collection or for the given instances.
+
+        Instances that do not exist are left out of the result.
+        """
+        if instance_ids is None:
+            return self.query_instances(collection_id, at=at)
+
+        with self._client.profile("storage", f"{self.MODULE_NAME}.Asset"):
+            return self.owners_of(self.prepare_owners(collection_id, instance_ids, at=at).fetch())
+
+    def prepare_owners(self, collection_id, instance_ids, at = None):
+        """Owner read of the given instances, for `owners_of` once it is fetched."""
+        return self.prepare_entries_multi(
+            self.MODULE_NAME, "Asset", [[collection_id, instance_id] for instance_id in dict.fromkeys(instance_ids)], at=at
+        )
+
+    @staticmethod
+    def owners_of(read) -> dict:
+        return {
+            params[1]: entry.value["owner"]
+            for (_, _, params), entry in zip(read.requests, read.values())
+            if entry.value is not None
+        }
@@ -56,4 +56,12 @@ class Utility(Pallet):
                            )
         return call
 
-
+    def create_batch_all(self, calls):
+        call = create_call(client=self._client,
+                           module="Utility",
+                           func="batch_all",
+                           params={
+                               "calls": calls,
+                           },
+                           )
+        return call
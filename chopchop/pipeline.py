@@ -0,0 +1,321 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from chopchop.checkpoint import Checkpoint
+from chopchop.client import Client
+from chopchop.dryrun import DryRunner
+from chopchop.pallets.omnipool import Omnipool, Position
+from chopchop.pallets.omnipool_lm import OmnipoolWLM, OmnipoolLM
+from chopchop.pallets.scheduler import Scheduler
+from chopchop.pallets.uniques import Uniques
+from chopchop.pallets.utility import Utility
+from chopchop.planner import BatchPlanner, CallCost
+from substrateinterface.exceptions import SubstrateRequestException
+
+
+def with_lookups(pages, prepare, lookup, overlap=True):
+    """Yield (page, lookup(page, reads)) for every page, where `reads = prepare(page)` are the page's storage reads.
+
+    `prepare` and `lookup` run on the calling thread, which owns `api`. With `overlap`, the reads of
+    a page are fetched on a background thread while the next page is being read, so the two round
+    trips are not serialised. Only fetch-engine reads may overlap, as they never touch `api`.
+    """
+    if not overlap:
+        for page in pages:
+            yield page, lookup(page, _fetch_all(prepare(page)))
+        return
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="chopchop-lookup") as executor:
+        pending = None
+        for page in pages:
+            future = executor.submit(_fetch_all, prepare(page))
+            if pending is not None:
+                yield pending[0], lookup(pending[0], pending[1].result())
+            pending = (page, future)
+        if pending is not None:
+            yield pending[0], lookup(pending[0], pending[1].result())
+
+
+def _fetch_all(reads) -> list:
+    return [read.fetch() for read in reads]
+
+
+@dataclass
+class LayoutStats:
+    """Totals of the calls one layout schedules, as the planner estimates them."""
+    calls: int = 0
+    batches: int = 0
+    cost: CallCost = field(default_factory=lambda: CallCost(0, 0, 0))
+
+
+class RemovePositionsPipeline:
+    """Streams remove-positions planning from storage pages to scheduled force_batch calls.
+
+    Positions and deposits are read page by page and filtered by asset while decoding, owners of a
+    page are resolved while the next page is read, and every batch is scheduled as soon as the
+    planner fills it. Nothing but the scheduled calls is kept for the whole run.
+
+    With `group_size`, the calls of one owner are sent as one dispatch_as(owner, force_batch(...))
+    (or batch_all, with `group_batch`) of at most `group_size` calls, instead of one dispatch_as
+    each. Grouping needs every call of a stage before scheduling it, and records in `layouts` what
+    both layouts would schedule.
+    """
+
+    def __init__(self, client: Client, asset_ids, planner: BatchPlanner, page_size: int = 100,
+                 dry_runner: DryRunner | None = None, keep_plan: bool = False, checkpoint: Checkpoint | None = None,
+                 group_size: int | None = None, group_batch: str = "force_batch"):
+        if group_batch not in ("force_batch", "batch_all"):
+            raise ValueError(f"Unknown group batch {group_batch}, expected force_batch or batch_all")
+        self.asset_ids = set(asset_ids)
+        self.page_size = page_size
+        self.planner = planner
+        self.omnipool = Omnipool(client)
+        self.uniques = Uniques(client)
+        self.utility = Utility(client)
+        self.omnipool_wlm = OmnipoolWLM(client)
+        self.omnipool_lm = OmnipoolLM(client)
+        self.scheduler = Scheduler(client)
+        # Owner lookups are fetched alongside page reads over the engine's connections; their keys
+        # are built and their values decoded on the calling thread, the only one using `api`
+        self.overlap = client.engine is not None
+
+        self.deposit_counts = {asset_id: 0 for asset_id in asset_ids}
+        self.position_count = 0
+        self.batch_count = 0
+        # Omnipool positions locked in farms are owned by the deposit NFT owner
+        self.future_omni_pos_owners = {}
+
+        # With a dry runner, every batch is dry-run before it is scheduled and failing calls are dropped
+        self.dry_runner = dry_runner
+        # Packed batches dry-run together, as they are packed; one per engine connection
+        self.dry_run_window = client.engine.concurrency if client.engine is not None else 1
+        # (owner, exit call) freeing each farmed position, run ahead of the position's removal in dry runs
+        self.exit_calls = {}
+        # id of every exit call -> the position it frees
+        self._exit_positions = {}
+        self.dry_runs = []
+        self.dropped = []
+        # With keep_plan, position id -> (asset id, owner, shares) of every position removed
+        self.planned = {} if keep_plan else None
+        # Stage results are saved to and, on a resumed run, replayed from the checkpoint
+        self.checkpoint = checkpoint
+
+        self.group_size = group_size
+        self.group_batch = group_batch
+        # With grouping, LayoutStats of the "per call" and "per owner" layouts over every stage
+        self.layouts = {"per call": LayoutStats(), "per owner": LayoutStats()} if group_size else None
+
+    def _deposit_reads(self, page):
+        deposit_ids = [deposit_id for (_, deposit_id, _) in page]
+        return [self.uniques.prepare_owners(OmnipoolLM.NFT_COLLECTION_ID, deposit_ids),
+                self.omnipool_lm.prepare_omnipool_position_ids(deposit_ids)]
+
+    def _deposit_lookup(self, page, reads):
+        owners, omni_positions = reads
+        return Uniques.owners_of(owners), OmnipoolLM.omnipool_position_ids_of(omni_positions)
+
+    def exit_farm_calls(self):
+        for owner, call in self.exit_farm_items():
+            yield self.utility.create_dispatch_as_call(owner, call)
+
+    def exit_farm_items(self):
+        """Yield (owner, exit_farms call) of every deposit."""
+        pages = self.omnipool_wlm.iter_deposit_positions(self.asset_ids, page_size=self.page_size)
+        prepare, lookup = self._deposit_reads, self._deposit_lookup
+        if self.checkpoint is not None:
+            pages = self.checkpoint.pages("deposits", pages, list, lambda page: [tuple(deposit) for deposit in page])
+            prepare, lookup = self.checkpoint.cached("deposit owners", prepare, lookup, lambda page: _page_key(page, 1),
+                                                     lambda result: [list(result[0].items()), list(result[1].items())],
+                                                     lambda value: (dict(value[0]), dict(value[1])))
+        for page, (owners, omni_positions) in with_lookups(pages, prepare, lookup, self.overlap):
+            for (asset_id, deposit_id, farm_ids) in page:
+                owner = owners[deposit_id]
+                self.deposit_counts[asset_id] += 1
+                self.future_omni_pos_owners[omni_positions[deposit_id]] = owner
+                call = self.omnipool_lm.create_exit_farm_call(deposit_id, farm_ids)
+                if self.dry_runner is not None:
+                    self.exit_calls[omni_positions[deposit_id]] = (owner, call)
+                    self._exit_positions[id(call)] = omni_positions[deposit_id]
+                yield owner, call
+
+    def _position_reads(self, page):
+        return [self.uniques.prepare_owners(
+            Omnipool.NFT_COLLECTION_ID,
+            [position_id for (position_id, _) in page if position_id not in self.future_omni_pos_owners],
+        )]
+
+    def _position_lookup(self, page, reads):
+        owners = Uniques.owners_of(reads[0])
+        owners.update(
+            (position_id, self.future_omni_pos_owners[position_id])
+            for (position_id, _) in page if position_id in self.future_omni_pos_owners
+        )
+        return owners
+
+    def remove_liquidity_calls(self):
+        for owner, call in self.remove_liquidity_items():
+            yield self.utility.create_dispatch_as_call(owner, call)
+
+    def remove_liquidity_items(self):
+        """Yield (owner, remove_liquidity call) of every position."""
+        pages = self.omnipool.iter_positions(self.asset_ids, page_size=self.page_size)
+        prepare, lookup = self._position_reads, self._position_lookup
+        if self.checkpoint is not None:
+            pages = self.checkpoint.pages(
+                "positions", pages,
+                lambda page: [[position_id, position.asset_id, position.amount, position.shares, position.price]
+                              for position_id, position in page],
+                lambda page: [(position_id, Position(asset_id, amount, shares, tuple(price) if isinstance(price, list) else price))
+                              for position_id, asset_id, amount, shares, price in page],
+            )
+            prepare, lookup = self.checkpoint.cached("position owners", prepare, lookup, lambda page: _page_key(page, 0),
+                                                     lambda owners: list(owners.items()), dict)
+        for page, owners in with_lookups(pages, prepare, lookup, self.overlap):
+            for (position_id, position) in page:
+                self.position_count += 1
+                if self.planned is not None:
+                    self.planned[position_id] = (position.asset_id, owners[position_id], position.shares)
+                yield owners[position_id], self.omnipool.remove_liquidity_call(position_id, position.shares)
+
+    def _removal_prelude(self, call) -> list:
+        exit_item = self.exit_calls.get(_position_id(call))
+        return [self.utility.create_dispatch_as_call(*exit_item)] if exit_item is not None else []
+
+    def validate(self, batches, prelude = None) -> list:
+        """Dry-run every batch concurrently and return the calls that succeeded, in order.
+
+        `prelude(call)` gives calls the call depends on, which are run ahead of it in the same dry
+        run. Dropped calls are kept in `dropped` with their error. Only calls that fail as items of
+        the batch are dropped: a batch whose dry run fails as a whole raises SubstrateRequestException.
+        """
+        runs = []
+        for batch in batches:
+            before = [dependency for call in batch for dependency in prelude(call)] if prelude else []
+            runs.append((batch, before, self.utility.create_force_batch(before + batch)))
+        results = self.dry_runner.dry_run_many([dry_run_call for _, _, dry_run_call in runs])
+
+        kept = []
+        for (batch, before, _), result in zip(runs, results):
+            self.dry_runs.append((len(batch), result))
+            if not result.ok:
+                # An API error or a failure of force_batch itself says nothing about the calls
+                raise SubstrateRequestException(f"Dry run of a batch of {len(batch)} calls failed as a whole: {result.error}")
+            for i, call in enumerate(batch):
+                error = result.failed.get(len(before) + i)
+                if error is None:
+                    kept.append(call)
+                else:
+                    self._drop(call, error)
+        return kept
+
+    def validated(self, calls, prelude = None):
+        """Yield the calls that pass their dry run, validating `dry_run_window` packed batches at a time as they are packed."""
+        batches = []
+        for batch in self.planner.pack(calls):
+            batches.append(batch)
+            if len(batches) >= self.dry_run_window:
+                yield from self.validate(batches, prelude)
+                batches = []
+        if batches:
+            yield from self.validate(batches, prelude)
+
+    def _drop(self, call, error):
+        self.dropped.append((call, error))
+        position_id = self._exit_positions.pop(id(call.value["call_args"]["call"]), None)
+        if position_id is not None:
+            # The exit will not be scheduled, so the position's removal must not be dry-run after it
+            del self.exit_calls[position_id]
+        elif self.planned is not None and _is_removal(call):
+            # Only positions that are actually scheduled for removal are part of the plan
+            self.planned.pop(_position_id(call), None)
+
+    def _dispatch_group(self, owner, calls):
+        if len(calls) == 1:
+            return self.utility.create_dispatch_as_call(owner, calls[0])
+        if self.group_batch == "batch_all":
+            return self.utility.create_dispatch_as_call(owner, self.utility.create_batch_all(calls))
+        return self.utility.create_dispatch_as_call(owner, self.utility.create_force_batch(calls))
+
+    def group_calls(self, items):
+        """Yield one dispatch_as per owner and group of at most `group_size` calls, owners in order of first call.
+
+        A group also ends before it would exceed the planner's limit, so that every group still
+        fits in a scheduled batch.
+        """
+        by_owner = {}
+        for owner, call in items:
+            by_owner.setdefault(owner, []).append(call)
+        for owner, calls in by_owner.items():
+            group = []
+            total = CallCost(0, 0, 0)
+            for call in calls:
+                # Each call of the group is costed as its own dispatch_as, which bounds the group's cost from above
+                cost = self.planner.estimate(self.utility.create_dispatch_as_call(owner, call))
+                if group and (len(group) >= self.group_size or not (total + cost).fits(self.planner.limit)):
+                    yield self._dispatch_group(owner, group)
+                    group = []
+                    total = CallCost(0, 0, 0)
+                group.append(call)
+                total = total + cost
+            if group:
+                yield self._dispatch_group(owner, group)
+
+    def _measure(self, layout, calls):
+        stats = self.layouts[layout]
+        for batch in self.planner.pack(calls):
+            stats.batches += 1
+            for call in batch:
+                stats.calls += 1
+                stats.cost = stats.cost + self.planner.estimate(call)
+
+    def _group(self, items, prelude = None) -> list:
+        items = list(items)
+        calls = [self.utility.create_dispatch_as_call(owner, call) for owner, call in items]
+        if self.dry_runner is not None:
+            # Calls are dry-run one dispatch_as each, so that a failing call only drops itself
+            kept = {id(call) for call in self.validated(calls, prelude)}
+            items = [item for item, call in zip(items, calls) if id(call) in kept]
+            calls = [call for call in calls if id(call) in kept]
+        grouped = list(self.group_calls(items))
+        self._measure("per call", calls)
+        self._measure("per owner", grouped)
+        return grouped
+
+    def _schedule(self, items, start_delay, prelude = None):
+        if self.group_size:
+            calls = self._group(items, prelude)
+        else:
+            calls = (self.utility.create_dispatch_as_call(owner, call) for owner, call in items)
+            if self.dry_runner is not None:
+                # Regroup what is left once the failing calls are dropped
+                calls = self.validated(calls, prelude)
+        for i, batch in enumerate(self.planner.pack(calls)):
+            self.batch_count += 1
+            force_batch_call = self.utility.create_force_batch(batch)
+            yield self.scheduler.create_schedule_after_call(start_delay + i, force_batch_call)
+
+    def schedule_calls(self, check_farms=True):
+        """Yield schedule_after(force_batch(...)) calls; farms are exited before any liquidity is removed."""
+        if check_farms:
+            yield from self._schedule(self.exit_farm_items(), 1)
+        # block delay should be after all previous delays, leaving one block in between
+        yield from self._schedule(self.remove_liquidity_items(), self.batch_count + 2, self._removal_prelude)
+
+
+def _page_key(page, id_index) -> str:
+    """Identifies a page of a stage by its first and last ids, which are fixed at a pinned block."""
+    if not page:
+        return "empty"
+    return f"{page[0][id_index]}-{page[-1][id_index]}-{len(page)}"
+
+
+def _is_removal(dispatch_call) -> bool:
+    """Whether a dispatch_as call wraps a remove_liquidity call."""
+    inner = dispatch_call.value["call_args"]["call"]
+    return getattr(inner, "value", inner)["call_function"] == "remove_liquidity"
+
+
+def _position_id(remove_call):
+    """Position id of a dispatch_as(remove_liquidity) call."""
+    inner = remove_call.value["call_args"]["call"]
+    return getattr(inner, "value", inner)["call_args"]["position_id"]
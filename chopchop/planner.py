@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+
+from substrateinterface import Keypair
+
+from chopchop.client import Client
+
+
+@dataclass
+class CallCost:
+    ref_time: int
+    proof_size: int
+    length: int
+
+    def __add__(self, other: "CallCost") -> "CallCost":
+        return CallCost(self.ref_time + other.ref_time,
+                        self.proof_size + other.proof_size,
+                        self.length + other.length)
+
+    def fits(self, limit: "CallCost") -> bool:
+        return (self.ref_time <= limit.ref_time
+                and self.proof_size <= limit.proof_size
+                and self.length <= limit.length)
+
+
+def call_shape(value):
+    """Structure of a call value with all scalar arguments erased.
+
+    Calls of the same shape (same pallet, function and list lengths) have the same weight,
+    so one payment_queryInfo estimate can be reused for all of them.
+    """
+    if hasattr(value, "value_serialized"):
+        value = value.value
+    if isinstance(value, dict):
+        if "call_module" in value:
+            return value["call_module"], value["call_function"], call_shape(value.get("call_args", {}))
+        return tuple((key, call_shape(item)) for key, item in sorted(value.items()))
+    if isinstance(value, (list, tuple)):
+        return (len(value),) + tuple(call_shape(item) for item in value)
+    return None
+
+
+class BatchPlanner:
+    """Packs calls into batches that stay within a share of the block weight and length limits.
+
+    Call weights come from payment_queryInfo and are cached per call shape, call lengths are the
+    exact encoded sizes.
+    """
+
+    # Bytes reserved for the force_batch and schedule_after wrappers around every batch
+    WRAPPER_LENGTH = 64
+
+    def __init__(self, client: Client, block_share: float = 0.5, max_calls: int | None = None,
+                 weights: dict | None = None):
+        self._client = client
+        self.block_share = block_share
+        self.max_calls = max_calls
+        self.limit = self._block_limit()
+        # (ref_time, proof_size) per call shape, e.g. estimates saved in a state snapshot
+        self.weights = dict(weights or {})
+        self._keypair = Keypair.create_from_uri("//Alice", ss58_format=client.api.ss58_format)
+
+    def _block_limit(self) -> CallCost:
+        api = self._client.api
+        max_block = api.get_constant("System", "BlockWeights").value["max_block"]
+        max_length = api.get_constant("System", "BlockLength").value["max"]["normal"]
+
+        ref_time, proof_size = _weight_parts(max_block)
+        # Scheduled calls are executed within the scheduler's own weight budget
+        scheduler_weight = api.get_constant("Scheduler", "MaximumWeight")
+        if scheduler_weight is not None:
+            scheduler_ref_time, scheduler_proof_size = _weight_parts(scheduler_weight.value)
+            ref_time = min(ref_time, scheduler_ref_time)
+            proof_size = min(proof_size, scheduler_proof_size)
+
+        return CallCost(int(ref_time * self.block_share),
+                        int(proof_size * self.block_share),
+                        int(max_length * self.block_share) - self.WRAPPER_LENGTH)
+
+    def estimate(self, call) -> CallCost:
+        shape = call_shape(call)
+        if shape not in self.weights:
+            info = self._client.api.get_payment_info(call, self._keypair)
+            self.weights[shape] = _weight_parts(info["weight"])
+        ref_time, proof_size = self.weights[shape]
+        return CallCost(ref_time, proof_size, len(call.data))
+
+    def pack(self, calls):
+        """Greedily group calls into batches, yielding each batch as soon as it is full.
+
+        A call that exceeds the limit on its own is yielded as a batch of one.
+        """
+        batch = []
+        total = CallCost(0, 0, 0)
+        for call in calls:
+            cost = self.estimate(call)
+            full = self.max_calls is not None and len(batch) >= self.max_calls
+            if batch and (full or not (total + cost).fits(self.limit)):
+                yield batch
+                batch = []
+                total = CallCost(0, 0, 0)
+            batch.append(call)
+            total = total + cost
+        if batch:
+            yield batch
+
+
+def _weight_parts(weight) -> tuple:
+    if isinstance(weight, dict):
+        return int(weight["ref_time"]), int(weight.get("proof_size", 0))
+    # Pre weight-v2 runtimes report a single ref_time value
+    return int(weight), 0
@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+
+class Profiler:
+    """Records RPC requests, storage reads and SCALE encode/decode spans of a run.
+
+    Every span is tagged with the stage that was current when it started, so a run can be
+    summarised per stage. Spans may be recorded from any thread.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.stages = []
+        self.stage = None
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage_span(self, name):
+        """Mark a top-level stage of the run; spans started inside it are attributed to it."""
+        previous, self.stage = self.stage, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({"name": name, "start": start - self._start, "duration": time.perf_counter() - start})
+            self.stage = previous
+
+    @contextmanager
+    def span(self, category, name, **args):
+        """Time the body; the yielded dict may be updated with extra fields before it is recorded."""
+        record = {"category": category, "name": name, "stage": self.stage, "thread": threading.get_ident(), **args}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["start"] = start - self._start
+            record["duration"] = time.perf_counter() - start
+            with self._lock:
+                self.spans.append(record)
+
+    def instrument(self, api):
+        """Record every RPC request `api` makes, with its payload sizes and latency."""
+        rpc_request = api.rpc_request
+
+        def profiled_rpc_request(method, params, result_handler = None):
+            with self.span("rpc", method, request_bytes=len(json.dumps(params))) as record:
+                response = rpc_request(method, params, result_handler=result_handler)
+                record["response_bytes"] = len(json.dumps(response)) if response is not None else 0
+            return response
+
+        api.rpc_request = profiled_rpc_request
+        return api
+
+    def summary(self) -> dict:
+        """Totals per stage, and per RPC method and storage item within each stage."""
+        stages = {stage["name"]: {"duration": stage["duration"]} for stage in self.stages}
+        for span in self.spans:
+            stage = stages.setdefault(span["stage"], {"duration": None})
+            totals = stage.setdefault(span["category"], defaultdict(lambda: {"count": 0, "duration": 0.0, "request_bytes": 0, "response_bytes": 0}))
+            total = totals[span["name"]]
+            total["count"] += 1
+            total["duration"] += span["duration"]
+            total["request_bytes"] += span.get("request_bytes", 0)
+            total["response_bytes"] += span.get("response_bytes", 0)
+        return {name: {key: dict(value) if isinstance(value, defaultdict) else value for key, value in stage.items()}
+                for name, stage in stages.items()}
+
+    def report(self) -> str:
+        lines = []
+        for stage, totals in self.summary().items():
+            duration = totals.pop("duration")
+            lines.append(f"{stage or '(no stage)'}" + (f": {duration * 1000:.1f} ms" if duration is not None else ""))
+            for category in ("rpc", "storage", "decode", "encode"):
+                for name, total in sorted(totals.get(category, {}).items(), key=lambda item: -item[1]["duration"]):
+                    line = f"  {category:<8} {name:<48} {total['count']:>6} x {total['duration'] * 1000:>10.1f} ms"
+                    if category == "rpc":
+                        line += f"  {total['request_bytes']:>10} B out {total['response_bytes']:>12} B in"
+                    lines.append(line)
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump({"stages": self.stages, "spans": self.spans, "summary": self.summary()}, f, indent=1)
+
+    def write_chrome_trace(self, path):
+        """Write the spans in the Chrome trace event format (chrome://tracing, Perfetto)."""
+        events = [
+            {"name": stage["name"], "cat": "stage", "ph": "X", "pid": 1, "tid": 0,
+             "ts": stage["start"] * 1e6, "dur": stage["duration"] * 1e6}
+            for stage in self.stages
+        ]
+        for span in self.spans:
+            args = {key: value for key, value in span.items() if key not in ("category", "name", "thread", "start", "duration")}
+            events.append({"name": span["name"], "cat": span["category"], "ph": "X", "pid": 1, "tid": span["thread"],
+                           "ts": span["start"] * 1e6, "dur": span["duration"] * 1e6, "args": args})
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events}, f)
+
+
+def stage(profiler, name):
+    """`profiler.stage_span(name)`, or a no-op context when profiling is off."""
+    return profiler.stage_span(name) if profiler is not None else nullcontext()
+
+
+def profiled(profiler, category, name):
+    """`profiler.span(...)`, or a no-op context when profiling is off."""
+    return profiler.span(category, name) if profiler is not None else nullcontext({})
@@ -0,0 +1,232 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from chopchop.analytics import ONE, PERMILL, fee_complement, fixed_from_rational, fixed_mul_int, removal, removal_terms
+from chopchop.pallets.omnipool import AssetState, Position
+
+# LRNA, the hub asset every Omnipool asset is paired with
+HUB_ASSET_ID = 1
+
+
+@dataclass
+class Fees:
+    """Omnipool fees, in parts per million (Permill) like the runtime's dynamic fees."""
+    # Taken from the asset bought, left in the pool
+    asset_fee: int = 0
+    # Taken from the LRNA the asset sold is worth, leaving the pool
+    protocol_fee: int = 0
+    # Taken from what remove_liquidity pays out
+    withdrawal_fee: int = 0
+
+
+@dataclass(slots=True)
+class TradeQuote:
+    asset_in: int
+    asset_out: int
+    amount_in: int
+    amount_out: int
+    # Asset out withheld as asset fee
+    asset_fee: int
+    # LRNA withheld as protocol fee
+    protocol_fee: int
+    # LRNA taken out of the asset in's hub reserve and put into the asset out's
+    hub_in: int
+    hub_out: int
+    # 1 - effective price / spot price, fees included
+    price_impact: float
+
+
+@dataclass(slots=True)
+class LiquidityQuote:
+    asset_id: int
+    # Asset added, or paid out on removal after the withdrawal fee
+    amount: int
+    # Shares minted or burned
+    shares: int
+    # Change of the asset's hub reserve, negative on removal
+    hub_reserve_delta: int
+    # LRNA paid out to the position owner on removal
+    hub_amount: int = 0
+    # Shares moved to the protocol on removal of a position that lost value
+    protocol_shares: int = 0
+    # Asset withheld as withdrawal fee
+    fee: int = 0
+    # Position price (hub reserve, reserve) of an added position
+    price: Optional[tuple] = None
+
+
+class OmnipoolQuoter:
+    """Offline Omnipool quotes from AssetState snapshots, with the runtime's integer formulas.
+
+    Sell, buy, add_liquidity and remove_liquidity follow the runtime's formulas in FixedU128 and
+    u256 integer arithmetic with its rounding, given the same state and the fees in effect; fee
+    changes the trade itself triggers are not modelled. Every quote is independent; `apply` moves the quoter's own copy of the state
+    along a trade or liquidity change, for simulating sequences of them.
+
+    `fees` apply to every asset unless `asset_fees` has an entry for it; the asset fee and the
+    withdrawal fee of a trade or removal are those of the asset bought or removed.
+    """
+
+    def __init__(self, states, fees: Fees | None = None, asset_fees: dict | None = None):
+        self.states = {state.asset_id: replace(state) for state in states}
+        self.fees = fees or Fees()
+        self.asset_fees = asset_fees or {}
+
+    def _fees(self, asset_id) -> Fees:
+        return self.asset_fees.get(asset_id, self.fees)
+
+    def _state(self, asset_id) -> AssetState:
+        state = self.states.get(asset_id)
+        if state is None:
+            raise ValueError(f"Asset {asset_id} is not in the Omnipool")
+        return state
+
+    def spot_price(self, asset_in, asset_out) -> float:
+        """Units of `asset_out` one unit of `asset_in` is worth at spot."""
+        price_in = 1.0 if asset_in == HUB_ASSET_ID else self._state(asset_in).hub_reserve / self._state(asset_in).reserve
+        out = self._state(asset_out)
+        return price_in / (out.hub_reserve / out.reserve)
+
+    # Trades
+
+    def sell(self, asset_in, asset_out, amount) -> TradeQuote:
+        return self.sell_many(asset_in, asset_out, [amount])[0]
+
+    def sell_many(self, asset_in, asset_out, amounts) -> list:
+        """Quote selling each of `amounts` of `asset_in` for `asset_out` against the current state."""
+        out_state = self._state(asset_out)
+        out_reserve, out_hub = out_state.reserve, out_state.hub_reserve
+        asset_fee = self._fees(asset_out).asset_fee
+        spot = self.spot_price(asset_in, asset_out)
+
+        quotes = []
+        if asset_in == HUB_ASSET_ID:
+            # LRNA goes straight into the asset out's hub reserve, without protocol fee
+            for amount in amounts:
+                delta_reserve_out = out_reserve * amount // (out_hub + amount)
+                fee = asset_fee * delta_reserve_out // PERMILL
+                amount_out = delta_reserve_out - fee
+                quotes.append(TradeQuote(asset_in, asset_out, amount, amount_out, fee, 0, amount, amount,
+                                         _impact(amount, amount_out, spot)))
+            return quotes
+
+        in_state = self._state(asset_in)
+        in_reserve, in_hub = in_state.reserve, in_state.hub_reserve
+        protocol_complement = fee_complement(self._fees(asset_in).protocol_fee)
+        for amount in amounts:
+            hub_in = amount * in_hub // (in_reserve + amount)
+            hub_out = fixed_mul_int(protocol_complement, hub_in)
+            delta_reserve_out = out_reserve * hub_out // (out_hub + hub_out)
+            fee = asset_fee * delta_reserve_out // PERMILL
+            amount_out = delta_reserve_out - fee
+            quotes.append(TradeQuote(asset_in, asset_out, amount, amount_out, fee, hub_in - hub_out, hub_in, hub_out,
+                                     _impact(amount, amount_out, spot)))
+        return quotes
+
+    def buy(self, asset_in, asset_out, amount) -> TradeQuote:
+        return self.buy_many(asset_in, asset_out, [amount])[0]
+
+    def buy_many(self, asset_in, asset_out, amounts) -> list:
+        """Quote buying each of `amounts` of `asset_out` with `asset_in` against the current state.
+
+        Amounts the pool cannot provide raise ValueError.
+        """
+        out_state = self._state(asset_out)
+        out_reserve, out_hub = out_state.reserve, out_state.hub_reserve
+        asset_fee = self._fees(asset_out).asset_fee
+        out_after_fee = fixed_mul_int(fee_complement(asset_fee), out_reserve)
+        spot = self.spot_price(asset_in, asset_out)
+
+        if asset_in != HUB_ASSET_ID:
+            in_state = self._state(asset_in)
+            in_reserve, in_hub = in_state.reserve, in_state.hub_reserve
+            protocol_complement = fee_complement(self._fees(asset_in).protocol_fee)
+
+        quotes = []
+        for amount in amounts:
+            if amount >= out_after_fee:
+                raise ValueError(f"Cannot buy {amount} of asset {asset_out}: the pool holds {out_reserve}")
+            hub_out = out_hub * amount // (out_after_fee - amount) + 1
+            fee = asset_fee * amount // (PERMILL - asset_fee) if asset_fee < PERMILL else 0
+            if asset_in == HUB_ASSET_ID:
+                quotes.append(TradeQuote(asset_in, asset_out, hub_out, amount, fee, 0, hub_out, hub_out,
+                                         _impact(hub_out, amount, spot)))
+                continue
+            # FixedU128 division of the LRNA needed by 1 - protocol fee, rounding down
+            hub_in = hub_out * ONE // protocol_complement
+            if hub_in >= in_hub:
+                raise ValueError(f"Cannot buy {amount} of asset {asset_out} with asset {asset_in}: not enough LRNA")
+            amount_in = in_reserve * hub_in // (in_hub - hub_in) + 1
+            quotes.append(TradeQuote(asset_in, asset_out, amount_in, amount, fee, hub_in - hub_out, hub_in, hub_out,
+                                     _impact(amount_in, amount, spot)))
+        return quotes
+
+    # Liquidity
+
+    def add_liquidity(self, asset_id, amount) -> LiquidityQuote:
+        return self.add_liquidity_many(asset_id, [amount])[0]
+
+    def add_liquidity_many(self, asset_id, amounts) -> list:
+        state = self._state(asset_id)
+        price = fixed_from_rational(state.hub_reserve, state.reserve)
+        return [
+            LiquidityQuote(asset_id, amount, state.shares * amount // state.reserve, fixed_mul_int(price, amount),
+                           price=(state.hub_reserve, state.reserve))
+            for amount in amounts
+        ]
+
+    def remove_liquidity(self, position: Position, shares: int | None = None) -> LiquidityQuote:
+        """Quote removing `shares` (default: all) of a position at its entry price."""
+        return self._remove(self._removal_terms(position.asset_id), position.asset_id,
+                            position.shares if shares is None else shares, position.price)
+
+    def remove_liquidity_many(self, positions) -> list:
+        """Quote removing each Position in full, e.g. every position of a clean-up."""
+        terms = {}
+        quotes = []
+        for position in positions:
+            asset_terms = terms.get(position.asset_id)
+            if asset_terms is None:
+                asset_terms = terms[position.asset_id] = self._removal_terms(position.asset_id)
+            quotes.append(self._remove(asset_terms, position.asset_id, position.shares, position.price))
+        return quotes
+
+    def _removal_terms(self, asset_id) -> tuple:
+        state = self._state(asset_id)
+        return removal_terms(state.reserve, state.hub_reserve, state.shares, self._fees(asset_id).withdrawal_fee)
+
+    @staticmethod
+    def _remove(terms, asset_id, shares_removed, price) -> LiquidityQuote:
+        amount, delta_shares, delta_hub_reserve, hub_amount, protocol_shares, fee = removal(terms, shares_removed, price)
+        return LiquidityQuote(asset_id, amount, delta_shares, -delta_hub_reserve, hub_amount, protocol_shares, fee)
+
+    # Simulation
+
+    def apply(self, quote: TradeQuote | LiquidityQuote):
+        """Move the quoter's state along a quoted trade or liquidity change."""
+        if isinstance(quote, TradeQuote):
+            if quote.asset_in != HUB_ASSET_ID:
+                state = self.states[quote.asset_in]
+                self.states[quote.asset_in] = replace(state, reserve=state.reserve + quote.amount_in,
+                                                      hub_reserve=state.hub_reserve - quote.hub_in)
+            state = self.states[quote.asset_out]
+            self.states[quote.asset_out] = replace(state, reserve=state.reserve - quote.amount_out,
+                                                   hub_reserve=state.hub_reserve + quote.hub_out)
+            return
+        state = self.states[quote.asset_id]
+        if quote.price is not None:
+            self.states[quote.asset_id] = replace(state, reserve=state.reserve + quote.amount,
+                                                  hub_reserve=state.hub_reserve + quote.hub_reserve_delta,
+                                                  shares=state.shares + quote.shares)
+        else:
+            # The withdrawal fee stays in the pool
+            self.states[quote.asset_id] = replace(state, reserve=state.reserve - quote.amount,
+                                                  hub_reserve=state.hub_reserve + quote.hub_reserve_delta,
+                                                  shares=state.shares - quote.shares,
+                                                  protocol_shares=state.protocol_shares + quote.protocol_shares)
+
+
+def _impact(amount_in, amount_out, spot) -> float:
+    if not amount_in or not spot:
+        return 0.0
+    return 1 - (amount_out / amount_in) / spot
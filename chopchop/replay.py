@@ -0,0 +1,263 @@
+import gzip
+import json
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+
+from substrateinterface import SubstrateInterface
+from substrateinterface.exceptions import SubstrateRequestException
+from substrateinterface.storage import StorageKey
+
+from chopchop.client import Client
+from chopchop.fetch import FetchEngine
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.omnipool_lm import OmnipoolLM
+from chopchop.snapshot import DEPOSITS, NFTS, OMNI_POSITION_IDS, POSITIONS
+
+# Requests SubstrateInterface makes while connecting, before a recorder can be attached
+CONNECT_METHODS = ["system_chain", "system_properties", "system_name", "system_version", "rpc_methods"]
+# Requests answered from the recorded storage rather than from recorded responses
+STORAGE_METHODS = ("state_getKeysPaged", "state_queryStorageAt", "state_getStorage", "state_getStorageAt")
+# Answered with any recorded response of the method when the exact request was not recorded: a
+# recording covers a single block, and fee estimates are only used to pack batches
+FALLBACK_METHODS = ("chain_getHeader", "state_getRuntimeVersion", "chain_getRuntimeVersion", "state_getMetadata",
+                    "payment_queryInfo", "state_call")
+
+
+def _params_key(params) -> str:
+    return json.dumps(params, separators=(",", ":"))
+
+
+def _fallback_key(method, params):
+    # Runtime API calls are only interchangeable when they call the same API function
+    return (method, params[0]) if method == "state_call" and params else (method, None)
+
+
+class Recording:
+    """JSON-RPC responses of a run, keyed by method and parameters."""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, responses: dict | None = None, block_hash: str | None = None):
+        self.responses = {}
+        self._fallbacks = {}
+        # Block the recorded run was pinned to
+        self.block_hash = block_hash
+        self._lock = threading.Lock()
+        for (method, params), response in (responses or {}).items():
+            self._add(method, json.loads(params), response)
+
+    def _add(self, method, params, response):
+        self.responses[(method, _params_key(params))] = response
+        if method in FALLBACK_METHODS:
+            self._fallbacks[_fallback_key(method, params)] = response
+
+    def add(self, method, params, response):
+        with self._lock:
+            self._add(method, params, {"result": response.get("result")})
+
+    def get(self, method, params) -> dict | None:
+        response = self.responses.get((method, _params_key(params)))
+        if response is None and method in FALLBACK_METHODS:
+            response = self._fallbacks.get(_fallback_key(method, params))
+        return response
+
+    def raw_storage(self) -> "RawStorage":
+        """Every storage value the recorded run read, as raw hex key -> hex value."""
+        values = {}
+        for (method, params), response in self.responses.items():
+            if method == "state_queryStorageAt":
+                for result_group in response["result"]:
+                    values.update((key, data) for key, data in result_group["changes"] if data is not None)
+            elif method in ("state_getStorage", "state_getStorageAt") and response["result"] is not None:
+                values[json.loads(params)[0]] = response["result"]
+        return RawStorage(values)
+
+    def save(self, path):
+        data = {
+            "version": self.FORMAT_VERSION,
+            "block_hash": self.block_hash,
+            "responses": [[method, json.loads(params), response] for (method, params), response in self.responses.items()],
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @staticmethod
+    def load(path) -> "Recording":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != Recording.FORMAT_VERSION:
+            raise ValueError(f"Unsupported recording format version {data.get('version')}")
+        return Recording(
+            responses={(method, _params_key(params)): response for method, params, response in data["responses"]},
+            block_hash=data["block_hash"],
+        )
+
+
+class Recorder:
+    """Records the successful RPC responses of a client's connections into a Recording."""
+
+    def __init__(self):
+        self.recording = Recording()
+
+    def instrument(self, api):
+        rpc_request = api.rpc_request
+
+        def recorded_rpc_request(method, params, result_handler = None):
+            response = rpc_request(method, params, result_handler=result_handler)
+            # Subscriptions cannot be replayed
+            if result_handler is None:
+                self.recording.add(method, params, response)
+            return response
+
+        api.rpc_request = recorded_rpc_request
+        return api
+
+    def attach(self, client: Client):
+        self.instrument(client.api)
+        for method in CONNECT_METHODS:
+            try:
+                client.api.rpc_request(method, [])
+            except SubstrateRequestException:
+                pass
+
+        if client.engine is not None:
+            on_connect = client.engine.on_connect
+
+            def record_connection(api):
+                if on_connect is not None:
+                    on_connect(api)
+                self.instrument(api)
+
+            client.engine.on_connect = record_connection
+
+
+class RawStorage:
+    """Raw chain storage (hex key -> hex value) answering the state RPCs storage reads are made of."""
+
+    def __init__(self, values: dict):
+        self.values = values
+        self._keys = None
+
+    def update(self, values: dict):
+        self.values.update(values)
+        self._keys = None
+
+    def _sorted_keys(self) -> list:
+        if self._keys is None:
+            self._keys = sorted(self.values)
+        return self._keys
+
+    def answer(self, method, params):
+        if method == "state_getKeysPaged":
+            prefix, count = params[0], params[1]
+            start_key = params[2] if len(params) > 2 and params[2] else prefix
+            keys = self._sorted_keys()
+            page = []
+            index = bisect_right(keys, start_key)
+            while index < len(keys) and len(page) < count and keys[index].startswith(prefix):
+                page.append(keys[index])
+                index += 1
+            return page
+        if method == "state_queryStorageAt":
+            keys, block_hash = params[0], params[1] if len(params) > 1 else None
+            return [{"block": block_hash, "changes": [[key, self.values.get(key)] for key in keys]}]
+        return self.values.get(params[0])
+
+
+class ReplaySocket:
+    """Stand-in websocket serving a Recording, optionally with raw storage and a simulated round trip latency.
+
+    Requests that were not recorded fail, so nothing can silently fall back to a live node.
+    """
+
+    def __init__(self, recording: Recording, storage: RawStorage | None = None, latency: float = 0.0):
+        self._recording = recording
+        self._storage = storage
+        self._latency = latency
+        self._messages = deque()
+
+    def send(self, payload):
+        request = json.loads(payload)
+        method, params = request["method"], request.get("params", [])
+        if self._storage is not None and method in STORAGE_METHODS:
+            response = {"result": self._storage.answer(method, params)}
+        else:
+            response = self._recording.get(method, params)
+        if response is None:
+            response = {"error": {"code": -32601, "message": f"{method}({_params_key(params)}) was not recorded"}}
+        self._messages.append(json.dumps({"jsonrpc": "2.0", "id": request["id"], **response}))
+
+    def recv(self):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._messages.popleft()
+
+    def close(self):
+        pass
+
+
+def initialize_replay_client(recording: Recording, storage: RawStorage | None = None, latency: float = 0.0,
+                             concurrency: int = 1) -> Client:
+    """Client whose connections are served from a recording instead of a node."""
+    storage = storage if storage is not None else recording.raw_storage()
+    api = SubstrateInterface(websocket=ReplaySocket(recording, storage, latency))
+    engine = None
+    if concurrency > 1:
+        engine = FetchEngine(None, concurrency=concurrency, connect=lambda: SubstrateInterface(
+            websocket=ReplaySocket(recording, storage, latency), auto_discover=False
+        ))
+    return Client(api=api, engine=engine)
+
+
+def scale_entries(entries: dict, positions: int) -> dict:
+    """Grow captured state to `positions` Omnipool positions by cloning the existing ones.
+
+    Every clone gets a fresh position id and its own position NFT. A clone of a position locked in
+    a farm also gets a fresh deposit, deposit NFT and OmniPositionId entry.
+    """
+    sources = sorted(entries[POSITIONS].items())
+    if not sources:
+        raise ValueError("No positions to clone")
+    deposit_of_position = {position_id: deposit_id for (deposit_id,), position_id in entries[OMNI_POSITION_IDS].items()}
+
+    scaled = {name: dict(item) for name, item in entries.items()}
+    next_position_id = max(position_id for (position_id,), _ in sources) + 1
+    next_deposit_id = max((deposit_id for (deposit_id,) in entries[DEPOSITS]), default=0) + 1
+    clone = 0
+    while len(scaled[POSITIONS]) < positions:
+        (position_id,), position = sources[clone % len(sources)]
+        clone += 1
+
+        scaled[POSITIONS][(next_position_id,)] = position
+        nft = entries[NFTS].get((Omnipool.NFT_COLLECTION_ID, position_id))
+        if nft is not None:
+            scaled[NFTS][(Omnipool.NFT_COLLECTION_ID, next_position_id)] = nft
+
+        deposit_id = deposit_of_position.get(position_id)
+        if deposit_id is not None and (deposit_id,) in entries[DEPOSITS]:
+            scaled[DEPOSITS][(next_deposit_id,)] = entries[DEPOSITS][(deposit_id,)]
+            scaled[OMNI_POSITION_IDS][(next_deposit_id,)] = next_position_id
+            deposit_nft = entries[NFTS].get((OmnipoolLM.NFT_COLLECTION_ID, deposit_id))
+            if deposit_nft is not None:
+                scaled[NFTS][(OmnipoolLM.NFT_COLLECTION_ID, next_deposit_id)] = deposit_nft
+            next_deposit_id += 1
+        next_position_id += 1
+    return scaled
+
+
+def encode_entries(api: SubstrateInterface, entries: dict) -> dict:
+    """Encode "Module.Function" -> {key: value} entries to raw hex storage with the loaded runtime."""
+    values = {}
+    for name, item in entries.items():
+        module, func = name.split(".")
+        storage_function = api.metadata.get_metadata_pallet(module).get_storage_function(func)
+        value_type = storage_function.get_value_type_string()
+        for key, value in item.items():
+            storage_key = StorageKey.create_from_storage_function(
+                module, func, list(key), runtime_config=api.runtime_config, metadata=api.metadata
+            )
+            value_obj = api.runtime_config.create_scale_object(value_type, metadata=api.metadata)
+            values[storage_key.to_hex()] = value_obj.encode(value).to_hex()
+    return values
@@ -0,0 +1,152 @@
+import json
+from dataclasses import dataclass, field
+from typing import Optional
+
+from substrateinterface import Keypair
+
+from chopchop.client import Client, create_call
+from chopchop.pallets.balances import Balances
+from chopchop.pallets.omnipool import Asset, InitParams, Omnipool
+from chopchop.pallets.utility import Utility
+from chopchop.planner import BatchPlanner
+
+
+@dataclass
+class AccountBalance:
+    # Address or dev key URI such as "//Alice"; with `count`, the prefix of "//lp/0", "//lp/1", ...
+    account: str
+    currency_id: int
+    amount: int
+    count: Optional[int] = None
+
+
+@dataclass
+class LiquidityPosition:
+    account: str
+    asset_id: int
+    amount: int
+    count: Optional[int] = None
+    # Positions added by every account
+    positions: int = 1
+
+
+@dataclass
+class SeedSpec:
+    """Declarative Omnipool environment: pool initialisation, assets, balances and LP positions.
+
+    Loaded from a JSON file such as:
+
+        {
+          "init": {"hdx_amount": ..., "stable_amount": ..., "hdx_weight": ..., "stable_weight": ...,
+                   "hdx_price": ..., "stable_price": ..., "stable_asset_id": 2},
+          "assets": [{"symbol": "DOT", "name": "Polkadot", "initial_price": 5.0, "decimals": 10,
+                      "asset_id": 5, "reserve": 1000000000000000}],
+          "balances": [{"account": "//lp", "count": 1000, "currency_id": 5, "amount": 10000000000000}],
+          "positions": [{"account": "//lp", "count": 1000, "asset_id": 5, "amount": 1000000000000, "positions": 2}]
+        }
+
+    `reserve` of an asset and the init amounts (when `stable_asset_id` is given) are set as balances
+    of the Omnipool account ahead of the calls that need them.
+    """
+    init: Optional[InitParams] = None
+    stable_asset_id: Optional[int] = None
+    assets: list = field(default_factory=list)
+    # Asset id -> reserve the Omnipool account is funded with before the asset is added
+    reserves: dict = field(default_factory=dict)
+    # Position owner of every added asset's initial liquidity; the sudo key when not given
+    token_owner: Optional[str] = None
+    balances: list = field(default_factory=list)
+    positions: list = field(default_factory=list)
+
+    @staticmethod
+    def load(path) -> "SeedSpec":
+        with open(path) as f:
+            data = json.load(f)
+        spec = SeedSpec(token_owner=data.get("token_owner"))
+        if "init" in data:
+            init = dict(data["init"])
+            spec.stable_asset_id = init.pop("stable_asset_id", None)
+            spec.init = InitParams(**init)
+        for asset in data.get("assets", []):
+            asset = dict(asset)
+            reserve = asset.pop("reserve", None)
+            spec.assets.append(Asset(**asset))
+            if reserve:
+                spec.reserves[asset["asset_id"]] = reserve
+        spec.balances = [AccountBalance(**balance) for balance in data.get("balances", [])]
+        spec.positions = [LiquidityPosition(**position) for position in data.get("positions", [])]
+        return spec
+
+
+def expand_accounts(account: str, count: Optional[int]) -> list:
+    """The account itself, or `count` derived dev accounts "<account>/0" ... when a count is given."""
+    if count is None:
+        return [account]
+    return [f"{account}/{i}" for i in range(count)]
+
+
+class SeedCompiler:
+    """Compiles a SeedSpec into Root calls, in the order they must run.
+
+    Balances come first, then pool initialisation, the assets and finally the positions, each
+    added as dispatch_as(account, add_liquidity). Compiled calls are packed by the planner into
+    sudo(force_batch(...)) calls, so one extrinsic carries as many calls as fit in a block share.
+    """
+
+    def __init__(self, client: Client, planner: BatchPlanner, sudo_address: str):
+        self._client = client
+        self.planner = planner
+        self.sudo_address = sudo_address
+        self.omnipool = Omnipool(client)
+        self.balances = Balances(client)
+        self.utility = Utility(client)
+        self._addresses = {}
+        self.counts = {"balances": 0, "init": 0, "assets": 0, "positions": 0}
+
+    def address(self, account: str) -> str:
+        """SS58 address of an address or dev key URI."""
+        address = self._addresses.get(account)
+        if address is None:
+            if account.startswith("//"):
+                address = Keypair.create_from_uri(account, ss58_format=self._client.api.ss58_format).ss58_address
+            else:
+                address = account
+            self._addresses[account] = address
+        return address
+
+    def calls(self, spec: SeedSpec):
+        """Yield every unwrapped call of the spec, in dependency order."""
+        pool_funding = []
+        if spec.init is not None and spec.stable_asset_id is not None:
+            pool_funding += [(0, spec.init.hdx_amount), (spec.stable_asset_id, spec.init.stable_amount)]
+        pool_funding += list(spec.reserves.items())
+        for currency_id, amount in pool_funding:
+            self.counts["balances"] += 1
+            yield self.balances.create_set_balance(Omnipool.ACCOUNT, currency_id, amount, sudo=False)
+        for balance in spec.balances:
+            for account in expand_accounts(balance.account, balance.count):
+                self.counts["balances"] += 1
+                yield self.balances.create_set_balance(self.address(account), balance.currency_id, balance.amount, sudo=False)
+
+        if spec.init is not None:
+            self.counts["init"] += 1
+            yield self.omnipool.init_call(self.sudo_address, spec.init, sudo=False)
+        owner = self.address(spec.token_owner) if spec.token_owner else self.sudo_address
+        for asset in spec.assets:
+            self.counts["assets"] += 1
+            yield self.omnipool.add_token_call(owner, asset, sudo=False)
+
+        for position in spec.positions:
+            call = self.omnipool.add_liquidity_call(position.asset_id, position.amount)
+            for account in expand_accounts(position.account, position.count):
+                dispatch_as_call = self.utility.create_dispatch_as_call(self.address(account), call)
+                for _ in range(position.positions):
+                    self.counts["positions"] += 1
+                    yield dispatch_as_call
+
+    def batches(self, spec: SeedSpec):
+        """Yield a sudo(force_batch(...)) call per batch the planner packs, as soon as it is full."""
+        for batch in self.planner.pack(self.calls(spec)):
+            yield create_call(self._client, "Sudo", "sudo", params={
+                "call": self.utility.create_force_batch(batch),
+            })
@@ -0,0 +1,178 @@
+import gzip
+import json
+from collections import deque
+
+from substrateinterface import SubstrateInterface
+
+from chopchop.client import Client
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.omnipool_lm import OmnipoolLM
+from chopchop.pallets.utility import Utility
+from chopchop.planner import BatchPlanner
+from chopchop.profile import Profiler
+from chopchop.storage import MemoryStorage
+
+# Storage maps (module, function, key prefix) the remove-positions planner reads
+SNAPSHOT_ITEMS = [
+    ("Omnipool", "Positions", None),
+    ("OmnipoolWarehouseLM", "Deposit", None),
+    ("OmnipoolLiquidityMining", "OmniPositionId", None),
+    ("Uniques", "Asset", [Omnipool.NFT_COLLECTION_ID]),
+    ("Uniques", "Asset", [OmnipoolLM.NFT_COLLECTION_ID]),
+]
+POSITIONS = "Omnipool.Positions"
+DEPOSITS = "OmnipoolWarehouseLM.Deposit"
+OMNI_POSITION_IDS = "OmnipoolLiquidityMining.OmniPositionId"
+NFTS = "Uniques.Asset"
+
+
+def capture_entries(client: Client, block_hash: str) -> dict:
+    """Read every SNAPSHOT_ITEMS map at `block_hash` into "Module.Function" -> {full key: decoded value}."""
+    entries = {}
+    for module, func, prefix in SNAPSHOT_ITEMS:
+        item = entries.setdefault(f"{module}.{func}", {})
+        for key, value in client.storage.query_map(module, func, prefix, at=block_hash):
+            key = key.value if isinstance(key.value, (list, tuple)) else [key.value]
+            item[tuple(prefix or ()) + tuple(key)] = value.value
+    return entries
+
+
+class StateSnapshot:
+    """Everything remove-positions needs from a node, captured at one block.
+
+    Besides the storage maps it keeps the runtime metadata and version so calls can be encoded
+    offline, and payment_queryInfo weights of the call shapes the planner packs.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, block_hash: str, header: dict, chain: str, properties: dict, runtime_version: dict,
+                 metadata: str, entries: dict, weights: dict):
+        self.block_hash = block_hash
+        self.header = header
+        self.chain = chain
+        self.properties = properties
+        self.runtime_version = runtime_version
+        self.metadata = metadata
+        self.entries = entries
+        self.weights = weights
+
+    @property
+    def block_number(self) -> int:
+        return int(self.header["number"], 16)
+
+    @staticmethod
+    def capture(client: Client, at: str | int | None = None) -> "StateSnapshot":
+        api = client.api
+        with client.snapshot(at) as block_hash:
+            entries = capture_entries(client, block_hash)
+            weights = _estimate_weights(client, entries)
+
+            return StateSnapshot(
+                block_hash=block_hash,
+                header=api.rpc_request("chain_getHeader", [block_hash])["result"],
+                chain=api.chain,
+                properties=api.properties,
+                runtime_version=api.rpc_request("state_getRuntimeVersion", [block_hash])["result"],
+                metadata=api.rpc_request("state_getMetadata", [block_hash])["result"],
+                entries=entries,
+                weights=weights,
+            )
+
+    def save(self, path):
+        data = {
+            "version": self.FORMAT_VERSION,
+            "block_hash": self.block_hash,
+            "header": self.header,
+            "chain": self.chain,
+            "properties": self.properties,
+            "runtime_version": self.runtime_version,
+            "metadata": self.metadata,
+            "entries": {name: [[list(key), value] for key, value in item.items()] for name, item in self.entries.items()},
+            "weights": [[shape, list(weight)] for shape, weight in self.weights.items()],
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+
+    @staticmethod
+    def load(path) -> "StateSnapshot":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != StateSnapshot.FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {data.get('version')}")
+        return StateSnapshot(
+            block_hash=data["block_hash"],
+            header=data["header"],
+            chain=data["chain"],
+            properties=data["properties"],
+            runtime_version=data["runtime_version"],
+            metadata=data["metadata"],
+            entries={name: {tuple(key): value for key, value in item} for name, item in data["entries"].items()},
+            weights={_to_tuple(shape): tuple(weight) for shape, weight in data["weights"]},
+        )
+
+
+def _to_tuple(value):
+    if isinstance(value, list):
+        return tuple(_to_tuple(item) for item in value)
+    return value
+
+
+def _estimate_weights(client: Client, entries: dict) -> dict:
+    """Estimate every dispatch_as call shape remove-positions can produce from the captured state."""
+    planner = BatchPlanner(client)
+    utility = Utility(client)
+    omnipool = Omnipool(client)
+    omnipool_lm = OmnipoolLM(client)
+
+    farm_counts = {len(deposit["yield_farm_entries"]) for deposit in entries[DEPOSITS].values()}
+    calls = [omnipool.remove_liquidity_call(0, 0)]
+    calls.extend(omnipool_lm.create_exit_farm_call(0, [0] * count) for count in sorted(farm_counts))
+    for call in calls:
+        planner.estimate(utility.create_dispatch_as_call(Omnipool.ACCOUNT, call))
+    return planner.weights
+
+
+class SnapshotSocket:
+    """Stand-in websocket answering the node RPCs SubstrateInterface needs to load a snapshot's runtime.
+
+    Any other request fails, so nothing can silently fall back to a live node.
+    """
+
+    def __init__(self, snapshot: StateSnapshot):
+        self._responses = {
+            "chain_getHead": snapshot.block_hash,
+            "chain_getFinalisedHead": snapshot.block_hash,
+            "chain_getBlockHash": snapshot.block_hash,
+            "chain_getHeader": snapshot.header,
+            "state_getRuntimeVersion": snapshot.runtime_version,
+            "chain_getRuntimeVersion": snapshot.runtime_version,
+            "state_getMetadata": snapshot.metadata,
+            "system_chain": snapshot.chain,
+            "system_properties": snapshot.properties,
+            "system_name": "chopchop-snapshot",
+            "system_version": str(StateSnapshot.FORMAT_VERSION),
+        }
+        self._responses["rpc_methods"] = {"methods": sorted(self._responses)}
+        self._messages = deque()
+
+    def send(self, payload):
+        request = json.loads(payload)
+        method = request["method"]
+        if method in self._responses:
+            message = {"jsonrpc": "2.0", "id": request["id"], "result": self._responses[method]}
+        else:
+            message = {"jsonrpc": "2.0", "id": request["id"],
+                       "error": {"code": -32601, "message": f"{method} is not available offline"}}
+        self._messages.append(json.dumps(message))
+
+    def recv(self):
+        return self._messages.popleft()
+
+    def close(self):
+        pass
+
+
+def initialize_snapshot_client(snapshot: StateSnapshot, profiler: Profiler | None = None) -> Client:
+    api = SubstrateInterface(websocket=SnapshotSocket(snapshot))
+    return Client(api=api, storage=MemoryStorage(snapshot.block_hash, snapshot.entries), profiler=profiler)
@@ -0,0 +1,190 @@
+from scalecodec.base import ScaleBytes
+from substrateinterface.exceptions import SubstrateRequestException
+from substrateinterface.storage import StorageKey
+
+
+class StoredValue:
+    """Plain decoded storage value exposing the parts of the ScaleType interface Pallets use."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __getitem__(self, key):
+        return StoredValue(self.value[key])
+
+    def __eq__(self, other):
+        if isinstance(other, StoredValue):
+            other = other.value
+        return self.value == other
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __int__(self):
+        return int(self.value)
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return f"<StoredValue {self.value!r}>"
+
+
+class RpcStorage:
+    """Storage backend reading from the node the client is connected to."""
+
+    # Number of storage keys requested per state_queryStorageAt call
+    MULTI_QUERY_CHUNK_SIZE = 256
+    # Whether undecoded storage can be read with query_map_raw_pages
+    raw = True
+
+    def __init__(self, client):
+        self._client = client
+
+    def query_map(self, module, func, params = None, at = None, page_size = 100):
+        return self._client.api.query_map(module, func, params, block_hash=at, page_size=page_size)
+
+    def query_map_raw_pages(self, module, func, params = None, at = None, page_size = 100):
+        """Yield pages of (hex key, hex value) of a storage map, leaving the decoding to the caller."""
+        api = self._client.api
+        api.init_runtime(block_hash=at)
+        prefix = StorageKey.create_from_storage_function(
+            module, func, params or [], runtime_config=api.runtime_config, metadata=api.metadata
+        ).to_hex()
+
+        start_key = prefix
+        while True:
+            keys = api.rpc_request("state_getKeysPaged", [prefix, page_size, start_key, at])["result"]
+            if keys:
+                response = api.rpc_request("state_queryStorageAt", [keys, at])
+                changes = {}
+                for result_group in response["result"]:
+                    changes.update(result_group["changes"])
+                yield [(key, changes[key]) for key in keys if changes.get(key) is not None]
+            if len(keys) < page_size:
+                return
+            start_key = keys[-1]
+
+    def query(self, module, func, params, at = None):
+        return self._client.api.query(module, func, params, block_hash=at)
+
+    def query_multi(self, module, func, list_of_params, at = None) -> list:
+        return self.query_multi_items([(module, func, params) for params in list_of_params], at=at)
+
+    def query_multi_items(self, requests, at = None) -> list:
+        """Read (module, function, params) keys of any storage items in the same chunked requests."""
+        return self.prepare_multi_items(requests, at=at).fetch().values()
+
+    def prepare_multi_items(self, requests, at = None) -> "PendingRead":
+        """Build the keys of a `query_multi_items` read without issuing it."""
+        api = self._client.api
+        api.init_runtime(block_hash=at)
+        storage_keys = [
+            StorageKey.create_from_storage_function(
+                module, func, params, runtime_config=api.runtime_config, metadata=api.metadata
+            )
+            for module, func, params in requests
+        ]
+        return PendingRead(self._client, requests, storage_keys, at, self.MULTI_QUERY_CHUNK_SIZE)
+
+
+class PendingRead:
+    """A multi-key read whose storage keys are built, split into issuing it and decoding it.
+
+    `fetch` only issues the state_queryStorageAt requests. With a fetch engine they never touch
+    `api`, so `fetch` may run on another thread; `values` decodes on the thread that built the read.
+    """
+
+    def __init__(self, client, requests, storage_keys, at, chunk_size):
+        self._client = client
+        self.requests = requests
+        self.at = at
+        if client.engine is not None:
+            # Split the keys so that every worker gets a share of the request
+            chunk_size = max(1, min(chunk_size, -(-len(storage_keys) // client.engine.concurrency)))
+        self._chunks = [storage_keys[i:i + chunk_size] for i in range(0, len(storage_keys), chunk_size)]
+        self._responses = None
+
+    def fetch(self) -> "PendingRead":
+        self._responses = self._client.rpc_requests(
+            "state_queryStorageAt", [[[key.to_hex() for key in chunk], self.at] for chunk in self._chunks]
+        )
+        return self
+
+    def values(self) -> list:
+        if self._responses is None:
+            raise RuntimeError("Read was not fetched")
+        values = []
+        name = ",".join(sorted({f"{module}.{func}" for module, func, _ in self.requests}))
+        for chunk, response in zip(self._chunks, self._responses):
+            changes = {}
+            for result_group in response["result"]:
+                for key, data in result_group["changes"]:
+                    changes[key] = data
+            with self._client.profile("decode", name):
+                for storage_key in chunk:
+                    data = changes.get(storage_key.to_hex())
+                    values.append(storage_key.decode_scale_value(ScaleBytes(data) if data is not None else None))
+        return values
+
+
+class DecodedRead:
+    """A multi-key read answered up front, with the interface of `PendingRead`."""
+
+    def __init__(self, requests, values: list):
+        self.requests = requests
+        self._values = values
+
+    def fetch(self) -> "DecodedRead":
+        return self
+
+    def values(self) -> list:
+        return self._values
+
+
+class MemoryStorage:
+    """Storage backend serving decoded entries captured at a single block.
+
+    `entries` maps "Module.Function" to a dict of full storage keys (tuples) to decoded values.
+    Only optional storage maps are captured, so a missing key decodes to None like it does on chain.
+    """
+
+    # Entries are kept decoded only
+    raw = False
+
+    def __init__(self, block_hash: str, entries: dict):
+        self.block_hash = block_hash
+        self._entries = entries
+
+    def _item(self, module, func, at) -> dict:
+        if at is not None and at != self.block_hash:
+            raise SubstrateRequestException(f"State is only available at block {self.block_hash}, not {at}")
+        item = self._entries.get(f"{module}.{func}")
+        if item is None:
+            raise SubstrateRequestException(f"{module}.{func} is not available offline")
+        return item
+
+    def query_map(self, module, func, params = None, at = None, page_size = 100):
+        prefix = tuple(params or ())
+        entries = []
+        for key, value in self._item(module, func, at).items():
+            if key[:len(prefix)] != prefix:
+                continue
+            remainder = key[len(prefix):]
+            entries.append((StoredValue(remainder[0] if len(remainder) == 1 else list(remainder)), StoredValue(value)))
+        return entries
+
+    def query(self, module, func, params, at = None):
+        return StoredValue(self._item(module, func, at).get(tuple(params)))
+
+    def query_multi(self, module, func, list_of_params, at = None) -> list:
+        item = self._item(module, func, at)
+        return [StoredValue(item.get(tuple(params))) for params in list_of_params]
+
+    def query_multi_items(self, requests, at = None) -> list:
+        return [self.query(module, func, params, at=at) for module, func, params in requests]
+
+    def prepare_multi_items(self, requests, at = None) -> DecodedRead:
+        return DecodedRead(requests, self.query_multi_items(requests, at=at))
@@ -0,0 +1,265 @@
+import queue
+import threading
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from itertools import cycle
+from typing import Optional
+
+from substrateinterface import SubstrateInterface
+from substrateinterface.exceptions import SubstrateRequestException
+
+
+@dataclass
+class Submission:
+    """One extrinsic handed to a Submitter, completed once it is included (or finalized) or has failed."""
+    signer: str
+    nonce: int
+    extrinsic_hash: str
+    # Block number the extrinsic's mortal era starts at
+    era_start: int
+    # First block number at which the era has ended and the extrinsic can no longer be included
+    era_death: int
+    # submitted, included, finalized or failed
+    status: str = "submitted"
+    block_hash: Optional[str] = None
+    error: Optional[object] = None
+    # Whether sending was attempted, and whether the node accepted the extrinsic
+    attempted: bool = field(default=False, repr=False)
+    sent: bool = field(default=False, repr=False)
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def is_success(self) -> bool:
+        return self.status in ("included", "finalized")
+
+    def wait(self, timeout = None) -> bool:
+        """Block until the outcome is known; True when the extrinsic was included without error."""
+        self.done.wait(timeout)
+        return self.is_success
+
+    def _finish(self, status, block_hash = None, error = None):
+        self.status = status
+        self.block_hash = block_hash
+        self.error = error
+        self.done.set()
+
+
+class Submitter:
+    """Signs and submits extrinsics back to back, keeping every signer's nonce locally.
+
+    Nothing waits for inclusion. A tracker follows new (or finalized) heads on connections of its
+    own, finds the submitted extrinsics in each block by hash and completes their Submission with
+    the outcome of their ExtrinsicSuccess or ExtrinsicFailed event. Extrinsics still pending when
+    their era expires are reported as dropped. Work is spread round-robin over `signers` unless a
+    signer is given.
+    """
+
+    # Errors meaning the node already holds the extrinsic, e.g. after a retried request
+    ALREADY_IMPORTED = ("already imported", "Transaction Already Imported")
+    # Errors meaning the extrinsic's nonce is used, which on a resent extrinsic means it was already included
+    OUTDATED = ("Transaction is outdated", "stale")
+
+    def __init__(self, client, signers = (), finalized: bool = False, era_period: int = 64):
+        self._client = client
+        self._signers = cycle(signers) if signers else None
+        self.finalized = finalized
+        self.era_period = era_period
+        self._nonces = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._subscriber = None
+        self._tracker = None
+
+    def _next_nonce(self, address) -> int:
+        nonce = self._nonces.get(address)
+        if nonce is None:
+            nonce = self._client.api.get_account_nonce(address)
+        self._nonces[address] = nonce + 1
+        return nonce
+
+    def submit(self, call, signer = None) -> Submission:
+        return self.submit_many([call], signer)[0]
+
+    def submit_many(self, calls, signer = None) -> list:
+        """Sign and submit every call, concurrently across signers when the client has a fetch engine.
+
+        Returns a Submission per call; failures to submit are reported on their Submission right away.
+        A signer's extrinsics are sent in nonce order. When one fails, its nonce stays unused, so the
+        signer's later calls are not sent as signed but re-signed from the nonce the node expects.
+        """
+        if signer is None and self._signers is None:
+            raise ValueError("No signer given and no signers configured")
+        self._start()
+        api = self._client.api
+        era_start = api.get_block_number(api.get_chain_finalised_head())
+        era = api.runtime_config.create_scale_object("Era")
+        era.encode({"period": self.era_period, "current": era_start})
+
+        submissions = [None] * len(calls)
+        queues = {}
+        for index, call in enumerate(calls):
+            keypair = signer if signer is not None else next(self._signers)
+            queues.setdefault(keypair.ss58_address, (keypair, []))[1].append((index, call))
+
+        while queues:
+            batches = []
+            for keypair, items in queues.values():
+                batch = []
+                for index, call in items:
+                    submissions[index], data = self._sign(api, keypair, call, era, era_start)
+                    batch.append((submissions[index], data))
+                batches.append(batch)
+
+            # Register before submitting, so that no inclusion can be missed
+            with self._lock:
+                self._pending.update((submission.extrinsic_hash, submission) for batch in batches for submission, _ in batch)
+
+            if self._client.engine is not None:
+                results = self._client.engine.map(self._send_in_order, batches)
+            else:
+                results = [self._send_in_order(api, batch) for batch in batches]
+
+            retry = {}
+            for (keypair, items), batch, (failed, error) in zip(queues.values(), batches, results):
+                if failed is None:
+                    continue
+                with self._lock:
+                    for submission, _ in batch[failed:]:
+                        self._pending.pop(submission.extrinsic_hash, None)
+                batch[failed][0]._finish("failed", error=error)
+                # The nonce was not used; continue from what the node expects
+                self._nonces[keypair.ss58_address] = api.get_account_nonce(keypair.ss58_address)
+                if failed + 1 < len(items):
+                    retry[keypair.ss58_address] = (keypair, items[failed + 1:])
+            queues = retry
+        return submissions
+
+    def _sign(self, api, keypair, call, era, era_start):
+        nonce = self._next_nonce(keypair.ss58_address)
+        extrinsic = api.create_signed_extrinsic(
+            call=call, keypair=keypair, era={"period": self.era_period, "current": era_start}, nonce=nonce
+        )
+        data = bytes(extrinsic.data.data)
+        submission = Submission(keypair.ss58_address, nonce, "0x" + blake2b(data, digest_size=32).hexdigest(),
+                                era.birth(era_start), era.death(era_start))
+        return submission, "0x" + data.hex()
+
+    def _send_in_order(self, api, batch):
+        """Send one signer's extrinsics, stopping at the first that fails; (its index, error) or (None, None).
+
+        After a transport error the fetch engine runs this again on a fresh connection, so extrinsics
+        the node accepted are skipped, and the one that was in flight may come back as outdated.
+        """
+        for i, (submission, data) in enumerate(batch):
+            if submission.sent:
+                continue
+            resent = submission.attempted
+            submission.attempted = True
+            error = self._send(api, data)
+            if error is not None and not (resent and any(message in str(error) for message in self.OUTDATED)):
+                return i, error
+            submission.sent = True
+        return None, None
+
+    def _send(self, api, data):
+        try:
+            api.rpc_request("author_submitExtrinsic", [data])
+        except SubstrateRequestException as e:
+            if any(message in str(e) for message in self.ALREADY_IMPORTED):
+                return None
+            return e.args[0] if e.args else str(e)
+        return None
+
+    def _start(self):
+        if self._tracker is not None:
+            return
+        heads = queue.Queue()
+        method = "chain_subscribeFinalizedHeads" if self.finalized else "chain_subscribeNewHeads"
+        self._subscriber = SubstrateInterface(url=self._client.api.url, auto_discover=False)
+
+        def handler(message, update_nr, subscription_id):
+            heads.put(int(message["params"]["result"]["number"], 16))
+            if self._stop.is_set():
+                return True
+
+        threading.Thread(target=self._subscriber.rpc_request, args=(method, []),
+                         kwargs={"result_handler": handler}, daemon=True).start()
+        self._tracker = threading.Thread(target=self._track, args=(heads,), daemon=True, name="chopchop-submit")
+        self._tracker.start()
+
+    def _track(self, heads):
+        api = SubstrateInterface(url=self._client.api.url, type_registry=self._client.api.type_registry)
+        last = None
+        try:
+            while not self._stop.is_set():
+                try:
+                    head = heads.get(timeout=1)
+                except queue.Empty:
+                    continue
+                for number in range(head if last is None else last + 1, head + 1):
+                    self._process_block(api, number)
+                last = head if last is None else max(last, head)
+        finally:
+            api.close()
+
+    def _process_block(self, api, number):
+        with self._lock:
+            if not self._pending:
+                return
+        block_hash = api.get_block_hash(number)
+        extrinsics = api.rpc_request("chain_getBlock", [block_hash])["result"]["block"]["extrinsics"]
+
+        found = {}
+        with self._lock:
+            for index, data in enumerate(extrinsics):
+                extrinsic_hash = "0x" + blake2b(bytes.fromhex(data[2:]), digest_size=32).hexdigest()
+                submission = self._pending.pop(extrinsic_hash, None)
+                if submission is not None:
+                    found[index] = submission
+
+        if found:
+            outcomes = {}
+            for event in api.query("System", "Events", block_hash=block_hash).value:
+                phase = event["phase"]
+                index = phase.get("ApplyExtrinsic") if isinstance(phase, dict) else None
+                if index not in found or event["module_id"] != "System":
+                    continue
+                if event["event_id"] == "ExtrinsicFailed":
+                    outcomes[index] = _dispatch_error(api, event["attributes"])
+                elif event["event_id"] == "ExtrinsicSuccess":
+                    outcomes.setdefault(index, None)
+            for index, submission in found.items():
+                error = outcomes.get(index)
+                status = "failed" if error is not None else ("finalized" if self.finalized else "included")
+                submission._finish(status, block_hash, error)
+
+        with self._lock:
+            expired = [submission for submission in self._pending.values() if number >= submission.era_death]
+            for submission in expired:
+                del self._pending[submission.extrinsic_hash]
+        for submission in expired:
+            submission._finish("failed", error="dropped: not included before its era expired")
+
+    def close(self):
+        self._stop.set()
+        if self._tracker is not None:
+            self._tracker.join(timeout=5)
+        if self._subscriber is not None:
+            self._subscriber.close()
+
+
+def _dispatch_error(api, attributes):
+    error = attributes.get("dispatch_error", attributes) if isinstance(attributes, dict) else attributes
+    if isinstance(error, dict) and "Module" in error:
+        module_error = error["Module"]
+        error_index = module_error["error"]
+        if isinstance(error_index, str):
+            # Newer runtimes encode the error as 4 bytes, the first of which is the index
+            error_index = bytes.fromhex(error_index[2:])[0]
+        try:
+            details = api.metadata.get_module_error(module_index=module_error["index"], error_index=error_index)
+            return {"type": "Module", "name": details.value["name"], "docs": details.value["docs"]}
+        except Exception:
+            pass
+    return {"type": "System", "name": error}
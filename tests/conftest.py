@@ -0,0 +1,31 @@
+import pytest
+
+from chopchop.replay import RawStorage, initialize_replay_client
+from runtime import BLOCK_HASH, runtime_recording
+
+
+@pytest.fixture(scope="session")
+def recording():
+    return runtime_recording()
+
+
+@pytest.fixture
+def storage():
+    return RawStorage({})
+
+
+@pytest.fixture
+def client(recording, storage):
+    client = initialize_replay_client(recording, storage)
+    client.api.init_runtime(block_hash=BLOCK_HASH)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def engine_client(recording, storage):
+    """Client with a fetch engine of replayed worker connections."""
+    client = initialize_replay_client(recording, storage, concurrency=4)
+    client.api.init_runtime(block_hash=BLOCK_HASH)
+    yield client
+    client.close()
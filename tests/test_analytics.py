@@ -0,0 +1,58 @@
+import pytest
+
+from chopchop.analytics import OmnipoolState, PositionTable
+from chopchop.pallets.omnipool import AssetState, Position
+from chopchop.quote import OmnipoolQuoter
+
+UNIT = 10 ** 12
+
+
+@pytest.fixture
+def states():
+    # Balances well past 2 ** 53, where float64 would round them
+    return [
+        AssetState(10 * UNIT + 1, 20 * UNIT + 3, 10 * UNIT + 7, 0, 10 ** 6, 15, 5),
+        AssetState(5 * UNIT, 5 * UNIT, 20 * UNIT, 0, 10 ** 6, 15, 6),
+    ]
+
+
+def test_balances_are_exact(states):
+    state = OmnipoolState.from_asset_states(states)
+
+    assert state.reserve == [10 * UNIT + 1, 5 * UNIT]
+    assert state.tvl() == 25 * UNIT + 3
+    assert state.tvl(6) == 25 * UNIT + 3
+
+
+@pytest.mark.parametrize("price", [(2, 1), (1, 1), (3, 1), (20 * UNIT + 3, 10 * UNIT + 1)])
+def test_position_values_match_the_quoter_removal(states, price):
+    state = OmnipoolState.from_asset_states(states)
+    position = Position(5, 0, 3 * UNIT + 11, price)
+
+    quote = OmnipoolQuoter(states).remove_liquidity(position)
+
+    assert state.position_values([(5, position.shares, price)]) == [-quote.hub_reserve_delta + quote.hub_amount]
+
+
+@pytest.mark.parametrize("price, value", [
+    # Entered at the current price of 2: the hub reserve of the shares
+    ((2, 1), 6 * UNIT),
+    # Entered at 1: a third of the hub reserve gained is also paid out in LRNA
+    ((1, 1), 6 * UNIT + 1_999_999_999_999),
+    # Entered at 4: a third of the shares go to the protocol first
+    ((4, 1), 4_000_000_000_002),
+])
+def test_position_values_follow_the_runtime_removal(price, value):
+    state = OmnipoolState.from_asset_states([AssetState(10 * UNIT, 20 * UNIT, 10 * UNIT, 0, 10 ** 6, 15, 5)])
+
+    assert state.position_values([(5, 3 * UNIT, price)]) == [value]
+
+
+def test_position_table_packs_36_bytes_per_position():
+    table = PositionTable()
+    table.append(2 ** 100, 5, 2 ** 127 + 1)
+    table.append(7, 6, 10)
+
+    assert len(table.position_ids) + len(table.asset_ids) * table.asset_ids.itemsize + len(table.shares) == 2 * 36
+    assert list(table) == [(2 ** 100, 5, 2 ** 127 + 1), (7, 6, 10)]
+    assert table.total_shares(6) == 10
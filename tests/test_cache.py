@@ -0,0 +1,42 @@
+from substrateinterface import SubstrateInterface
+
+from chopchop.cache import MetadataCache
+from chopchop.replay import Recording, ReplaySocket
+from runtime import BLOCK_HASH, SPEC_VERSION
+
+
+def cached_api(recording, storage, cache_dir):
+    api = SubstrateInterface(websocket=ReplaySocket(recording, storage))
+    api.cache_region = MetadataCache(api, api.chain, cache_dir=cache_dir)
+    return api
+
+
+def test_metadata_is_read_back_without_downloading_it(recording, storage, tmp_path):
+    cached_api(recording, storage, tmp_path).init_runtime(block_hash=BLOCK_HASH)
+
+    offline = Recording({key: response for key, response in recording.responses.items() if key[0] != "state_getMetadata"})
+    api = cached_api(offline, storage, tmp_path)
+    api.init_runtime(block_hash=BLOCK_HASH)
+
+    assert [path.name for path in (tmp_path / "hydration").iterdir()] == [f"metadata_{SPEC_VERSION}.scale"]
+    assert api.metadata.get_metadata_pallet("Omnipool") is not None
+
+
+def test_older_spec_versions_are_evicted(recording, storage, tmp_path):
+    stale = tmp_path / "hydration" / f"metadata_{SPEC_VERSION - 1}.scale"
+    stale.parent.mkdir()
+    stale.write_bytes(b"\x00")
+
+    cached_api(recording, storage, tmp_path).init_runtime(block_hash=BLOCK_HASH)
+
+    assert not stale.exists()
+
+
+def test_an_unreadable_entry_is_a_miss(recording, storage, tmp_path):
+    entry = tmp_path / "hydration" / f"metadata_{SPEC_VERSION}.scale"
+    entry.parent.mkdir()
+    entry.write_bytes(b"\x6d\x65\x74\x61\x0e")
+    api = SubstrateInterface(websocket=ReplaySocket(recording, storage))
+
+    assert MetadataCache(api, api.chain, cache_dir=tmp_path).get(f"METADATA_{SPEC_VERSION}") is None
+    assert not entry.exists()
@@ -0,0 +1,62 @@
+import pytest
+
+from chopchop.calls import CallTemplate, encode_compact
+from chopchop.client import create_call
+
+OWNER = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+
+
+def remove_liquidity(position_id):
+    return {"position_id": position_id, "amount": 10 ** 12 + position_id}
+
+
+def nested_calls(client):
+    remove = create_call(client, "Omnipool", "remove_liquidity", remove_liquidity(7))
+    exit_farms = create_call(client, "OmnipoolLiquidityMining", "exit_farms", {"deposit_id": 3, "yield_farm_ids": [1, 2]})
+    dispatch = create_call(client, "Utility", "dispatch_as", {"as_origin": {"system": {"Signed": OWNER}}, "call": remove})
+    batch = create_call(client, "Utility", "force_batch", {"calls": [dispatch, exit_farms]})
+    return [
+        ("Omnipool", "remove_liquidity", remove_liquidity(7)),
+        ("Omnipool", "add_token", {"asset": 5, "initial_price": 2 * 10 ** 18, "weight_cap": 500_000, "position_owner": OWNER}),
+        ("OmnipoolLiquidityMining", "exit_farms", {"deposit_id": 3, "yield_farm_ids": [1, 2]}),
+        ("Utility", "dispatch_as", {"as_origin": {"system": {"Signed": OWNER}}, "call": remove}),
+        ("Utility", "force_batch", {"calls": [dispatch, exit_farms]}),
+        ("Scheduler", "schedule_after", {"after": 10, "maybe_periodic": None, "priority": 0, "call": batch}),
+        ("Scheduler", "schedule_after", {"after": 10, "maybe_periodic": (5, 2), "priority": 1, "call": remove}),
+        ("Sudo", "sudo", {"call": batch}),
+    ]
+
+
+@pytest.mark.parametrize("index", range(8))
+def test_template_encodes_the_same_bytes_as_compose_call(client, index):
+    module, func, params = nested_calls(client)[index]
+
+    call = CallTemplate(client.api, module, func).encode(params)
+    composed = client.api.compose_call(module, func, params)
+
+    assert call.data.data == composed.data.data
+    assert call.call_hash == composed.call_hash
+
+
+def test_template_calls_can_be_signed(client):
+    call = create_call(client, "Omnipool", "remove_liquidity", remove_liquidity(1))
+
+    assert call.value["call_module"] == "Omnipool"
+    assert call.value["call_function"] == "remove_liquidity"
+    assert call.value["call_args"] == remove_liquidity(1)
+
+
+def test_template_is_cached_per_runtime_version(client):
+    assert client.call_template("Omnipool", "remove_liquidity") is client.call_template("Omnipool", "remove_liquidity")
+
+
+def test_missing_parameter_is_reported(client):
+    with pytest.raises(ValueError, match="amount"):
+        CallTemplate(client.api, "Omnipool", "remove_liquidity").encode({"position_id": 1})
+
+
+@pytest.mark.parametrize("value", [0, 63, 64, 16383, 16384, 2 ** 30 - 1, 2 ** 30, 2 ** 64, 2 ** 128 - 1])
+def test_encode_compact_matches_scalecodec(client, value):
+    compact = client.api.runtime_config.create_scale_object("Compact<u128>")
+
+    assert encode_compact(value) == compact.encode(value).data
@@ -0,0 +1,86 @@
+import pytest
+
+from chopchop.checkpoint import Checkpoint
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.utility import Utility
+from chopchop.pipeline import RemovePositionsPipeline
+from chopchop.planner import BatchPlanner, call_shape
+from runtime import BLOCK_HASH, store
+
+OWNER = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+
+
+@pytest.fixture
+def positions(client, storage):
+    store(client, storage, "Omnipool", "Positions", {
+        (position_id,): {"asset_id": 5, "amount": 10, "shares": 10 + position_id, "price": (1, 1)} for position_id in range(10)
+    })
+    store(client, storage, "Uniques", "Asset", {
+        (Omnipool.NFT_COLLECTION_ID, position_id): {"owner": OWNER, "approved": None, "is_frozen": False, "deposit": 0}
+        for position_id in range(10)
+    })
+
+
+def schedule(client, checkpoint = None, stop_after = None) -> list:
+    """Encoded schedule calls of a run; with `stop_after`, the run is abandoned after that many."""
+    client.block_hash = BLOCK_HASH
+    weights = {call_shape(Utility(client).create_dispatch_as_call(OWNER, Omnipool(client).remove_liquidity_call(0, 1))): (1, 0)}
+    pipeline = RemovePositionsPipeline(client, [5], BatchPlanner(client, max_calls=2, weights=weights), page_size=3,
+                                       checkpoint=checkpoint)
+    calls = []
+    for call in pipeline.schedule_calls(check_farms=False):
+        calls.append(call.data.to_hex())
+        if len(calls) == stop_after:
+            break
+    return calls
+
+
+def test_records_survive_a_reopen(tmp_path):
+    checkpoint = Checkpoint.open(tmp_path, BLOCK_HASH)
+    checkpoint.put("stage", "0", [1, 2])
+    checkpoint.finish("stage")
+    checkpoint.close()
+
+    resumed = Checkpoint.open(tmp_path, BLOCK_HASH, resume=True)
+    fresh = Checkpoint.open(tmp_path / "fresh", BLOCK_HASH)
+
+    assert (resumed.get("stage", "0"), resumed.done("stage")) == ([1, 2], True)
+    assert (len(fresh), fresh.done("stage")) == (0, False)
+    assert Checkpoint.latest(tmp_path) == BLOCK_HASH
+
+
+def test_a_record_cut_short_is_ignored(tmp_path):
+    checkpoint = Checkpoint.open(tmp_path, BLOCK_HASH)
+    checkpoint.put("stage", "0", [1])
+    checkpoint.close()
+    with open(checkpoint.path, "a", encoding="utf-8") as f:
+        f.write('["stage","1",[')
+
+    resumed = Checkpoint.open(tmp_path, BLOCK_HASH, resume=True)
+
+    assert (resumed.get("stage", "0"), resumed.get("stage", "1")) == ([1], None)
+
+
+def test_an_interrupted_run_resumes_to_the_same_schedule(client, positions, tmp_path):
+    expected = schedule(client)
+    checkpoint = Checkpoint.open(tmp_path, BLOCK_HASH)
+    assert schedule(client, checkpoint, stop_after=1) == expected[:1]
+    checkpoint.close()
+
+    resumed = Checkpoint.open(tmp_path, BLOCK_HASH, resume=True)
+
+    assert len(resumed) > 0
+    assert schedule(client, resumed) == expected
+
+
+def test_finished_stages_are_replayed_without_reading_storage(client, storage, positions, tmp_path):
+    checkpoint = Checkpoint.open(tmp_path, BLOCK_HASH)
+    expected = schedule(client, checkpoint)
+    checkpoint.close()
+    storage.values.clear()
+    storage.update({})
+
+    resumed = Checkpoint.open(tmp_path, BLOCK_HASH, resume=True)
+
+    assert resumed.done("positions")
+    assert schedule(client, resumed) == expected
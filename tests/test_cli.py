@@ -0,0 +1,25 @@
+from click.testing import CliRunner
+
+from chopchop.cli import BLOCK, cli
+
+
+def test_group_by_owner_is_refused_with_a_snapshot(tmp_path):
+    snapshot = tmp_path / "snapshot.json.gz"
+    snapshot.write_bytes(b"")
+
+    result = CliRunner().invoke(cli, ["remove-positions", "5", "--snapshot", str(snapshot), "--group-by-owner", "10"])
+
+    assert result.exit_code == 2
+    assert "--group-by-owner cannot be combined with --snapshot" in result.output
+
+
+def test_at_block_must_be_a_block_number_or_hash():
+    result = CliRunner().invoke(cli, ["remove-positions", "5", "--at-block", "12a"])
+
+    assert result.exit_code == 2
+    assert "'12a' is neither a block number nor a 0x block hash" in result.output
+
+
+def test_block_param_accepts_numbers_and_hashes():
+    assert BLOCK.convert("6500000", None, None) == 6500000
+    assert BLOCK.convert("0x" + "ab" * 32, None, None) == "0x" + "ab" * 32
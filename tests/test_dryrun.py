@@ -0,0 +1,116 @@
+import pytest
+from substrateinterface.exceptions import SubstrateRequestException
+
+from chopchop.cli import describe_dispatch
+from chopchop.dryrun import DRY_RUN_API_ID, DryRunResult, runtime_api_id
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.omnipool_lm import OmnipoolLM
+from chopchop.pallets.utility import Utility
+from chopchop.pipeline import RemovePositionsPipeline
+from chopchop.planner import BatchPlanner, call_shape
+from runtime import BLOCK_HASH, store
+
+OWNER = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+DEPOSIT_ID = 100
+FARMED_POSITION_ID = 1
+
+
+def test_runtime_api_ids():
+    assert runtime_api_id("Core") == "0xdf6acb689907609b"
+    assert DRY_RUN_API_ID == "0x91b1c8b16328eb92"
+
+
+class FailingExits:
+    """Dry runner failing every exit_farms item, and the removals of `failing_positions`, recording the items of every dry run."""
+
+    def __init__(self, failing_positions = ()):
+        self.runs = []
+        self.failing_positions = set(failing_positions)
+
+    def dry_run_many(self, calls) -> list:
+        results = []
+        for call in calls:
+            items = [_inner(dispatch) for dispatch in call.value["call_args"]["calls"]]
+            self.runs.append(items)
+            failed = {i: "Farm error" for i, (_, func, _) in enumerate(items) if func == "exit_farms"}
+            failed.update({i: "Position error" for i, (_, func, args) in enumerate(items)
+                           if func == "remove_liquidity" and args["position_id"] in self.failing_positions})
+            results.append(DryRunResult(ok=True, failed=failed))
+        return results
+
+
+def _inner(dispatch) -> tuple:
+    inner = dispatch.value["call_args"]["call"].value
+    return inner["call_module"], inner["call_function"], inner["call_args"]
+
+
+def farmed_pipeline(client, storage, failing_positions = ()):
+    client.block_hash = BLOCK_HASH
+    store(client, storage, "OmnipoolWarehouseLM", "Deposit", {
+        (DEPOSIT_ID,): {"shares": 10, "amm_pool_id": 5,
+                        "yield_farm_entries": [{"global_farm_id": 1, "yield_farm_id": 2, "valued_shares": 10}]},
+    })
+    store(client, storage, "OmnipoolLiquidityMining", "OmniPositionId", {(DEPOSIT_ID,): FARMED_POSITION_ID})
+    store(client, storage, "Omnipool", "Positions", {
+        (position_id,): {"asset_id": 5, "amount": 10, "shares": 10, "price": (1, 1)} for position_id in range(6)
+    })
+    store(client, storage, "Uniques", "Asset", {
+        (OmnipoolLM.NFT_COLLECTION_ID, DEPOSIT_ID): {"owner": OWNER, "approved": None, "is_frozen": False, "deposit": 0},
+        **{(Omnipool.NFT_COLLECTION_ID, position_id): {"owner": OWNER, "approved": None, "is_frozen": False, "deposit": 0}
+           for position_id in range(6)},
+    })
+    utility = Utility(client)
+    weights = {
+        call_shape(utility.create_dispatch_as_call(OWNER, OmnipoolLM(client).create_exit_farm_call(0, [0]))): (1, 0),
+        call_shape(utility.create_dispatch_as_call(OWNER, Omnipool(client).remove_liquidity_call(0, 1))): (1, 0),
+    }
+    planner = BatchPlanner(client, max_calls=2, weights=weights)
+    return RemovePositionsPipeline(client, [5], planner, page_size=2, dry_runner=FailingExits(failing_positions),
+                                   keep_plan=True)
+
+
+def test_batches_are_dry_run_as_they_are_packed(client, storage):
+    pipeline = farmed_pipeline(client, storage)
+
+    calls = pipeline.schedule_calls(check_farms=False)
+    next(calls)
+
+    # Only the first packed batch was needed for the first scheduled call
+    assert len(pipeline.dry_runner.runs) < 3
+    rest = list(calls)
+    assert len(pipeline.dry_runner.runs) == 3
+    assert len(rest) == 2
+
+
+def test_removal_is_not_dry_run_after_a_dropped_exit(client, storage):
+    pipeline = farmed_pipeline(client, storage)
+
+    list(pipeline.schedule_calls())
+
+    assert [describe_dispatch(call) for call, _ in pipeline.dropped] == ["OmnipoolLiquidityMining.exit_farms of deposit 100"]
+    assert pipeline.exit_calls == {}
+    removal_runs = [items for items in pipeline.dry_runner.runs if items[0][1] != "exit_farms"]
+    assert [func for items in removal_runs for _, func, _ in items] == ["remove_liquidity"] * 6
+
+
+def test_dropped_removals_are_left_out_of_the_plan(client, storage):
+    pipeline = farmed_pipeline(client, storage, failing_positions=[3])
+
+    list(pipeline.schedule_calls(check_farms=False))
+
+    assert [describe_dispatch(call) for call, _ in pipeline.dropped] == ["Omnipool.remove_liquidity of position 3"]
+    assert sorted(pipeline.planned) == [0, 1, 2, 4, 5]
+
+
+class FailingApi(FailingExits):
+    def dry_run_many(self, calls) -> list:
+        return [DryRunResult(ok=False, error={"DryRunApi": "00"}) for _ in calls]
+
+
+def test_a_batch_failing_as_a_whole_aborts_the_run(client, storage):
+    pipeline = farmed_pipeline(client, storage)
+    pipeline.dry_runner = FailingApi()
+
+    with pytest.raises(SubstrateRequestException, match="failed as a whole"):
+        list(pipeline.schedule_calls(check_farms=False))
+    assert pipeline.dropped == []
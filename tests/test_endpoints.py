@@ -0,0 +1,103 @@
+import pytest
+from substrateinterface.exceptions import SubstrateRequestException
+from websocket import WebSocketConnectionClosedException
+
+from chopchop.endpoints import EndpointPool
+
+
+class FakeSession:
+    def request(self, *args, **kwargs):
+        raise AssertionError("No HTTP requests expected")
+
+
+class FakeWebsocket:
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+
+class FakeApi:
+    """Just enough of SubstrateInterface for the pool: requests fail on the urls in `down`, and
+    the urls in `pruned` have no state for old blocks."""
+
+    def __init__(self, url, down, pruned = ()):
+        self.url = url
+        self.down = down
+        self.pruned = pruned
+        self.session = FakeSession()
+        self.websocket = FakeWebsocket(10)
+        self.sent = []
+
+    def rpc_request(self, method, params, result_handler = None):
+        self.sent.append((self.url, method, self.websocket.timeout))
+        if self.url in self.down:
+            raise WebSocketConnectionClosedException("Connection to remote host was lost.")
+        if method == "state_getRuntimeVersion" and self.url in self.pruned:
+            raise SubstrateRequestException({"code": 4003, "message": "State already discarded"})
+        return {"result": self.url}
+
+    def close(self):
+        pass
+
+    def connect_websocket(self):
+        self.websocket = FakeWebsocket(10)
+
+
+@pytest.fixture
+def pool():
+    pool = EndpointPool(["wss://a", "wss://b", "wss://c"])
+    pool.probes = []
+    latencies = {"wss://a": 0.1, "wss://b": 0.2, "wss://c": 0.3}
+
+    def probe(endpoint):
+        pool.probes.append(endpoint.url)
+        endpoint.latency, endpoint.head = latencies[endpoint.url], 100
+
+    pool._probe = probe
+    return pool
+
+
+def test_reads_fail_over_to_the_next_endpoint(pool):
+    api = pool.instrument(FakeApi("wss://a", down={"wss://a"}))
+
+    assert api.rpc_request("chain_getHeader", [])["result"] == "wss://b"
+    assert not pool.endpoints[0].healthy
+
+
+def test_submissions_are_not_retried_on_another_endpoint(pool):
+    api = pool.instrument(FakeApi("wss://a", down={"wss://a"}))
+
+    with pytest.raises(WebSocketConnectionClosedException):
+        api.rpc_request("author_submitExtrinsic", ["0x00"])
+    assert [url for url, _, _ in api.sent] == ["wss://a"]
+
+
+def test_subscriptions_wait_without_a_socket_timeout(pool):
+    api = pool.instrument(FakeApi("wss://a", down=set()))
+
+    api.rpc_request("author_submitAndWatchExtrinsic", ["0x00"], result_handler=lambda *args: None)
+
+    assert api.sent == [("wss://a", "author_submitAndWatchExtrinsic", None)]
+    assert api.websocket.timeout == pool.timeout
+
+
+def test_fallbacks_are_probed_once_the_first_endpoint_fails(pool):
+    api = pool.instrument(FakeApi("wss://a", down=set()))
+
+    api.rpc_request("chain_getHeader", [])
+    assert (pool.probed, pool.probes, pool.next_url()) == (False, [], "wss://a")
+
+    api.down.add("wss://a")
+    api.rpc_request("chain_getHeader", [])
+    assert pool.probed
+    assert sorted(pool.probes) == ["wss://a", "wss://b", "wss://c"]
+
+
+def test_endpoints_without_the_pinned_block_are_skipped(pool):
+    pool.pinned_block = "0x" + "ab" * 32
+    api = pool.instrument(FakeApi("wss://a", down={"wss://a"}, pruned={"wss://b"}))
+
+    assert api.rpc_request("chain_getHeader", [])["result"] == "wss://c"
+    assert "no state for the pinned block" in pool.endpoints[1].error
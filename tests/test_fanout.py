@@ -0,0 +1,27 @@
+import pytest
+
+from chopchop.client import NETWORK_MAP
+from chopchop.fanout import NetworkPlan, diff_plans, resolve_target
+
+OWNER = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+
+
+def test_targets_are_network_names_or_rpc_urls():
+    assert resolve_target("lark1") == ("lark1", list(NETWORK_MAP["lark1"]))
+    assert resolve_target("wss://rpc.example.org:443") == ("rpc.example.org", ["wss://rpc.example.org:443"])
+    with pytest.raises(ValueError, match="neither a known network"):
+        resolve_target("lark3")
+
+
+def test_diff_lists_positions_planned_differently():
+    plans = [
+        NetworkPlan("mainnet", positions={1: (5, OWNER, 10), 2: (5, OWNER, 20), 3: (6, OWNER, 30)}),
+        NetworkPlan("lark1", positions={1: (5, OWNER, 10), 2: (5, OWNER, 21)}),
+        # Failed networks are left out of the comparison
+        NetworkPlan("lark2", error="Connection refused"),
+    ]
+
+    assert diff_plans(plans) == {
+        2: {"mainnet": {"asset_id": 5, "owner": OWNER, "shares": 20}, "lark1": {"asset_id": 5, "owner": OWNER, "shares": 21}},
+        3: {"mainnet": {"asset_id": 6, "owner": OWNER, "shares": 30}, "lark1": None},
+    }
@@ -0,0 +1,68 @@
+import pytest
+
+from chopchop.history import ChangeLog, RangeScanner
+from chopchop.snapshot import POSITIONS
+
+START, END = 100, 110
+
+
+def encoded_position(client, shares) -> str:
+    value_type = client.api.metadata.get_metadata_pallet("Omnipool").get_storage_function("Positions").get_value_type_string()
+    value = {"asset_id": 5, "amount": shares, "shares": shares, "price": (1, 1)}
+    return client.api.runtime_config.create_scale_object(value_type, metadata=client.api.metadata).encode(value).to_hex()
+
+
+@pytest.fixture
+def log(client):
+    """Position 1 exists from the start and changes at block 103; position 2 is opened at 102 and closed at 105."""
+    one, two, one_changed = (encoded_position(client, shares) for shares in (10, 20, 15))
+    keys = [[POSITIONS, [1]], [POSITIONS, [2]]]
+    return ChangeLog((START, "0x01"), (END, "0x02"), keys, {0: one}, [(102, 1, two), (103, 0, one_changed), (105, 1, None)])
+
+
+def test_raw_at_replays_the_changes_up_to_the_block(log):
+    one, (_, _, two), (_, _, one_changed) = log.initial[0], log.changes[0], log.changes[1]
+
+    assert log.raw_at(START) == {0: one}
+    assert log.raw_at(102) == {0: one, 1: two}
+    assert log.raw_at(104) == {0: one_changed, 1: two}
+    assert log.raw_at(END) == {0: one_changed}
+    # Replaying leaves the log itself untouched
+    assert log.initial == {0: one}
+
+
+@pytest.mark.parametrize("block_number", [START - 1, END + 1])
+def test_raw_at_outside_the_range(log, block_number):
+    with pytest.raises(ValueError, match="outside the scanned range"):
+        log.raw_at(block_number)
+
+
+def test_entries_at_decodes_the_state(client, log):
+    entries = log.entries_at(client.api, 104)
+
+    assert {key: value["shares"] for key, value in entries[POSITIONS].items()} == {(1,): 15, (2,): 20}
+
+
+def test_decoded_changes_pair_every_value_with_the_previous_one(client, log):
+    changes = [(number, key, previous and previous["shares"], value and value["shares"])
+               for number, _, key, previous, value in log.decoded_changes(client.api)]
+
+    assert changes == [(102, (2,), None, 20), (103, (1,), 10, 15), (105, (2,), 20, None)]
+
+
+def test_saved_log_loads_back(log, tmp_path):
+    log.save(tmp_path / "log.json.gz")
+
+    loaded = ChangeLog.load(tmp_path / "log.json.gz")
+
+    assert (loaded.start, loaded.end, loaded.keys) == (log.start, log.end, log.keys)
+    assert (loaded.initial, loaded.changes) == (log.initial, log.changes)
+
+
+def test_ranges_across_a_runtime_upgrade_are_refused(client, monkeypatch):
+    versions = {"0x01": 100, "0x02": 101}
+    monkeypatch.setattr(client.api, "get_block_runtime_version", lambda block_hash: {"specVersion": versions[block_hash]})
+    monkeypatch.setattr(client, "resolve_block_hash", lambda number: "0x01" if number == START else "0x02")
+
+    with pytest.raises(ValueError, match="from spec version 100 to 101"):
+        RangeScanner(client).scan(START, END)
@@ -0,0 +1,45 @@
+from chopchop.index import PositionIndex
+from chopchop.pallets.omnipool import Omnipool
+from runtime import BLOCK_HASH, SPEC_VERSION, store
+
+OWNER = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+
+
+class Events:
+    value = []
+
+
+def indexed(client, storage, positions):
+    store(client, storage, "Omnipool", "Positions", {
+        (position_id,): {"asset_id": 5, "amount": 10, "shares": 10, "price": (1, 1)} for position_id in positions
+    })
+    store(client, storage, "Uniques", "Asset", {
+        (Omnipool.NFT_COLLECTION_ID, position_id): {"owner": OWNER, "approved": None, "is_frozen": False, "deposit": 0}
+        for position_id in positions
+    })
+    index = PositionIndex(client)
+    index.load(BLOCK_HASH)
+    return index
+
+
+def test_positions_are_answered_from_memory(client, storage):
+    index = indexed(client, storage, range(3))
+
+    assert (index.block_number, index.spec_version) == (100, SPEC_VERSION)
+    assert [(position_id, owner) for position_id, _, owner in index.positions(5)] == [(0, OWNER), (1, OWNER), (2, OWNER)]
+
+
+def test_a_runtime_upgrade_reloads_every_map(client, storage, monkeypatch):
+    index = indexed(client, storage, range(3))
+    monkeypatch.setattr(index, "query_entry", lambda *args, **kwargs: Events())
+    # A migration adds a position without any event
+    indexed(client, storage, range(4))
+
+    assert index.apply_block(BLOCK_HASH) == 0
+    assert len(index.positions(5)) == 3
+
+    monkeypatch.setattr(client.api, "get_block_runtime_version", lambda block_hash: {"specVersion": SPEC_VERSION + 1})
+    index.apply_block(BLOCK_HASH)
+
+    assert len(index.positions(5)) == 4
+    assert index.spec_version == SPEC_VERSION + 1
@@ -0,0 +1,49 @@
+import io
+
+from chopchop.client import create_call
+from chopchop.output import CallWriter, rebase_preimages, schedule_delay, split_for_preimages, write_batch, write_note_preimage
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.scheduler import Scheduler
+
+
+def removals(client, count):
+    omnipool = Omnipool(client)
+    return [omnipool.remove_liquidity_call(position_id, 10 ** 12) for position_id in range(count)]
+
+
+def test_write_batch_streams_the_force_batch_bytes(client):
+    calls = removals(client, 3)
+    sink = io.BytesIO()
+    writer = CallWriter(sink)
+
+    write_batch(client, calls, writer)
+
+    batch = create_call(client, "Utility", "force_batch", {"calls": calls})
+    assert sink.getvalue() == bytes(batch.data.data)
+    assert writer.length == len(batch.data)
+    assert writer.hash == "0x" + batch.call_hash.hex()
+
+
+def test_write_note_preimage_streams_hex_and_hashes_the_preimage(client):
+    calls = removals(client, 3)
+    sink = io.BytesIO()
+
+    preimage_hash, length = write_note_preimage(client, calls, CallWriter(sink, hex_output=True))
+
+    batch = create_call(client, "Utility", "force_batch", {"calls": calls})
+    note = create_call(client, "Preimage", "note_preimage", {"bytes": "0x" + bytes(batch.data.data).hex()})
+    assert sink.getvalue() == bytes(note.data.data).hex().encode()
+    assert (preimage_hash, length) == ("0x" + batch.call_hash.hex(), len(batch.data))
+
+
+def test_split_preimages_restart_their_delays(client):
+    scheduler = Scheduler(client)
+    calls = [scheduler.create_schedule_after_call(3 + i, call) for i, call in enumerate(removals(client, 6))]
+    limit = len(calls[0].data) * 2 + 16
+
+    groups = rebase_preimages(client, split_for_preimages(client, calls, limit))
+
+    assert [len(group) for group in groups] == [2, 2, 2]
+    assert [[schedule_delay(client, call) for call in group] for group in groups] == [[3, 4]] * 3
+    expected = [scheduler.create_schedule_after_call(3 + i % 2, call) for i, call in enumerate(removals(client, 6))]
+    assert [bytes(call.data.data) for group in groups for call in group] == [bytes(call.data.data) for call in expected]
@@ -0,0 +1,128 @@
+import pytest
+
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.omnipool_lm import OmnipoolLM, OmnipoolWLM
+from chopchop.pallets.uniques import Uniques
+from chopchop.storage import RpcStorage
+from runtime import BLOCK_HASH, store
+
+# //Alice, //Bob and //Charlie
+OWNERS = [
+    "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba",
+    "7Lpe5LRa2Ntx9KGDk77xzoBPYTCAvj7QqaBx4Nz2TFqL3sLw",
+    "7LsJ9WZcMNnamvftGtiHzTdgNasYv2zGGMTHbPH8jf1rMAXA",
+]
+
+
+def nft(owner):
+    return {"owner": owner, "approved": None, "is_frozen": False, "deposit": 0}
+
+
+def deposit(pool, *yield_farm_ids):
+    return {"shares": 10, "amm_pool_id": pool, "yield_farm_entries": [
+        {"global_farm_id": 1, "yield_farm_id": yield_farm_id, "valued_shares": 10} for yield_farm_id in yield_farm_ids
+    ]}
+
+
+@pytest.fixture(params=["client", "engine_client"])
+def any_client(request):
+    return request.getfixturevalue(request.param)
+
+
+def test_query_entries_multi_keeps_request_order(any_client, storage, monkeypatch):
+    # Small chunks, so that the keys are spread over several state_queryStorageAt requests
+    monkeypatch.setattr(RpcStorage, "MULTI_QUERY_CHUNK_SIZE", 3)
+    store(any_client, storage, "Uniques", "Asset", {
+        (Omnipool.NFT_COLLECTION_ID, position_id): nft(OWNERS[position_id % 3]) for position_id in range(0, 20, 2)
+    })
+    requested = [17, 4, 0, 18, 3, 12, 2, 9, 16, 6, 14, 8, 10]
+
+    entries = Uniques(any_client).query_entries_multi(
+        "Uniques", "Asset", [[Omnipool.NFT_COLLECTION_ID, position_id] for position_id in requested]
+    )
+
+    assert [entry.value and entry.value["owner"] for entry in entries] == [
+        OWNERS[position_id % 3] if position_id % 2 == 0 else None for position_id in requested
+    ]
+
+
+def test_query_owners_leaves_out_missing_instances(client, storage):
+    store(client, storage, "Uniques", "Asset", {(Omnipool.NFT_COLLECTION_ID, 5): nft(OWNERS[1])})
+
+    owners = Uniques(client).query_owners(Omnipool.NFT_COLLECTION_ID, [6, 5, 5])
+
+    assert owners == {5: OWNERS[1]}
+
+
+def test_retrieve_positions_takes_the_block_first(client, storage):
+    store(client, storage, "Omnipool", "Positions", {
+        (position_id,): {"asset_id": 5 + position_id % 2, "amount": 10, "shares": 10, "price": (1, 1)} for position_id in range(4)
+    })
+    omnipool = Omnipool(client)
+
+    assert sorted(omnipool.retrieve_positions(BLOCK_HASH)) == [0, 1, 2, 3]
+    assert sorted(omnipool.retrieve_positions(BLOCK_HASH, asset_ids={6})) == [1, 3]
+
+
+def test_raw_positions_parse_like_the_decoded_entries(client, storage, monkeypatch):
+    store(client, storage, "Omnipool", "Positions", {
+        (2 ** 100 + position_id,): {"asset_id": 5 + position_id % 2, "amount": 2 ** 70 + position_id,
+                                    "shares": 2 ** 127 + position_id, "price": (2 ** 90, position_id + 1)}
+        for position_id in range(5)
+    })
+    omnipool = Omnipool(client)
+    positions, table = omnipool.retrieve_positions(BLOCK_HASH), omnipool.position_table({6}, at=BLOCK_HASH)
+
+    monkeypatch.setattr(client.storage, "raw", False)
+
+    assert omnipool.retrieve_positions(BLOCK_HASH) == positions
+    assert sorted(omnipool.position_table({6}, at=BLOCK_HASH)) == sorted(table) == [
+        (2 ** 100 + position_id, 6, 2 ** 127 + position_id) for position_id in (1, 3)
+    ]
+
+
+def test_snapshot_pins_queries_to_the_block(client, storage):
+    store(client, storage, "Uniques", "Asset", {(Omnipool.NFT_COLLECTION_ID, 5): nft(OWNERS[1])})
+    reads = []
+    rpc_request = client.api.rpc_request
+
+    def recorded_rpc_request(method, params, result_handler = None):
+        reads.append((method, params))
+        return rpc_request(method, params, result_handler=result_handler)
+
+    client.api.rpc_request = recorded_rpc_request
+    with client.snapshot(100) as block_hash:
+        owners = Uniques(client).query_owners(Omnipool.NFT_COLLECTION_ID, [5])
+
+    assert block_hash == BLOCK_HASH
+    assert owners == {5: OWNERS[1]}
+    assert [params[-1] for method, params in reads if method == "state_queryStorageAt"] == [BLOCK_HASH]
+    assert client.block_hash is None
+
+
+def test_deposits_are_grouped_by_pool(client, storage):
+    store(client, storage, "OmnipoolWarehouseLM", "Deposit", {
+        (1,): deposit(5, 2), (2,): deposit(6, 3, 4), (3,): deposit(5), (4,): deposit(7, 2),
+    })
+
+    positions = OmnipoolWLM(client).get_deposit_positions_by_pool({5, 6})
+
+    assert {pool: sorted(deposits) for pool, deposits in positions.items()} == {5: [(1, [2]), (3, [])], 6: [(2, [3, 4])]}
+
+
+def test_exit_farm_call_lists_every_yield_farm(client):
+    call = OmnipoolLM(client).create_exit_farm_call(3, [1, 2])
+
+    expected = client.api.compose_call("OmnipoolLiquidityMining", "exit_farms", {"deposit_id": 3, "yield_farm_ids": [1, 2]})
+    assert call.data.data == expected.data.data
+
+
+def test_query_entry_pages_reads_every_entry_once(client, storage):
+    store(client, storage, "OmnipoolWarehouseLM", "Deposit", {
+        (deposit_id,): {"shares": 10, "amm_pool_id": 5, "yield_farm_entries": []} for deposit_id in range(5)
+    })
+
+    pages = list(OmnipoolWLM(client).iter_deposit_positions({5}, page_size=2))
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert sorted(deposit_id for page in pages for _, deposit_id, _ in page) == [0, 1, 2, 3, 4]
@@ -0,0 +1,105 @@
+import threading
+
+import pytest
+
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.utility import Utility
+from chopchop.pipeline import RemovePositionsPipeline
+from chopchop.planner import BatchPlanner, call_shape
+from runtime import BLOCK_HASH, store
+
+# //Alice, //Bob and //Charlie
+OWNERS = [
+    "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba",
+    "7Lpe5LRa2Ntx9KGDk77xzoBPYTCAvj7QqaBx4Nz2TFqL3sLw",
+    "7LsJ9WZcMNnamvftGtiHzTdgNasYv2zGGMTHbPH8jf1rMAXA",
+]
+POSITIONS = 25
+
+
+def position(asset_id, shares):
+    return {"asset_id": asset_id, "amount": shares, "shares": shares, "price": (1, 1)}
+
+
+def nft(owner):
+    return {"owner": owner, "approved": None, "is_frozen": False, "deposit": 0}
+
+
+@pytest.fixture
+def positions(storage, client):
+    # Every third position belongs to another asset
+    store(client, storage, "Omnipool", "Positions", {
+        (position_id,): position(6 if position_id % 3 == 0 else 5, 1000 + position_id) for position_id in range(POSITIONS)
+    })
+    store(client, storage, "Uniques", "Asset", {
+        (Omnipool.NFT_COLLECTION_ID, position_id): nft(OWNERS[position_id % 3]) for position_id in range(POSITIONS)
+    })
+    return {position_id for position_id in range(POSITIONS) if position_id % 3 != 0}
+
+
+def pipeline_for(client):
+    client.block_hash = BLOCK_HASH
+    removal = Omnipool(client).remove_liquidity_call(0, 1)
+    planner = BatchPlanner(client, max_calls=4, weights={
+        call_shape(Utility(client).create_dispatch_as_call(OWNERS[0], removal)): (1, 0)
+    })
+    return RemovePositionsPipeline(client, [5], planner, page_size=4, keep_plan=True)
+
+
+def removals(calls):
+    """(owner, position id, shares) of every dispatch_as(remove_liquidity) in schedule_after(force_batch) calls."""
+    for call in calls:
+        for dispatch in call.value["call_args"]["call"].value["call_args"]["calls"]:
+            dispatch = dispatch.value
+            inner = dispatch["call_args"]["call"].value
+            yield (dispatch["call_args"]["as_origin"]["system"]["Signed"], inner["call_args"]["position_id"],
+                   inner["call_args"]["amount"])
+
+
+@pytest.mark.parametrize("client_name", ["client", "engine_client"])
+def test_pipeline_schedules_every_position_of_the_assets(request, client_name, storage, positions):
+    client = request.getfixturevalue(client_name)
+    pipeline = pipeline_for(client)
+
+    calls = list(pipeline.schedule_calls(check_farms=False))
+
+    assert pipeline.overlap == (client_name == "engine_client")
+    assert sorted(removals(calls)) == sorted(
+        (OWNERS[position_id % 3], position_id, 1000 + position_id) for position_id in positions
+    )
+    assert set(pipeline.planned) == positions
+    assert pipeline.batch_count == len(calls) == -(-len(positions) // 4)
+
+
+def test_overlapped_lookups_leave_api_to_the_calling_thread(engine_client, storage, positions):
+    pipeline = pipeline_for(engine_client)
+    caller = threading.current_thread()
+    rpc_request = engine_client.api.rpc_request
+    threads = set()
+
+    def checked_rpc_request(method, params, result_handler = None):
+        threads.add(threading.current_thread())
+        return rpc_request(method, params, result_handler=result_handler)
+
+    engine_client.api.rpc_request = checked_rpc_request
+
+    calls = 0
+    for _ in pipeline.schedule_calls(check_farms=False):
+        calls += 1
+        # Like a fee estimate at the chain head, which moves the runtime `api` is initialised at
+        engine_client.api.block_hash = None
+    assert calls > 1
+    assert threads == {caller}
+
+
+def test_owner_groups_are_costed_as_dispatch_as_calls(client, storage, positions):
+    # Only the dispatch_as shape is known: costing the bare removal would need a fee estimate
+    pipeline = pipeline_for(client)
+    pipeline.group_size = 3
+    omnipool = Omnipool(client)
+    items = [(OWNERS[0], omnipool.remove_liquidity_call(position_id, 10)) for position_id in range(7)]
+
+    groups = list(pipeline.group_calls(items))
+
+    assert [len(group.value["call_args"]["call"].value["call_args"]["calls"]) for group in groups[:2]] == [3, 3]
+    assert groups[2].value["call_args"]["call"].value["call_function"] == "remove_liquidity"
@@ -0,0 +1,75 @@
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.utility import Utility
+from chopchop.planner import BatchPlanner, CallCost, call_shape
+from runtime import MAX_BLOCK_LENGTH, SCHEDULER_MAX_PROOF_SIZE, SCHEDULER_MAX_REF_TIME
+
+OWNER = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+
+
+def removal_calls(client, count):
+    omnipool, utility = Omnipool(client), Utility(client)
+    return [utility.create_dispatch_as_call(OWNER, omnipool.remove_liquidity_call(position_id, 10 ** 12))
+            for position_id in range(count)]
+
+
+def weights_for(call, ref_time, proof_size = 0):
+    return {call_shape(call): (ref_time, proof_size)}
+
+
+def test_limit_is_a_share_of_the_scheduler_weight_and_block_length(client):
+    planner = BatchPlanner(client, block_share=0.5, weights={})
+
+    # The scheduler's maximum weight is below the block's, so it is the one that applies
+    assert planner.limit == CallCost(SCHEDULER_MAX_REF_TIME // 2, SCHEDULER_MAX_PROOF_SIZE // 2,
+                                     MAX_BLOCK_LENGTH * 3 // 4 // 2 - BatchPlanner.WRAPPER_LENGTH)
+
+
+def test_pack_stays_within_the_weight_limit(client):
+    calls = removal_calls(client, 7)
+    planner = BatchPlanner(client, weights=weights_for(calls[0], SCHEDULER_MAX_REF_TIME // 2 // 3))
+
+    batches = list(planner.pack(calls))
+
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [call for batch in batches for call in batch] == calls
+
+
+def test_pack_stays_within_the_proof_size_limit(client):
+    calls = removal_calls(client, 5)
+    planner = BatchPlanner(client, weights=weights_for(calls[0], 1, SCHEDULER_MAX_PROOF_SIZE // 2 // 2))
+
+    assert [len(batch) for batch in planner.pack(calls)] == [2, 2, 1]
+
+
+def test_pack_stays_within_the_length_limit(client):
+    calls = removal_calls(client, 10)
+    length = len(calls[0].data)
+    planner = BatchPlanner(client, weights=weights_for(calls[0], 1))
+    planner.limit = CallCost(planner.limit.ref_time, planner.limit.proof_size, 4 * length)
+
+    batches = list(planner.pack(calls))
+
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert all(sum(len(call.data) for call in batch) <= planner.limit.length for batch in batches)
+
+
+def test_pack_honours_max_calls(client):
+    calls = removal_calls(client, 5)
+    planner = BatchPlanner(client, max_calls=2, weights=weights_for(calls[0], 1))
+
+    assert [len(batch) for batch in planner.pack(calls)] == [2, 2, 1]
+
+
+def test_pack_yields_an_oversized_call_on_its_own(client):
+    calls = removal_calls(client, 3)
+    planner = BatchPlanner(client, weights=weights_for(calls[0], SCHEDULER_MAX_REF_TIME))
+
+    assert [len(batch) for batch in planner.pack(calls)] == [1, 1, 1]
+
+
+def test_estimate_reuses_the_weight_of_a_call_shape(client):
+    calls = removal_calls(client, 2)
+    planner = BatchPlanner(client, weights=weights_for(calls[0], 123, 45))
+
+    # The second call has other arguments, but the same shape
+    assert planner.estimate(calls[1]) == CallCost(123, 45, len(calls[1].data))
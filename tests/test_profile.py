@@ -0,0 +1,42 @@
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.profile import Profiler
+from chopchop.replay import initialize_replay_client
+from runtime import BLOCK_HASH, store
+
+
+def profiled_client(recording, storage):
+    client = initialize_replay_client(recording, storage)
+    client.profiler = Profiler()
+    client.profiler.instrument(client.api)
+    client.api.init_runtime(block_hash=BLOCK_HASH)
+    return client
+
+
+def test_spans_are_attributed_to_their_stage(recording, storage):
+    client = profiled_client(recording, storage)
+    store(client, storage, "Omnipool", "Positions", {
+        (position_id,): {"asset_id": 5, "amount": 10, "shares": 10, "price": (1, 1)} for position_id in range(3)
+    })
+
+    with client.stage("positions"):
+        Omnipool(client).query_entries("Omnipool", "Positions", at=BLOCK_HASH)
+
+    summary = client.profiler.summary()["positions"]
+    assert summary["storage"]["Omnipool.Positions"]["count"] == 1
+    assert summary["rpc"]["state_queryStorageAt"]["count"] >= 1
+    assert summary["rpc"]["state_getKeysPaged"]["request_bytes"] > 0
+
+
+def test_query_entries_span_covers_every_page(recording, storage):
+    client = profiled_client(recording, storage)
+    store(client, storage, "Omnipool", "Positions", {
+        (position_id,): {"asset_id": 5, "amount": 10, "shares": 10, "price": (1, 1)} for position_id in range(250)
+    })
+
+    Omnipool(client).query_entries("Omnipool", "Positions", at=BLOCK_HASH)
+
+    read, = [span for span in client.profiler.spans if span["category"] == "storage"]
+    pages = [span for span in client.profiler.spans if span["name"] == "state_getKeysPaged"]
+    assert len(pages) > 1
+    assert all(read["start"] <= page["start"] and page["start"] + page["duration"] <= read["start"] + read["duration"]
+               for page in pages)
@@ -0,0 +1,79 @@
+import pytest
+
+from chopchop.pallets.omnipool import AssetState, Position
+from chopchop.quote import Fees, OmnipoolQuoter
+
+UNIT = 10 ** 12
+# Asset 5 is worth 2 LRNA, asset 6 is worth 1 LRNA
+ASSET_IN, ASSET_OUT = 5, 6
+
+
+@pytest.fixture
+def states():
+    return [
+        AssetState(10 * UNIT, 20 * UNIT, 10 * UNIT, 0, 10 ** 6, 15, ASSET_IN),
+        AssetState(5 * UNIT, 5 * UNIT, 20 * UNIT, 0, 10 ** 6, 15, ASSET_OUT),
+    ]
+
+
+def test_sell(states):
+    quote = OmnipoolQuoter(states).sell(ASSET_IN, ASSET_OUT, 4 * UNIT)
+
+    # 4 * 20 / 14 LRNA leave asset 5, and 5 * hub_in / (5 + hub_in) of asset 6 come out, rounded down
+    assert (quote.hub_in, quote.hub_out, quote.amount_out) == (5714285714285, 5714285714285, 2666666666666)
+    assert (quote.asset_fee, quote.protocol_fee) == (0, 0)
+
+
+def test_sell_with_fees(states):
+    quote = OmnipoolQuoter(states, Fees(asset_fee=2500, protocol_fee=500)).sell(ASSET_IN, ASSET_OUT, 4 * UNIT)
+
+    assert (quote.hub_in, quote.hub_out, quote.protocol_fee) == (5714285714285, 5711428571427, 2857142858)
+    assert (quote.amount_out, quote.asset_fee) == (2659379167777, 6665110696)
+
+
+def test_buy(states):
+    quote = OmnipoolQuoter(states).buy(ASSET_IN, ASSET_OUT, UNIT)
+
+    # Rounded up both ways, against the buyer
+    assert (quote.hub_out, quote.hub_in, quote.amount_in) == (1250000000001, 1250000000001, 666666666668)
+
+
+def test_buy_more_than_the_pool_holds(states):
+    with pytest.raises(ValueError, match="pool holds"):
+        OmnipoolQuoter(states).buy(ASSET_IN, ASSET_OUT, 5 * UNIT)
+
+
+def test_add_liquidity(states):
+    quote = OmnipoolQuoter(states).add_liquidity(ASSET_IN, 2 * UNIT)
+
+    assert (quote.shares, quote.hub_reserve_delta, quote.price) == (2 * UNIT, 4 * UNIT, (20 * UNIT, 10 * UNIT))
+
+
+@pytest.mark.parametrize("price, amount, shares, hub_reserve_delta, hub_amount, protocol_shares", [
+    # Entered at the current price: the shares' share of the pool
+    ((2, 1), 3 * UNIT, 3 * UNIT, -6 * UNIT, 0, 0),
+    # The price rose since: (2 - 1) / (2 + 1) of the LRNA removed is paid out
+    ((1, 1), 3 * UNIT, 3 * UNIT, -6 * UNIT, 1999999999999, 0),
+    # The price fell since: (3 - 2) / (3 + 2) of the shares go to the protocol
+    ((3, 1), 2400000000000, 2400000000000, -4800000000000, 0, 600000000000),
+])
+def test_remove_liquidity(states, price, amount, shares, hub_reserve_delta, hub_amount, protocol_shares):
+    quote = OmnipoolQuoter(states).remove_liquidity(Position(ASSET_IN, 3 * UNIT, 3 * UNIT, price))
+
+    assert (quote.amount, quote.shares, quote.hub_reserve_delta) == (amount, shares, hub_reserve_delta)
+    assert (quote.hub_amount, quote.protocol_shares, quote.fee) == (hub_amount, protocol_shares, 0)
+
+
+def test_remove_liquidity_with_withdrawal_fee(states):
+    quote = OmnipoolQuoter(states, Fees(withdrawal_fee=10_000)).remove_liquidity(Position(ASSET_IN, 3 * UNIT, 3 * UNIT, (2, 1)))
+
+    assert (quote.amount, quote.fee) == (2970000000000, 30000000000)
+
+
+def test_apply_moves_the_state_along_a_sell(states):
+    quoter = OmnipoolQuoter(states)
+
+    quoter.apply(quoter.sell(ASSET_IN, ASSET_OUT, 4 * UNIT))
+
+    assert (quoter.states[ASSET_IN].reserve, quoter.states[ASSET_IN].hub_reserve) == (14 * UNIT, 20 * UNIT - 5714285714285)
+    assert (quoter.states[ASSET_OUT].reserve, quoter.states[ASSET_OUT].hub_reserve) == (5 * UNIT - 2666666666666, 5 * UNIT + 5714285714285)
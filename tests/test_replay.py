@@ -0,0 +1,54 @@
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.omnipool_lm import OmnipoolLM
+from chopchop.pallets.uniques import Uniques
+from chopchop.replay import Recorder, Recording, initialize_replay_client, scale_entries
+from chopchop.snapshot import DEPOSITS, NFTS, OMNI_POSITION_IDS, POSITIONS
+from runtime import BLOCK_HASH, store
+
+OWNER = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+
+
+def nft(owner):
+    return {"owner": owner, "approved": None, "is_frozen": False, "deposit": 0}
+
+
+def test_a_saved_recording_replays_the_reads_of_the_run(client, recording, storage, tmp_path):
+    store(client, storage, "Uniques", "Asset", {(Omnipool.NFT_COLLECTION_ID, 5): nft(OWNER)})
+    # A run against the synthetic runtime stands in for a run against a node
+    node = initialize_replay_client(recording, storage)
+    recorder = Recorder()
+    recorder.attach(node)
+    recorder.recording.block_hash = BLOCK_HASH
+    node.api.init_runtime(block_hash=BLOCK_HASH)
+    owners = Uniques(node).query_owners(Omnipool.NFT_COLLECTION_ID, [5, 6], at=BLOCK_HASH)
+    node.close()
+
+    recorder.recording.save(tmp_path / "recording.json.gz")
+    loaded = Recording.load(tmp_path / "recording.json.gz")
+    # Storage is served from the values the run read
+    replayed = initialize_replay_client(loaded)
+    replayed.api.init_runtime(block_hash=BLOCK_HASH)
+
+    assert loaded.block_hash == BLOCK_HASH
+    assert Uniques(replayed).query_owners(Omnipool.NFT_COLLECTION_ID, [5, 6], at=BLOCK_HASH) == owners == {5: OWNER}
+    replayed.close()
+
+
+def test_scaled_entries_clone_positions_with_their_nfts_and_deposits():
+    entries = {
+        POSITIONS: {(1,): {"asset_id": 5, "shares": 10}, (2,): {"asset_id": 6, "shares": 20}},
+        NFTS: {(Omnipool.NFT_COLLECTION_ID, 1): nft(OWNER), (Omnipool.NFT_COLLECTION_ID, 2): nft(OWNER),
+               (OmnipoolLM.NFT_COLLECTION_ID, 7): nft(OWNER)},
+        DEPOSITS: {(7,): {"amm_pool_id": 6}},
+        OMNI_POSITION_IDS: {(7,): 2},
+    }
+
+    scaled = scale_entries(entries, 5)
+
+    assert sorted(scaled[POSITIONS]) == [(1,), (2,), (3,), (4,), (5,)]
+    assert [scaled[POSITIONS][(position_id,)]["asset_id"] for position_id in range(1, 6)] == [5, 6, 5, 6, 5]
+    assert all((Omnipool.NFT_COLLECTION_ID, position_id) in scaled[NFTS] for position_id in range(1, 6))
+    # Only the clone of the farmed position gets a deposit of its own
+    assert scaled[OMNI_POSITION_IDS] == {(7,): 2, (8,): 4}
+    assert (OmnipoolLM.NFT_COLLECTION_ID, 8) in scaled[NFTS]
+    assert entries[POSITIONS].keys() == {(1,), (2,)}
@@ -0,0 +1,31 @@
+import json
+
+from substrateinterface import Keypair
+
+from chopchop.planner import BatchPlanner
+from chopchop.seed import SeedCompiler, SeedSpec, expand_accounts
+
+SUDO = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+
+
+def test_counted_accounts_expand_to_derived_dev_accounts():
+    assert expand_accounts("//lp", None) == ["//lp"]
+    assert expand_accounts("//lp", 3) == ["//lp/0", "//lp/1", "//lp/2"]
+
+
+def test_spec_compiles_to_sudo_batches_in_dependency_order(client, monkeypatch, tmp_path):
+    (tmp_path / "spec.json").write_text(json.dumps({
+        "assets": [{"symbol": "DOT", "name": "Polkadot", "initial_price": 5.0, "decimals": 10, "asset_id": 5}],
+        "positions": [{"account": "//lp", "count": 3, "asset_id": 5, "amount": 10 ** 12, "positions": 2}],
+    }))
+    monkeypatch.setattr(client.api, "get_payment_info", lambda call, keypair: {"weight": {"ref_time": 1, "proof_size": 0}})
+    compiler = SeedCompiler(client, BatchPlanner(client, max_calls=4), SUDO)
+
+    batches = list(compiler.batches(SeedSpec.load(tmp_path / "spec.json")))
+
+    assert compiler.counts == {"balances": 0, "init": 0, "assets": 1, "positions": 6}
+    assert [batch.value["call_function"] for batch in batches] == ["sudo", "sudo"]
+    calls = [call.value for batch in batches for call in batch.value["call_args"]["call"].value["call_args"]["calls"]]
+    assert [call["call_function"] for call in calls] == ["add_token"] + ["dispatch_as"] * 6
+    owners = [call["call_args"]["as_origin"]["system"]["Signed"] for call in calls[1:]]
+    assert owners == [Keypair.create_from_uri(f"//lp/{i}", ss58_format=63).ss58_address for i in (0, 0, 1, 1, 2, 2)]
@@ -0,0 +1,47 @@
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.pallets.omnipool_lm import OmnipoolLM
+from chopchop.pipeline import RemovePositionsPipeline
+from chopchop.planner import BatchPlanner
+from chopchop.snapshot import StateSnapshot, initialize_snapshot_client
+from runtime import BLOCK_HASH, store
+
+OWNER = "7NPoMQbiA6trJKkjB35uk96MeJD4PGWkLQLH7k7hXEkZpiba"
+DEPOSIT_ID = 100
+
+
+def nft(owner):
+    return {"owner": owner, "approved": None, "is_frozen": False, "deposit": 0}
+
+
+def schedule(client, weights) -> list:
+    client.block_hash = BLOCK_HASH
+    pipeline = RemovePositionsPipeline(client, [5], BatchPlanner(client, max_calls=4, weights=weights), page_size=4)
+    return [call.data.to_hex() for call in pipeline.schedule_calls()]
+
+
+def test_a_saved_snapshot_plans_the_same_calls_offline(client, storage, monkeypatch, tmp_path):
+    store(client, storage, "Omnipool", "Positions", {
+        (position_id,): {"asset_id": 5 + position_id % 2, "amount": 10, "shares": 10, "price": (1, 1)} for position_id in range(9)
+    })
+    store(client, storage, "OmnipoolWarehouseLM", "Deposit", {
+        (DEPOSIT_ID,): {"shares": 10, "amm_pool_id": 5,
+                        "yield_farm_entries": [{"global_farm_id": 1, "yield_farm_id": 2, "valued_shares": 10}]},
+    })
+    store(client, storage, "OmnipoolLiquidityMining", "OmniPositionId", {(DEPOSIT_ID,): 2})
+    store(client, storage, "Uniques", "Asset", {
+        (OmnipoolLM.NFT_COLLECTION_ID, DEPOSIT_ID): nft(OWNER),
+        **{(Omnipool.NFT_COLLECTION_ID, position_id): nft(OWNER) for position_id in range(9) if position_id != 2},
+    })
+    monkeypatch.setattr(client.api, "get_payment_info", lambda call, keypair: {"weight": {"ref_time": 1, "proof_size": 0}})
+
+    StateSnapshot.capture(client, BLOCK_HASH).save(tmp_path / "snapshot.json.gz")
+    snapshot = StateSnapshot.load(tmp_path / "snapshot.json.gz")
+
+    assert (snapshot.block_hash, snapshot.block_number) == (BLOCK_HASH, 100)
+    assert len(snapshot.entries["Omnipool.Positions"]) == 9
+    # One weight for the removals, and one for the exit_farms calls of single-farm deposits
+    assert len(snapshot.weights) == 2
+    calls = schedule(client, snapshot.weights)
+    # One batch exiting the farm, then the five removals of asset 5 in batches of four
+    assert len(calls) == 3
+    assert schedule(initialize_snapshot_client(snapshot), snapshot.weights) == calls
@@ -0,0 +1,88 @@
+import pytest
+from substrateinterface import Keypair, SubstrateInterface
+from substrateinterface.exceptions import SubstrateRequestException
+from websocket import WebSocketConnectionClosedException
+
+from chopchop.client import submit_extrinsic
+from chopchop.pallets.omnipool import Omnipool
+from chopchop.submit import Submitter
+
+
+def submitter_for(client, monkeypatch, next_nonces, era_period = 64):
+    """Submitter that records what it sends instead of tracking blocks; the node reports `next_nonces` in turn."""
+    submitter = Submitter(client, era_period=era_period)
+    monkeypatch.setattr(submitter, "_start", lambda: None)
+    nonces = iter(next_nonces)
+    monkeypatch.setattr(client.api, "get_account_nonce", lambda address: next(nonces))
+    return submitter
+
+
+def test_era_expiry_follows_the_encoded_era(client, monkeypatch):
+    # The period is rounded up to 128 and the era is born at the finalized block, 100
+    submitter = submitter_for(client, monkeypatch, [0], era_period=100)
+    alice = Keypair.create_from_uri("//Alice", ss58_format=63)
+    monkeypatch.setattr(submitter, "_send", lambda api, data: None)
+
+    submission = submitter.submit(Omnipool(client).remove_liquidity_call(1, 10), alice)
+
+    assert (submission.era_start, submission.era_death) == (100, 228)
+
+
+def test_calls_after_a_failed_send_are_re_signed(client, monkeypatch):
+    submitter = submitter_for(client, monkeypatch, [7, 8])
+    alice = Keypair.create_from_uri("//Alice", ss58_format=63)
+    sent = []
+
+    def send(api, data):
+        sent.append(data)
+        return "Invalid Transaction" if len(sent) == 2 else None
+
+    monkeypatch.setattr(submitter, "_send", send)
+    omnipool = Omnipool(client)
+
+    submissions = submitter.submit_many([omnipool.remove_liquidity_call(i, 10) for i in range(4)], alice)
+
+    assert [submission.nonce for submission in submissions] == [7, 8, 8, 9]
+    assert [submission.status for submission in submissions] == ["submitted", "failed", "submitted", "submitted"]
+    assert submissions[1].error == "Invalid Transaction"
+    # Nothing was sent with a nonce past the gap the failed extrinsic left
+    assert len(sent) == 4
+    assert set(submitter._pending) == {submissions[i].extrinsic_hash for i in (0, 2, 3)}
+
+
+def test_a_send_retried_after_a_transport_error_resumes_where_it_stopped(engine_client, monkeypatch):
+    submitter = submitter_for(engine_client, monkeypatch, [0])
+    alice = Keypair.create_from_uri("//Alice", ss58_format=63)
+    received = []
+    lost = []
+    rpc_request = SubstrateInterface.rpc_request
+
+    def node(api, method, params, result_handler = None):
+        if method != "author_submitExtrinsic":
+            return rpc_request(api, method, params, result_handler=result_handler)
+        if params[0] in received:
+            raise SubstrateRequestException({"code": 1010, "message": "Invalid Transaction", "data": "Transaction is outdated"})
+        received.append(params[0])
+        if len(received) == 2 and not lost:
+            # The node took the extrinsic, but the connection dropped before it answered
+            lost.append(params[0])
+            raise WebSocketConnectionClosedException("Connection to remote host was lost.")
+        return {"result": "0x00"}
+
+    monkeypatch.setattr(SubstrateInterface, "rpc_request", node)
+    monkeypatch.setattr(engine_client.engine, "backoff", 0)
+    omnipool = Omnipool(engine_client)
+
+    submissions = submitter.submit_many([omnipool.remove_liquidity_call(i, 10) for i in range(3)], alice)
+
+    assert [submission.status for submission in submissions] == ["submitted"] * 3
+    assert len(received) == 3
+
+
+def test_submit_extrinsic_gives_up_after_its_timeout(client, monkeypatch):
+    client.submitter = submitter_for(client, monkeypatch, [0])
+    monkeypatch.setattr(client.submitter, "_send", lambda api, data: None)
+    alice = Keypair.create_from_uri("//Alice", ss58_format=63)
+
+    with pytest.raises(SubstrateRequestException, match="not included after 0s"):
+        submit_extrinsic(client, alice, Omnipool(client).remove_liquidity_call(1, 10), timeout=0)